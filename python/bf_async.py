@@ -0,0 +1,827 @@
+"""
+asyncio client of blackfynn web api, with the same methods of bf_rest as coroutines
+"""
+
+# import libraries
+import asyncio
+import os
+import time
+from bf_rest import bf_rest, bf_auth_error, retryDelay
+from bf_metrics import bf_metrics
+from bf_chunks import bf_chunk_source
+from bf_scheduler import bf_scheduler
+
+try:
+    import aiohttp
+except ImportError:
+    # optional dependency, required only by bf_async
+    aiohttp = None
+#end try
+
+
+class bf_async:
+
+    def __init__(self,api_key,api_secret,poolSize=100,poolSizePerHost=0,keepAlive=True,apiUrl='https://api.blackfynn.io'):
+        """
+        When instantiated, this class saves the api key and secret, like bf_rest.
+        All the requests, to the api and to the signed storage urls, share one aiohttp connection pool,
+        which is opened by initSession or when entering the client as async context manager.
+        Every method is a coroutine and can be cancelled at any await:
+        pending chunk uploads are cancelled with it and partially downloaded files are removed.
+        Chunks and downloaded blocks are granted by the scheduler, as in bf_rest
+
+        :param api_key: blackfynn api key
+        :param api_secret: blackfynn api secret
+        :param poolSize: maximum number of connections open at the same time. Default: 100
+        :param poolSizePerHost: maximum number of connections open to the same host, 0 for no limit. Default: 0
+        :param keepAlive: reuse connections across requests. Default: True
+        :param apiUrl: base url of blackfynn web api, e.g. to use a local mock server. Default: https://api.blackfynn.io
+        """
+        if aiohttp is None:
+            raise ImportError('bf_async requires aiohttp, install it with: pip install aiohttp')
+        #end if
+
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.sessionToken = ""
+        self.tokenExpires = 0
+        self.sessionValid = False
+        self.expirationMargin = 0.75
+        self.organization = ''
+        # latency, throughput and error metrics of every operation
+        self.metrics = bf_metrics()
+        self.urls = bf_rest.apiUrls(apiUrl)
+        self.pageSize = 1000
+        # number of chunks of the same file uploaded concurrently
+        self.uploadWorkers = 4
+        # block size used when streaming downloads to disk
+        self.downloadBlockSize = 1048576
+        # bandwidth limits and priorities of the transfers, as in bf_rest.
+        # It can be replaced with the scheduler of a bf_rest instance to share the same limits
+        self.scheduler = bf_scheduler()
+        #
+        # pooled http session, created inside the event loop.
+        # Authentication is added to api requests only, signed urls must not carry it
+        self.poolSize = poolSize
+        self.poolSizePerHost = poolSizePerHost
+        self.keepAlive = keepAlive
+        self.session = None
+        # lock used to renew the session token one task at a time,
+        # and task renewing the session token ahead of its expiration
+        self.renewLock = asyncio.Lock()
+        self.renewTask = None
+        # seconds to wait before trying again a failed renewal
+        self.renewRetryDelay = 30
+        #
+        # retry policy, the same of bf_rest
+        self.maxRetries = 5
+        self.backoffBase = 0.5
+        self.backoffMax = 60.0
+        self.throttleStatuses = {429,503}
+        self.retryStatuses = {429,500,502,503,504}
+        self.idempotentOperations = {'upload_chunk'}
+    #end __init__
+
+
+    async def __aenter__(self):
+        try:
+            await self.initSession()
+        except BaseException:
+            await self.close()
+            raise
+        #end try
+        return self
+    #end __aenter__
+
+
+    async def __aexit__(self,excType,excValue,traceback):
+        await self.close()
+    #end __aexit__
+
+
+    def _openSession(self):
+        """
+        create the pooled aiohttp session, if it has not been created yet
+
+        :return: aiohttp.ClientSession object
+        """
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit = self.poolSize,
+                limit_per_host = self.poolSizePerHost,
+                force_close = not self.keepAlive
+            )
+            self.session = aiohttp.ClientSession(connector=connector)
+        #end if
+        return self.session
+    #end _openSession
+
+
+    async def close(self):
+        """
+        stop renewing the session token and close the http session, releasing all the pooled connections
+
+        :return: None
+        """
+        if self.renewTask is not None:
+            self.renewTask.cancel()
+            self.renewTask = None
+        #end if
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        #end if
+    #end close
+
+
+    @staticmethod
+    def _params(params):
+        """
+        convert the query parameters to values accepted by aiohttp, which rejects booleans
+
+        :param params: dictionary of parameters
+        :return: dictionary of parameters
+        """
+        return {
+            key : str(value).lower() if isinstance(value,bool) else value
+            for key, value
+            in params.items()
+        }
+    #end _params
+
+
+    async def _send(self,operation,method,url,authenticated=True,stream=False,**kwargs):
+        """
+        place a request, retrying it with backoff when it is throttled or fails transiently,
+        with the same policy of bf_rest._send.
+        A request rejected with 401 by the api renews the session token and is retried once.
+        The request is recorded in the metrics under the operation name
+
+        :param operation: name of the logical operation
+        :param method: http method
+        :param url: request url
+        :param authenticated: add the session token to the request, False for signed urls. Default: True
+        :param stream: return the response without reading its body, which must be released by the caller.
+                       It is recorded in the metrics when released. Default: False
+        :param kwargs: any other argument accepted by aiohttp
+        :return: aiohttp.ClientResponse object
+        """
+        session = self._openSession()
+        params = self._params(kwargs.pop('params',{}))
+        headers = dict(kwargs.pop('headers',{}))
+        data = kwargs.get('data')
+        retries = 0
+        renewed = False
+        idempotent = method in ('GET','HEAD','PUT','DELETE') or operation in self.idempotentOperations
+        started = time.perf_counter()
+        while True:
+            response = None
+            body = b''
+            token = self.sessionToken
+            if authenticated and token:
+                headers['Authorization'] = 'Bearer ' + token
+                params['api_key'] = token
+            #end if
+            try:
+                response = await session.request(method,url,params=params,headers=headers,**kwargs)
+                if not stream:
+                    body = await response.read()
+                #end if
+            except (aiohttp.ClientConnectionError,asyncio.TimeoutError):
+                if response is not None:
+                    response.release()
+                    response = None
+                #end if
+                if not idempotent or retries >= self.maxRetries:
+                    self.metrics.record(operation,None,time.perf_counter() - started,retries=retries)
+                    raise
+                #end if
+            except BaseException:
+                # including cancellation
+                if response is not None:
+                    response.release()
+                #end if
+                self.metrics.record(operation,None,time.perf_counter() - started,retries=retries)
+                raise
+            #end try
+
+            if response is not None:
+                if authenticated and response.status == 401 \
+                        and url != self.urls['init_session'] and token and not renewed:
+                    # the token expired or was revoked before being renewed.
+                    # Renew it, unless another task already did, and try once more
+                    response.release()
+                    await self._renewExpiredToken(token)
+                    renewed = True
+                    retries += 1
+                    continue
+                #end if
+
+                throttled = response.status in self.throttleStatuses
+                retryable = throttled or (idempotent and response.status in self.retryStatuses)
+                if not retryable or retries >= self.maxRetries:
+                    break
+                #end if
+                response.release()
+            #end if
+
+            # wait and try again
+            await asyncio.sleep(retryDelay(response,retries,self.backoffBase,self.backoffMax))
+            retries += 1
+        #end while
+
+        bytesUp = len(data) if isinstance(data,(bytes,bytearray,memoryview)) else 0
+        if stream:
+            self._recordOnRelease(response,operation,started,bytesUp,retries)
+        else:
+            self.metrics.record(operation,response.status,time.perf_counter() - started,bytesUp,len(body),retries)
+        #end if
+        return response
+    #end _send
+
+
+    def _recordOnRelease(self,response,operation,started,bytesUp,retries):
+        """
+        record a streamed response in the metrics once it is released,
+        with the time elapsed until then and the bytes received for its body
+
+        :param response: aiohttp.ClientResponse object placed with stream=True
+        :param operation: name of the logical operation
+        :param started: time the request was first placed, from time.perf_counter
+        :param bytesUp: bytes sent
+        :param retries: times the request has been retried
+        :return: None
+        """
+        release = response.release
+        recorded = []
+
+        def releaseAndRecord():
+            if not recorded:
+                recorded.append(True)
+                self.metrics.record(
+                    operation,
+                    response.status,
+                    time.perf_counter() - started,
+                    bytesUp,
+                    response.content.total_bytes,
+                    retries)
+            #end if
+            return release()
+        #end releaseAndRecord
+
+        response.release = releaseAndRecord
+    #end _recordOnRelease
+
+
+    async def initSession(self):
+        """
+        initiate the session with blackfynn web api using api key and secret
+        provided when the class was instantiated, opening the connection pool if needed.
+        The session token is then renewed in the background ahead of its expiration
+
+        :return: dictionary returned by blackfynn
+        """
+        return await self._renewSession()
+    #end initSession
+
+
+    async def _renewSession(self,token=None):
+        """
+        request a new session token and swap it in place of the current one.
+        A new renewal is scheduled ahead of the token expiration.
+        Credentials rejected, or a response without a session token, raise bf_auth_error as in bf_rest
+
+        :param token: (optional) session token that has been rejected.
+                      If given, the session is renewed only if it is still the current one
+        :return: dictionary returned by blackfynn, None if the token had already been renewed
+        """
+        async with self.renewLock:
+            # checked holding the lock, so the tasks rejected with the same token renew it only once
+            if token is not None and self.sessionToken != token:
+                return None
+            #end if
+            try:
+                response = await self._send(
+                    'init_session',
+                    'POST',
+                    self.urls['init_session'],
+                    authenticated = False,
+                    json = {
+                        'tokenId' : self.api_key,
+                        'secret' : self.api_secret,
+                    }
+                )
+                if response.status in (401,403):
+                    raise bf_auth_error('Authentication rejected with status {}'.format(response.status))
+                #end if
+                response.raise_for_status()
+                try:
+                    jsonResponse = await response.json(content_type=None)
+                    jsonResponse['session_token']
+                except (ValueError,KeyError,TypeError):
+                    raise bf_auth_error('No session token in the response of blackfynn')
+                #end try
+                self.sessionToken = jsonResponse['session_token']
+                self.organization = jsonResponse['organization']
+                self.tokenExpires = jsonResponse['expires_in'] * self.expirationMargin
+                self.sessionValid = True
+                delay = self.tokenExpires
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # once a session has been established, try again shortly, the current token might still be valid
+                if self.sessionValid:
+                    self._scheduleRenewal(self.renewRetryDelay)
+                #end if
+                raise
+            #end try
+
+            self._scheduleRenewal(delay)
+        #end async with
+
+        return jsonResponse
+    #end _renewSession
+
+
+    def _scheduleRenewal(self,delay):
+        """
+        schedule the renewal of the session token on the event loop, replacing any renewal already scheduled
+
+        :param delay: seconds before the renewal
+        :return: None
+        """
+        current = asyncio.current_task()
+        if self.renewTask is not None and self.renewTask is not current:
+            self.renewTask.cancel()
+        #end if
+        self.renewTask = asyncio.ensure_future(self._renewSessionLater(delay))
+    #end _scheduleRenewal
+
+
+    async def _renewSessionLater(self,delay):
+        """
+        renew the session token after the delay given.
+        Failures are retried by _renewSession, so they are not raised any further
+
+        :param delay: seconds before the renewal
+        :return: None
+        """
+        await asyncio.sleep(delay)
+        try:
+            await self._renewSession()
+        except Exception:
+            pass
+        #end try
+    #end _renewSessionLater
+
+
+    async def _renewExpiredToken(self,token):
+        """
+        renew the session token after it has been rejected,
+        unless it has been renewed already since it was used
+
+        :param token: session token that has been rejected
+        :return: None
+        """
+        await self._renewSession(token)
+    #end _renewExpiredToken
+
+
+    async def _json(self,operation,method,url,success=200,**kwargs):
+        """
+        place a request with blackfynn web api
+
+        :param operation: name of the logical operation, usually the key of the url in urls
+        :param method: http method
+        :param url: request url
+        :param success: status code of a successful response. Default: 200
+        :param kwargs: any other argument accepted by aiohttp
+        :return: json dictionary if successful, plain response if not
+        """
+        response = await self._send(operation,method,url,**kwargs)
+        if response.status != success:
+            return await response.read()
+        #end if
+        return await response.json(content_type=None)
+    #end _json
+
+
+    async def getDatasets(self):
+        """
+        Returns all the info regarding all the datasets that the user has access to
+
+        :return: dictionary containing the info for all the datasets
+        """
+        return await self._json('get_datasets','GET',self.urls['get_datasets'])
+    #end getDatasets
+
+
+    async def getDataset(self,did):
+        """
+        return all the info regarding the dataset matching the dataset id passed
+
+        :param did: blackfynn id of the dataset required
+        :return: dictionary with all the info regarding the dataset requested
+        """
+        return await self._json('get_dataset','GET',self.urls['get_dataset'].replace('<DID>',did))
+    #end getDataset
+
+
+    async def createCollection(self,name,did,cid=None):
+        """
+        Create a new collection in the dataset specified at root level or in the collection specified as parent
+
+        :param name: collection name
+        :param did: dataset blackfynn id
+        :param cid: parent collection blackfynn id. If left empty, it will create the collection ar the root of the dataset
+        :return: dictionary returned by the command
+        """
+        payload = {
+            "name"        : name,
+            "dataset"     : did,
+            "packageType" : "collection"
+        }
+        if cid is not None:
+            payload['parent'] = cid
+        #end if
+
+        return await self._json('create_package','POST',self.urls['create_package'],success=201,json=payload)
+    #end createCollection
+
+
+    async def _getPackagesPage(self,url,files,cursor=None):
+        """
+        Retrieve one page of packages
+
+        :param url: packages url of the dataset
+        :param files: retrieve source files too
+        :param cursor: cursor returned with the previous page. None for the first page
+        :return: dictionary with the packages and, if there are more pages, the cursor to the next one
+        """
+        params = {
+            'pageSize' : self.pageSize,
+            'includeSourceFiles' : files,
+        }
+        if cursor is not None:
+            params['cursor'] = cursor
+        #end if
+
+        response = await self._send('get_packages','GET',url,params=params)
+        response.raise_for_status()
+        return await response.json(content_type=None)
+    #end _getPackagesPage
+
+
+    async def getPackages(self,did,files=False):
+        """
+        Iterate over all the packages in this dataset as the pages are retrieved, with async for.
+        The next page is requested while the current one is being consumed
+
+        :param did: blackfynn dataset id
+        :param files: retrieve source files too. Default: False
+        :return: async generator of dictionaries, one for each package contained in this dataset
+        """
+        url = self.urls['get_packages'].replace('<DID>',did)
+
+        nextPage = asyncio.ensure_future(self._getPackagesPage(url,files))
+        try:
+            while nextPage is not None:
+                response = await nextPage
+                # place next request for next batch of packages
+                # before handing out the current one
+                nextPage = asyncio.ensure_future(self._getPackagesPage(url,files,response['cursor'])) \
+                    if 'cursor' in response.keys() \
+                    else None
+                for package in response['packages']:
+                    yield package
+                #end for
+            #end while
+        finally:
+            # the iteration has been stopped or cancelled before the last page
+            if nextPage is not None:
+                nextPage.cancel()
+            #end if
+        #end try
+    #end getPackages
+
+
+    async def getPackageSources(self,pid):
+        """
+        Retrieve the source files of a package
+
+        :param pid: blackfynn package id
+        :return: list of dictionaries, one for each source file, if successful, plain response if not
+        """
+        return await self._json('get_package_sources','GET',self.urls['get_package_sources'].replace('<PID>',pid))
+    #end getPackageSources
+
+
+    async def _getFileUrl(self,pid,fid):
+        """
+        Retrieve the signed url to the file content, given the package and file id
+
+        :param pid: blackfynn package id
+        :param fid: blackfynn file id
+        :return: signed url string
+        """
+        url = self.urls['get_file'].replace('<PID>',pid).replace('<FID>',str(fid))
+        response = await self._send('get_file','GET',url)
+        response.raise_for_status()
+        return (await response.json(content_type=None))['url']
+    #end _getFileUrl
+
+
+    async def _acquire(self,transfer,count):
+        """
+        wait until the scheduler grants the bytes given to the transfer.
+        The wait is a coroutine woken by the scheduler, so it neither blocks the event loop nor holds a thread.
+        If the task is cancelled while waiting, only its request is withdrawn
+
+        :param transfer: bf_transfer object
+        :param count: bytes about to be transferred
+        :return: None
+        """
+        await transfer.acquireAsync(count)
+    #end _acquire
+
+
+    async def _readBlocks(self,response,transfer):
+        """
+        iterate over the content of a streamed response in blocks of downloadBlockSize bytes,
+        each granted by the transfer before it is read, as bf_rest._readBlocks
+
+        :param response: aiohttp.ClientResponse object placed with stream=True
+        :param transfer: bf_transfer every block is granted by
+        :return: asynchronous generator of blocks
+        """
+        remaining = None
+        if response.content_length is not None and 'Content-Encoding' not in response.headers:
+            remaining = response.content_length
+        #end if
+        while remaining is None or remaining > 0:
+            count = self.downloadBlockSize if remaining is None else min(self.downloadBlockSize,remaining)
+            await self._acquire(transfer,count)
+            try:
+                block = await response.content.readexactly(count)
+            except asyncio.IncompleteReadError as error:
+                # end of the content
+                block = error.partial
+            #end try
+            if not block:
+                break
+            #end if
+            if remaining is not None:
+                remaining -= len(block)
+            #end if
+            yield block
+        #end while
+    #end _readBlocks
+
+
+    async def getFileContent(self,pid,fid,priority=None):
+        """
+        Retrieve the file content, given the package and file id.
+        The content is read in blocks of downloadBlockSize bytes, each granted by the scheduler
+
+        :param pid: blackfynn package id
+        :param fid: blackfynn file id
+        :param priority: (optional) priority class in the scheduler. Default: bf_scheduler.NORMAL
+        :return: file content
+        """
+        # signed urls are fetched without the api authentication
+        url = await self._getFileUrl(pid,fid)
+        response = await self._send('get_file_content','GET',url,authenticated=False,stream=True)
+        try:
+            with self.scheduler.transfer('download',priority,str(fid)) as transfer:
+                return b''.join([block async for block in self._readBlocks(response,transfer)])
+            #end with
+        finally:
+            response.release()
+        #end try
+    #end getFileContent
+
+
+    async def downloadFile(self,pid,fid,filename,priority=None):
+        """
+        Download file and save it with the file name given.
+        The content is streamed to a temporary ".part" file in blocks of downloadBlockSize bytes, each granted by the scheduler,
+        renamed once complete. If the download fails or is cancelled, the partial file is removed
+        and any file already at the path given is left untouched
+
+        :param pid: blackfynn package id
+        :param fid: blackfynn file id
+        :param filename: local file path
+        :param priority: (optional) priority class in the scheduler. Default: bf_scheduler.NORMAL
+        :return: None
+        """
+        url = await self._getFileUrl(pid,fid)
+        response = await self._send('download_file','GET',url,authenticated=False,stream=True)
+        partFile = filename + '.part'
+        try:
+            response.raise_for_status()
+            with self.scheduler.transfer('download',priority,filename) as transfer, open(partFile,'wb') as fh:
+                try:
+                    async for block in self._readBlocks(response,transfer):
+                        fh.write(block)
+                    #end for
+                except BaseException:
+                    # only the file opened here is removed
+                    fh.close()
+                    os.remove(partFile)
+                    raise
+                #end try
+            #end with
+        finally:
+            response.release()
+        #end try
+        os.replace(partFile,filename)
+    #end downloadFile
+
+
+    async def _uploadPreview(self,oid,did,cid,files):
+        """
+        create an upload preview for the files listed, as bf_rest._uploadPreview
+
+        :param oid: blackfynn id of the organization
+        :param did: blackfynn id of the dataset where the files should be saved
+        :param cid: blackfynn id of the collection where the files should be saved, or None
+        :param files: list of (file name on blackfynn, size in bytes)
+        :return: aiohttp.ClientResponse object
+        """
+        params = {
+            'append'        : False,
+            'datasetId'     : did,
+        }
+        if cid:
+            params['destinationId'] = cid
+        #end if
+
+        return await self._send(
+            'upload_preview',
+            'POST',
+            self.urls['upload_preview'].replace('<OID>',oid),
+            params = params,
+            headers = {'accept' : 'application/json'},
+            json = {
+                'files': [
+                    {
+                        'uploadId'   : uploadId,
+                        'fileName'   : filename,
+                        'size'       : size,
+                        'processing' : False,
+                    }
+                    for uploadId, (filename, size)
+                    in enumerate(files,1)
+                ]
+            }
+        )
+    #end _uploadPreview
+
+
+    async def _uploadChunk(self,url,filename,multipartId,source,chunk,slots,transfer):
+        """
+        upload a single chunk of a file, sent as a slice of the memory-mapped file.
+        The checksum is computed in the default executor, so the event loop is not blocked,
+        and the chunk is granted by the transfer before it is sent
+
+        :param url: chunk upload url for this import
+        :param filename: file name on blackfynn
+        :param multipartId: multipart upload id returned by the upload preview
+        :param source: bf_chunk_source of the file
+        :param chunk: chunk number
+        :param slots: semaphore bounding the chunks in flight
+        :param transfer: bf_transfer the chunk is granted by
+        :return: aiohttp.ClientResponse object
+        """
+        async with slots:
+            hashing = asyncio.get_running_loop().run_in_executor(None,source.checksum,chunk)
+            try:
+                checksum = await asyncio.shield(hashing)
+            except asyncio.CancelledError:
+                # the map cannot be closed while the checksum is being computed on it
+                await asyncio.wait([hashing])
+                raise
+            #end try
+            content = source.chunk(chunk)
+            try:
+                await self._acquire(transfer,len(content))
+                return await self._send(
+                    'upload_chunk',
+                    'POST',
+                    url,
+                    params={
+                        'filename'       : filename,
+                        'multipartId'    : multipartId,
+                        'chunkNumber'    : chunk,
+                        'chunkSize'      : len(content),
+                        'chunkChecksum'  : checksum,
+                    },
+                    data = content
+                )
+            finally:
+                content.release()
+            #end try
+        #end async with
+    #end _uploadChunk
+
+
+    async def _uploadChunks(self,url,path,filename,multipartId,chunkSize,totalChunks,priority=None):
+        """
+        upload the chunks of a local file concurrently, at most uploadWorkers at a time.
+        As soon as a chunk fails or the upload is cancelled, the other chunks are cancelled
+
+        :param url: chunk upload url for this import
+        :param path: local path to the file being uploaded
+        :param filename: file name on blackfynn
+        :param multipartId: multipart upload id returned by the upload preview
+        :param chunkSize: chunk size returned by the upload preview
+        :param totalChunks: total number of chunks returned by the upload preview
+        :param priority: (optional) priority class of the chunks in the scheduler. Default: bf_scheduler.NORMAL
+        :return: None if all the chunks have been accepted, the first failed response otherwise
+        """
+        slots = asyncio.Semaphore(self.uploadWorkers)
+        source = bf_chunk_source(path,chunkSize,range(totalChunks))
+        transfer = self.scheduler.transfer('upload',priority,filename)
+        tasks = [
+            asyncio.ensure_future(self._uploadChunk(url,filename,multipartId,source,chunk,slots,transfer))
+            for chunk
+            in range(totalChunks)
+        ]
+        try:
+            for task in asyncio.as_completed(tasks):
+                response = await task
+                if response.status != 201:
+                    return response
+                #end if
+            #end for
+        finally:
+            for task in tasks:
+                task.cancel()
+            #end for
+            await asyncio.gather(*tasks,return_exceptions=True)
+            source.close()
+            transfer.close()
+        #end try
+
+        return None
+    #end _uploadChunks
+
+
+    async def uploadFile(self,did,path,filename,cid=None,oid=None,priority=None):
+        """
+        upload the local file to the blackfynn container with the specified name,
+        with the same preview, chunks and complete requests of bf_rest.uploadFile
+
+        :param did: blackfynn id of the dataset where the file should be saved
+        :param path: local path to the file being uploaded
+        :param filename: file name on blackfynn
+        :param cid: blackfynn id of the collection where the file should be saved
+        :param oid: blackfynn id of the organization. If not passed, it will used the organization id saved when session was initialized
+        :param priority: (optional) priority class of the chunks in the scheduler. Default: bf_scheduler.NORMAL
+        :return: dictionary containing the info provided by blackfynn when the upload has been complete, plain response if not
+        """
+        if oid is None:
+            oid = self.organization
+        #end if
+
+        # create an upload preview
+        # if it failed, return content
+        previewResponse = await self._uploadPreview(oid,did,cid,[(filename,os.path.getsize(path))])
+        if previewResponse.status != 201:
+            return await previewResponse.read()
+        #end if
+        preview = await previewResponse.json(content_type=None)
+        preview_file = preview['packages'][0]['files'][0]
+        importId = preview['packages'][0]['importId']
+
+        # upload all the chunks concurrently
+        # if any of them failed, return content
+        url = self.urls['upload_chunk'].replace('<OID>',self.organization).replace('<IID>',importId)
+        failedResponse = await self._uploadChunks(
+            url,
+            path,
+            filename,
+            preview_file['multipartUploadId'],
+            preview_file['chunkedUpload']['chunkSize'],
+            preview_file['chunkedUpload']['totalChunks'],
+            priority)
+        if failedResponse is not None:
+            return await failedResponse.read()
+        #end if
+
+        # complete the upload
+        params = {
+            'datasetId'     : did,
+        }
+        if cid:
+            params['destinationId'] = cid
+        #end if
+        return await self._json(
+            'upload_complete',
+            'POST',
+            self.urls['upload_complete'].replace('<OID>',self.organization).replace('<IID>',importId),
+            params = params
+        )
+    #end uploadFile
+
+#end bf_async
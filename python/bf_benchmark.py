@@ -0,0 +1,203 @@
+"""
+transfer benchmarks of bf_rest against the local mock server
+
+usage:
+    python bf_benchmark.py
+    python bf_benchmark.py --sizes 1 16 64 --concurrency 1 4 8 --latency 0.02 --bandwidth 100
+    python bf_benchmark.py --json results.json
+"""
+
+# import libraries
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from bf_rest import bf_rest
+from bf_mock_server import bf_mock_server
+
+
+def configure(bf,concurrency):
+    """
+    set the concurrency of uploads and downloads
+
+    :param bf: bf_rest instance
+    :param concurrency: number of concurrent transfers
+    :return: None
+    """
+    bf.uploadWorkers = concurrency
+    bf.uploadLimiter.setLimit(concurrency,maximum=concurrency)
+    bf.downloadWorkers = concurrency
+#end configure
+
+
+def measure(bf,operations,function):
+    """
+    run the function and measure its duration and the requests placed for the operations given
+
+    :param bf: bf_rest instance
+    :param operations: names of the operations whose requests are counted
+    :param function: function to be measured
+    :return: (seconds, requests)
+    """
+    bf.metrics.reset()
+    started = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - started
+    snapshot = bf.metrics.snapshot()['operations']
+    requests = sum(snapshot[operation]['requests'] for operation in operations if operation in snapshot)
+    return elapsed, requests
+#end measure
+
+
+def benchmarkTransfers(bf,did,folder,sizes,concurrencies):
+    """
+    benchmark uploadFile and downloadFile for each file size and concurrency level
+
+    :param bf: bf_rest instance
+    :param did: dataset id
+    :param folder: local folder for the test files
+    :param sizes: file sizes in MB
+    :param concurrencies: concurrency levels
+    :return: list of result dictionaries
+    """
+    results = []
+    for size in sizes:
+        path = os.path.join(folder,'upload_{}MB.bin'.format(size))
+        with open(path,'wb') as fh:
+            for _ in range(size):
+                fh.write(os.urandom(1048576))
+            #end for
+        #end with
+        sizeBytes = size * 1048576
+
+        for concurrency in concurrencies:
+            configure(bf,concurrency)
+
+            uploaded = {}
+            def upload():
+                uploaded['result'] = bf.uploadFile(did,path,os.path.basename(path))
+            #end upload
+            elapsed, requests = measure(bf,['upload_preview','upload_chunk','upload_complete'],upload)
+            results.append(result('uploadFile',size,concurrency,sizeBytes,elapsed,requests))
+
+            pid = uploaded['result'][0]['package']['content']['id']
+            fid = bf.getPackageSources(pid)[0]['content']['id']
+            target = os.path.join(folder,'download.bin')
+            # split the download in one range per worker
+            bf.rangeThreshold = 0
+            bf.rangeSize = max(1048576,-(-sizeBytes // concurrency))
+            elapsed, requests = measure(
+                bf,['get_file','download_file','download_range'],
+                lambda: bf.downloadFile(pid,fid,target))
+            results.append(result('downloadFile',size,concurrency,sizeBytes,elapsed,requests))
+            os.remove(target)
+        #end for
+        os.remove(path)
+    #end for
+
+    return results
+#end benchmarkTransfers
+
+
+def benchmarkListing(bf,server,packages,pageSizes):
+    """
+    benchmark getPackages on a dataset with the number of packages given, for each page size
+
+    :param bf: bf_rest instance
+    :param server: bf_mock_server instance
+    :param packages: number of packages in the dataset
+    :param pageSizes: page sizes
+    :return: list of result dictionaries
+    """
+    did = server.createDataset('listing')
+    for index in range(packages):
+        server.createPackage(did,'package_{}'.format(index),'Unsupported')
+    #end for
+
+    results = []
+    for pageSize in pageSizes:
+        bf.pageSize = pageSize
+        elapsed, requests = measure(bf,['get_packages'],lambda: bf.getPackages(did,files=True))
+        results.append(dict(
+            result('getPackages',0,1,0,elapsed,requests),
+            packages = packages,
+            pageSize = pageSize,
+            packagesPerSecond = packages / elapsed))
+    #end for
+
+    return results
+#end benchmarkListing
+
+
+def result(operation,size,concurrency,sizeBytes,elapsed,requests):
+    """
+    build a result dictionary
+
+    :return: dictionary with throughput in MB/s and requests per second
+    """
+    return {
+        'operation'         : operation,
+        'sizeMB'            : size,
+        'concurrency'       : concurrency,
+        'seconds'           : elapsed,
+        'MBPerSecond'       : sizeBytes / 1048576 / elapsed,
+        'requests'          : requests,
+        'requestsPerSecond' : requests / elapsed,
+    }
+#end result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmark bf_rest transfers against the local mock server')
+    parser.add_argument('--sizes',type=int,nargs='+',default=[1,16,64],help='file sizes in MB')
+    parser.add_argument('--concurrency',type=int,nargs='+',default=[1,4,8],help='concurrency levels')
+    parser.add_argument('--packages',type=int,default=5000,help='packages in the listing benchmark')
+    parser.add_argument('--page-sizes',type=int,nargs='+',default=[100,1000],help='page sizes in the listing benchmark')
+    parser.add_argument('--latency',type=float,default=0.0,help='seconds added by the server to every request')
+    parser.add_argument('--bandwidth',type=float,default=0.0,help='MB/s of every request and response body, 0 for unlimited')
+    parser.add_argument('--error-rate',type=float,default=0.0,help='fraction of requests failing with 503')
+    parser.add_argument('--chunk-size',type=int,default=1048576,help='chunk size returned by upload previews')
+    parser.add_argument('--json',help='save the results in this json file')
+    args = parser.parse_args(argv)
+
+    server = bf_mock_server(
+        latency = args.latency,
+        bandwidth = int(args.bandwidth * 1048576),
+        errorRate = args.error_rate,
+        chunkSize = args.chunk_size)
+    folder = tempfile.mkdtemp(prefix='bf_benchmark_')
+    with server:
+        bf = bf_rest('key','secret',poolSize=max(args.concurrency),apiUrl=server.url)
+        bf.initSession
+        did = server.createDataset('benchmark')
+        results = benchmarkTransfers(bf,did,folder,args.sizes,args.concurrency)
+        results += benchmarkListing(bf,server,args.packages,args.page_sizes)
+        bf.close()
+    #end with
+    shutil.rmtree(folder,ignore_errors=True)
+
+    print('{:<14}{:>8}{:>13}{:>10}{:>10}{:>11}{:>10}'.format(
+        'operation','MB','concurrency','seconds','MB/s','requests','req/s'))
+    for item in results:
+        print('{:<14}{:>8}{:>13}{:>10.3f}{:>10.1f}{:>11}{:>10.1f}'.format(
+            item['operation'],item['sizeMB'],item['concurrency'],item['seconds'],
+            item['MBPerSecond'],item['requests'],item['requestsPerSecond']))
+    #end for
+
+    if args.json:
+        with open(args.json,'w') as fh:
+            json.dump(results,fh,indent=2)
+        #end with
+    #end if
+
+    return 0
+#end main
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+#end if
@@ -0,0 +1,408 @@
+"""
+size-bounded on-disk cache of blackfynn file contents, shared by threads and processes
+"""
+
+# import libraries
+import os
+import json
+import hashlib
+import mmap
+import shutil
+import threading
+import uuid
+import contextlib
+
+try:
+    import fcntl
+except ImportError:
+    # no inter-process locking on this platform, only threads are synchronized
+    fcntl = None
+#end try
+
+
+class bf_content_cache:
+
+    def __init__(self,root,maxBytes):
+        """
+        When instantiated, this class uses the folder given as cache, creating it if needed.
+        Each file is saved with its size and sha256 checksum, keyed by package and file id.
+        Files are added atomically, so readers never see partial content, and the least recently used files
+        are evicted when the total size exceeds maxBytes.
+        The total size is kept up to date in an index file under the cache lock, so the folder is only scanned
+        when files have to be evicted
+
+        :param root: cache folder
+        :param maxBytes: maximum total size of the files cached
+        """
+        self.root = root
+        self.maxBytes = maxBytes
+        self.objectsDir = os.path.join(root,'objects')
+        self.tmpDir = os.path.join(root,'tmp')
+        os.makedirs(self.objectsDir,exist_ok=True)
+        os.makedirs(self.tmpDir,exist_ok=True)
+        self.lockFile = os.path.join(root,'lock')
+        self.indexFile = os.path.join(root,'index.json')
+        self.threadLock = threading.Lock()
+    #end __init__
+
+
+    @contextlib.contextmanager
+    def _lock(self):
+        """
+        hold the cache lock, across threads and, where supported, across processes
+
+        :return: context manager
+        """
+        with self.threadLock:
+            with open(self.lockFile,'a') as fh:
+                if fcntl is not None:
+                    fcntl.flock(fh,fcntl.LOCK_EX)
+                #end if
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(fh,fcntl.LOCK_UN)
+                    #end if
+                #end try
+            #end with
+        #end with
+    #end _lock
+
+
+    def _paths(self,pid,fid):
+        """
+        return the paths of the content and of the metadata of a file
+
+        :param pid: blackfynn package id
+        :param fid: blackfynn file id
+        :return: (content path, metadata path)
+        """
+        key = hashlib.sha256('{}/{}'.format(pid,fid).encode()).hexdigest()
+        return os.path.join(self.objectsDir,key + '.data'), os.path.join(self.objectsDir,key + '.json')
+    #end _paths
+
+
+    def _scanTotal(self):
+        """
+        compute the total size of the files cached by listing them. Must be called holding the lock
+
+        :return: total size in bytes
+        """
+        return sum(entry.stat().st_size for entry in os.scandir(self.objectsDir) if entry.name.endswith('.data'))
+    #end _scanTotal
+
+
+    def _readTotal(self):
+        """
+        return the total size of the files cached, from the index file,
+        computed again if missing or unreadable. Must be called holding the lock
+
+        :return: total size in bytes
+        """
+        try:
+            with open(self.indexFile) as fh:
+                return int(json.load(fh)['total'])
+            #end with
+        except (FileNotFoundError,ValueError,KeyError,TypeError):
+            return self._scanTotal()
+        #end try
+    #end _readTotal
+
+
+    def _writeTotal(self,total):
+        """
+        save the total size of the files cached in the index file. Must be called holding the lock
+
+        :param total: total size in bytes
+        :return: None
+        """
+        tmpIndex = self.tempPath()
+        with open(tmpIndex,'w') as fh:
+            json.dump({'total' : total},fh)
+        #end with
+        os.replace(tmpIndex,self.indexFile)
+    #end _writeTotal
+
+
+    @staticmethod
+    def _size(path):
+        """
+        return the size of a file, 0 if it does not exist
+
+        :param path: file path
+        :return: size in bytes
+        """
+        try:
+            return os.path.getsize(path)
+        except FileNotFoundError:
+            return 0
+        #end try
+    #end _size
+
+
+    def tempPath(self):
+        """
+        return a new temporary path inside the cache, on the same file system,
+        where content can be written before being added with insert
+
+        :return: path
+        """
+        return os.path.join(self.tmpDir,str(uuid.uuid4()))
+    #end tempPath
+
+
+    def get(self,pid,fid,size=None,checksum=None,verify=False):
+        """
+        return the path of the cached content of a file, if it is cached and valid.
+        The content size must match the size recorded when it was added, and the size and checksum given, if any.
+        With verify, the checksum of the content is computed again and compared too.
+        A hit marks the file as recently used
+
+        :param pid: blackfynn package id
+        :param fid: blackfynn file id
+        :param size: (optional) expected size
+        :param checksum: (optional) expected sha256 checksum
+        :param verify: compute the checksum of the content again. Default: False
+        :return: path to the content, None if not cached or not valid
+        """
+        dataPath, metaPath = self._paths(pid,fid)
+        try:
+            with open(metaPath) as fh:
+                meta = json.load(fh)
+            #end with
+            actualSize = os.path.getsize(dataPath)
+        except (FileNotFoundError,ValueError):
+            return None
+        #end try
+
+        valid = \
+            actualSize == meta['size'] and \
+            (size is None or size == meta['size']) and \
+            (checksum is None or checksum == meta['sha256']) and \
+            (not verify or self._checksum(dataPath) == meta['sha256'])
+        if not valid:
+            self.remove(pid,fid)
+            return None
+        #end if
+
+        # the modification time tracks the last use, for eviction
+        try:
+            os.utime(dataPath)
+        except FileNotFoundError:
+            return None
+        #end try
+        return dataPath
+    #end get
+
+
+    def _checksum(self,path):
+        """
+        compute the sha256 checksum of a file
+
+        :param path: file path
+        :return: hexadecimal digest
+        """
+        digest = hashlib.sha256()
+        with open(path,'rb') as fh:
+            for block in iter(lambda: fh.read(1048576),b''):
+                digest.update(block)
+            #end for
+        #end with
+        return digest.hexdigest()
+    #end _checksum
+
+
+    def insert(self,pid,fid,path):
+        """
+        move a file into the cache as the content of the blackfynn file given, replacing any previous content.
+        The file should be on the same file system as the cache, e.g. a path returned by tempPath,
+        otherwise it is copied
+
+        :param pid: blackfynn package id
+        :param fid: blackfynn file id
+        :param path: local file with the content
+        :return: path to the cached content
+        """
+        dataPath, metaPath = self._paths(pid,fid)
+        meta = {
+            'pid'    : pid,
+            'fid'    : str(fid),
+            'size'   : os.path.getsize(path),
+            'sha256' : self._checksum(path),
+        }
+        tmpMeta = self.tempPath()
+        with open(tmpMeta,'w') as fh:
+            json.dump(meta,fh)
+        #end with
+
+        with self._lock():
+            total = self._readTotal() - self._size(dataPath) + meta['size']
+            shutil.move(path,dataPath)
+            os.replace(tmpMeta,metaPath)
+            if total > self.maxBytes:
+                removed, total = self._evict()
+            #end if
+            self._writeTotal(total)
+        #end with
+
+        return dataPath
+    #end insert
+
+
+    def store(self,pid,fid,content):
+        """
+        add the content of a blackfynn file to the cache
+
+        :param pid: blackfynn package id
+        :param fid: blackfynn file id
+        :param content: bytes-like content
+        :return: path to the cached content
+        """
+        path = self.tempPath()
+        with open(path,'wb') as fh:
+            fh.write(content)
+        #end with
+        return self.insert(pid,fid,path)
+    #end store
+
+
+    def read(self,pid,fid,size=None,checksum=None):
+        """
+        return the cached content of a file, validated as described in get
+
+        :param pid: blackfynn package id
+        :param fid: blackfynn file id
+        :param size: (optional) expected size
+        :param checksum: (optional) expected sha256 checksum
+        :return: bytes, None if not cached or not valid
+        """
+        path = self.get(pid,fid,size,checksum)
+        if path is None:
+            return None
+        #end if
+        try:
+            with open(path,'rb') as fh:
+                return fh.read()
+            #end with
+        except FileNotFoundError:
+            # evicted in the meantime
+            return None
+        #end try
+    #end read
+
+
+    def map(self,pid,fid,size=None,checksum=None):
+        """
+        return the cached content of a file memory-mapped, without reading it, validated as described in get.
+        The map stays valid even if the file is evicted while it is open
+
+        :param pid: blackfynn package id
+        :param fid: blackfynn file id
+        :param size: (optional) expected size
+        :param checksum: (optional) expected sha256 checksum
+        :return: read-only mmap, None if not cached, not valid or empty
+        """
+        path = self.get(pid,fid,size,checksum)
+        if path is None:
+            return None
+        #end if
+        try:
+            with open(path,'rb') as fh:
+                return mmap.mmap(fh.fileno(),0,access=mmap.ACCESS_READ)
+            #end with
+        except (FileNotFoundError,ValueError):
+            return None
+        #end try
+    #end map
+
+
+    def remove(self,pid,fid):
+        """
+        remove a file from the cache
+
+        :param pid: blackfynn package id
+        :param fid: blackfynn file id
+        :return: None
+        """
+        with self._lock():
+            dataPath, metaPath = self._paths(pid,fid)
+            total = self._readTotal() - self._size(dataPath)
+            for path in (dataPath,metaPath):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                #end try
+            #end for
+            self._writeTotal(max(0,total))
+        #end with
+    #end remove
+
+
+    def evict(self):
+        """
+        remove the least recently used files until the total size is within maxBytes
+
+        :return: number of bytes removed
+        """
+        with self._lock():
+            removed, total = self._evict()
+            self._writeTotal(total)
+        #end with
+
+        return removed
+    #end evict
+
+
+    def _evict(self):
+        """
+        remove the least recently used files until the total size is within maxBytes.
+        The files are listed, to find the least recently used ones. Must be called holding the lock
+
+        :return: (number of bytes removed, total size left)
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.objectsDir):
+            if entry.name.endswith('.data'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime,stat.st_size,entry.path))
+                total += stat.st_size
+            #end if
+        #end for
+
+        removed = 0
+        for mtime, size, path in sorted(entries):
+            if total - removed <= self.maxBytes:
+                break
+            #end if
+            for target in (path,path[:-len('.data')] + '.json'):
+                try:
+                    os.remove(target)
+                except FileNotFoundError:
+                    pass
+                #end try
+            #end for
+            removed += size
+        #end for
+
+        return removed, total - removed
+    #end _evict
+
+
+    def clear(self):
+        """
+        remove all the files from the cache
+
+        :return: None
+        """
+        with self._lock():
+            for entry in os.scandir(self.objectsDir):
+                os.remove(entry.path)
+            #end for
+            self._writeTotal(0)
+        #end with
+    #end clear
+
+#end bf_content_cache
@@ -0,0 +1,292 @@
+"""
+chunk sources used by bf_rest to upload files, buffers and streams without copying them
+"""
+
+# import libraries
+import mmap
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def bytesView(buffer):
+    """
+    return a flat view of the bytes of a bytes-like object, without copying it.
+    Buffers of other item types or shapes, e.g. numpy arrays, are cast to bytes
+
+    :param buffer: bytes-like object
+    :return: memoryview of unsigned bytes
+    """
+    view = memoryview(buffer)
+    if not view.c_contiguous:
+        view.release()
+        raise ValueError('only contiguous buffers can be uploaded')
+    #end if
+    if view.format == 'B' and view.ndim == 1:
+        return view
+    #end if
+    return view.cast('B')
+#end bytesView
+
+
+class bf_buffer_source:
+
+    def __init__(self,buffer,chunkSize,chunks):
+        """
+        When instantiated, this class hands out the chunks of an in-memory buffer.
+        Chunks are handed out as memoryview slices of the buffer, so their content is never copied,
+        and the checksum of the next chunk is computed in the background while the current one is used
+
+        :param buffer: bytes-like object, e.g. bytes, bytearray, memoryview, mmap or numpy array
+        :param chunkSize: size of each chunk
+        :param chunks: chunk numbers to hand out, in order
+        """
+        self.chunkSize = chunkSize
+        self.chunks = chunks
+        self.view = bytesView(buffer)
+        # checksums are computed one chunk ahead on this thread.
+        # sha256 releases the GIL, so it runs alongside the uploads
+        self.hasher = ThreadPoolExecutor(max_workers=1)
+        #
+        # slices handed out and not released yet, and whether close has been requested
+        self.lock = threading.Lock()
+        self.outstanding = 0
+        self.closing = False
+        self.closed = False
+    #end __init__
+
+
+    def chunk(self,chunk):
+        """
+        return a slice of the map with the content of the chunk
+
+        :param chunk: chunk number
+        :return: memoryview
+        """
+        return self.view[chunk * self.chunkSize:(chunk + 1) * self.chunkSize]
+    #end chunk
+
+
+    def checksum(self,chunk):
+        """
+        compute the sha256 checksum of the chunk
+
+        :param chunk: chunk number
+        :return: hexadecimal digest
+        """
+        with self.chunk(chunk) as view:
+            return hashlib.sha256(view).hexdigest()
+        #end with
+    #end checksum
+
+
+    def __iter__(self):
+        """
+        iterate over the chunks, computing the checksum of each chunk while the previous one is being used.
+        Every slice handed out must be given back with release
+
+        :return: generator of (chunk number, memoryview, sha256 checksum)
+        """
+        chunks = iter(self.chunks)
+        nextChunk = next(chunks,None)
+        nextChecksum = self.hasher.submit(self.checksum,nextChunk) if nextChunk is not None else None
+        while nextChunk is not None:
+            chunk, checksum = nextChunk, nextChecksum
+            # start hashing the following chunk
+            nextChunk = next(chunks,None)
+            if nextChunk is not None:
+                nextChecksum = self.hasher.submit(self.checksum,nextChunk)
+            #end if
+            with self.lock:
+                self.outstanding += 1
+            #end with
+            yield chunk, self.chunk(chunk), checksum.result()
+        #end while
+    #end __iter__
+
+
+    def release(self,view):
+        """
+        give back a slice handed out by the iterator, once it is not used anymore
+
+        :param view: memoryview handed out
+        :return: None
+        """
+        view.release()
+        with self.lock:
+            self.outstanding -= 1
+            closeNow = self.closing and self.outstanding == 0
+        #end with
+        if closeNow:
+            self._close()
+        #end if
+    #end release
+
+
+    def close(self):
+        """
+        close the source as soon as all the slices handed out have been released
+
+        :return: None
+        """
+        with self.lock:
+            self.closing = True
+            closeNow = self.outstanding == 0
+        #end with
+        if closeNow:
+            self._close()
+        #end if
+    #end close
+
+
+    def _close(self):
+        """
+        stop hashing and release the view of the buffer
+
+        :return: bool, False if it had already been closed
+        """
+        with self.lock:
+            if self.closed:
+                return False
+            #end if
+            self.closed = True
+        #end with
+        self.hasher.shutdown(wait=True)
+        self.view.release()
+        return True
+    #end _close
+
+#end bf_buffer_source
+
+
+class bf_chunk_source(bf_buffer_source):
+
+    def __init__(self,path,chunkSize,chunks):
+        """
+        When instantiated, this class memory-maps the file for reading
+        and hands out its chunks as slices of the map, as described in bf_buffer_source
+
+        :param path: local path to the file
+        :param chunkSize: size of each chunk
+        :param chunks: chunk numbers to hand out, in order
+        """
+        self.path = path
+        self.fh = open(path,'rb')
+        try:
+            self.map = mmap.mmap(self.fh.fileno(),0,access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            self.map = None
+        #end try
+        bf_buffer_source.__init__(self,self.map if self.map is not None else b'',chunkSize,chunks)
+    #end __init__
+
+
+    def _close(self):
+        """
+        unmap and close the file
+
+        :return: bool, False if it had already been closed
+        """
+        if not bf_buffer_source._close(self):
+            return False
+        #end if
+        if self.map is not None:
+            self.map.close()
+        #end if
+        self.fh.close()
+        return True
+    #end _close
+
+#end bf_chunk_source
+
+
+class bf_stream_source:
+
+    def __init__(self,stream,chunkSize,size):
+        """
+        When instantiated, this class re-chunks an iterable of bytes-like pieces into chunks of chunkSize.
+        Chunks falling entirely within a piece are handed out as memoryview slices of the piece, without copying it;
+        only chunks spanning two or more pieces are assembled in a new buffer.
+        The pieces are consumed once, in order, so all the chunks are handed out, in order.
+        Checksums are left to the uploads, which compute them on their own threads
+
+        :param stream: iterable of bytes-like objects
+        :param chunkSize: size of each chunk
+        :param size: total bytes the stream is expected to yield
+        """
+        self.stream = stream
+        self.chunkSize = chunkSize
+        self.size = size
+    #end __init__
+
+
+    def __iter__(self):
+        """
+        iterate over the chunks of the stream.
+        Raise ValueError if the stream does not yield exactly size bytes
+
+        :return: generator of (chunk number, memoryview, None)
+        """
+        chunk = 0
+        received = 0
+        # chunk being assembled from more than one piece
+        pending = None
+        for piece in self.stream:
+            view = bytesView(piece)
+            received += view.nbytes
+            if received > self.size:
+                raise ValueError('the stream yielded more than {} bytes'.format(self.size))
+            #end if
+            offset = 0
+            while offset < view.nbytes:
+                if pending is None and view.nbytes - offset >= self.chunkSize:
+                    yield chunk, view[offset:offset + self.chunkSize], None
+                    offset += self.chunkSize
+                else:
+                    if pending is None:
+                        pending = bytearray()
+                    #end if
+                    count = min(self.chunkSize - len(pending),view.nbytes - offset)
+                    pending += view[offset:offset + count]
+                    offset += count
+                    if len(pending) < self.chunkSize:
+                        continue
+                    #end if
+                    yield chunk, memoryview(pending), None
+                    pending = None
+                #end if
+                chunk += 1
+            #end while
+        #end for
+        if received < self.size:
+            raise ValueError('the stream yielded {} bytes instead of {}'.format(received,self.size))
+        #end if
+        # the last chunk, or the only one, empty, of an empty stream
+        if pending is not None or chunk == 0:
+            yield chunk, memoryview(pending if pending is not None else b''), None
+        #end if
+    #end __iter__
+
+
+    def release(self,view):
+        """
+        give back a chunk handed out by the iterator, once it is not used anymore
+
+        :param view: memoryview handed out
+        :return: None
+        """
+        view.release()
+    #end release
+
+
+    def close(self):
+        """
+        nothing to close: the stream belongs to the caller
+
+        :return: None
+        """
+        pass
+    #end close
+
+#end bf_stream_source
@@ -0,0 +1,455 @@
+"""
+command line tool for bulk transfers with blackfynn
+
+usage:
+    python bf_cli.py list
+    python bf_cli.py list <dataset id> --files
+    python bf_cli.py upload <dataset id> file1 file2 ... --collection <collection id> --workers 8 --resume
+    python bf_cli.py download <dataset id> <local folder> --collection <collection id> --bandwidth 50
+    python bf_cli.py sync <dataset id> <local folder> --checksum --priority bulk --replace
+
+The api key and secret are read from --api-key and --api-secret,
+or from the BLACKFYNN_API_KEY and BLACKFYNN_API_SECRET environment variables.
+
+exit status:
+    0   everything has been transferred
+    1   some files failed, the others have been transferred
+    2   invalid arguments
+    3   authentication failed
+    4   the command failed, e.g. the api is unreachable
+    130 interrupted
+"""
+
+# import libraries
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bf_rest import bf_rest, bf_auth_error
+from bf_scheduler import bf_scheduler
+
+# exit status
+EXIT_OK = 0
+EXIT_PARTIAL = 1
+EXIT_USAGE = 2
+EXIT_AUTH = 3
+EXIT_ERROR = 4
+EXIT_INTERRUPTED = 130
+
+# priority classes of the transfers in the scheduler
+PRIORITIES = {
+    'interactive' : bf_scheduler.INTERACTIVE,
+    'normal'      : bf_scheduler.NORMAL,
+    'bulk'        : bf_scheduler.BULK,
+}
+
+
+class bf_progress:
+
+    def __init__(self,bf,total=None,stream=sys.stderr,interval=0.5):
+        """
+        When instantiated, this class starts a thread showing on a single line the bytes transferred,
+        the throughput and, when the total is known, the percentage and the estimated time left.
+        The figures are read from the operations registry of bf_rest
+
+        :param bf: bf_rest instance
+        :param total: (optional) total bytes expected
+        :param stream: where the progress is written. Default: sys.stderr
+        :param interval: seconds between updates. Default: 0.5
+        """
+        self.bf = bf
+        self.total = total
+        self.stream = stream
+        self.interval = interval
+        self.started = time.time()
+        self.initial = bf.operations.summary()['bytes']
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run,daemon=True)
+        self.thread.start()
+    #end __init__
+
+
+    @staticmethod
+    def _size(count):
+        """
+        format a number of bytes
+
+        :param count: bytes
+        :return: string
+        """
+        for unit in ('B','KB','MB','GB'):
+            if count < 1024:
+                return '{:.1f} {}'.format(count,unit)
+            #end if
+            count /= 1024
+        #end for
+        return '{:.1f} TB'.format(count)
+    #end _size
+
+
+    def line(self):
+        """
+        build the progress line
+
+        :return: string
+        """
+        summary = self.bf.operations.summary()
+        done = summary['bytes'] - self.initial
+        rate = summary['bytesPerSecond']
+        line = '{}  {}/s  {} in flight'.format(self._size(done),self._size(rate),summary['inFlight'])
+        if self.total:
+            line += '  {:.0%}'.format(min(1.0,done / self.total))
+            if rate > 0:
+                line += '  ETA {}'.format(time.strftime('%H:%M:%S',time.gmtime(max(0,self.total - done) / rate)))
+            #end if
+        #end if
+        return line
+    #end line
+
+
+    def setTotal(self,total):
+        """
+        set the total bytes expected, once it is known
+
+        :param total: total bytes
+        :return: None
+        """
+        self.total = total
+    #end setTotal
+
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.stream.write('\r\033[K' + self.line())
+            self.stream.flush()
+        #end while
+    #end _run
+
+
+    def stop(self):
+        """
+        stop updating the progress and leave the last line with the elapsed time
+
+        :return: None
+        """
+        self.stopped.set()
+        self.thread.join()
+        self.stream.write('\r\033[K{}  {:.1f} s\n'.format(self.line(),time.time() - self.started))
+        self.stream.flush()
+    #end stop
+
+#end bf_progress
+
+
+def create(args):
+    """
+    create the bf_rest instance configured with the command line options
+
+    :param args: parsed arguments
+    :return: bf_rest instance
+    """
+    # every file transferred at the same time can have chunk_concurrency requests in flight,
+    # so the pools keep that many connections alive instead of discarding the extra ones
+    concurrency = max(10,args.workers * args.chunk_concurrency)
+    bf = bf_rest(args.api_key,args.api_secret,poolSize=concurrency,apiUrl=args.api_url)
+    # files transferred at the same time
+    bf.bulkDownloadWorkers = args.workers
+    bf.syncWorkers = args.workers
+    # chunks and ranges of the same transfer
+    bf.uploadWorkers = args.chunk_concurrency
+    bf.uploadLimiter.setLimit(args.chunk_concurrency,maximum=args.chunk_concurrency)
+    bf.downloadWorkers = args.chunk_concurrency
+    # each direction is capped separately by the scheduler
+    if args.bandwidth > 0:
+        bf.scheduler.setRate('upload',args.bandwidth * 1048576)
+        bf.scheduler.setRate('download',args.bandwidth * 1048576)
+    #end if
+
+    return bf
+#end create
+
+
+def listCommand(bf,args):
+    """
+    list the datasets, or the packages of a dataset with their path
+
+    :return: exit status
+    """
+    if args.dataset is None:
+        items = [
+            {'id' : dataset['content']['id'], 'name' : dataset['content']['name']}
+            for dataset
+            in bf.getDatasets()
+        ]
+    else:
+        packages = list(bf.iterPackages(args.dataset,files=args.files))
+        paths = bf.packagePaths(packages)
+        items = []
+        for package in packages:
+            content = package['content']
+            item = {
+                'id'    : content['id'],
+                'path'  : paths[content['id']],
+                'type'  : content.get('packageType'),
+                'state' : content.get('state'),
+            }
+            if args.files:
+                item['files'] = [
+                    {'id' : source['id'], 'name' : bf.sourceFileName(source), 'size' : source.get('size')}
+                    for source
+                    in bf.packageSourceFiles(package)
+                ]
+            #end if
+            items.append(item)
+        #end for
+        items.sort(key=lambda item: item['path'])
+    #end if
+
+    if args.json:
+        json.dump(items,sys.stdout,indent=2)
+        sys.stdout.write('\n')
+    else:
+        columns = ('id','name') if args.dataset is None else ('id','path','type','state')
+        for item in items:
+            print('\t'.join(str(item[column]) for column in columns))
+            for source in item.get('files',[]):
+                print('\t{}\t{}\t{}'.format(source['id'],source['name'],source['size']))
+            #end for
+        #end for
+    #end if
+    return EXIT_OK
+#end listCommand
+
+
+def uploadCommand(bf,args):
+    """
+    upload local files into a dataset or a collection
+
+    :return: exit status
+    """
+    for path in args.paths:
+        if not os.path.isfile(path):
+            print('{} is not a file, use sync for folders'.format(path),file=sys.stderr)
+            return EXIT_USAGE
+        #end if
+    #end for
+
+    files = [(path,os.path.basename(path)) for path in args.paths]
+    progress = startProgress(bf,args,sum(os.path.getsize(path) for path in args.paths))
+    try:
+        if args.resume:
+            # one file per worker, each saving its state so it can be resumed
+            with ThreadPoolExecutor(max_workers=args.workers) as executor:
+                results = list(executor.map(
+                    lambda item: bf.uploadFile(args.dataset,item[0],item[1],args.collection,resume=True,priority=PRIORITIES[args.priority]),
+                    files))
+            #end with
+        else:
+            results = bf.uploadFiles(args.dataset,files,args.collection,priority=PRIORITIES[args.priority])
+        #end if
+    finally:
+        stopProgress(progress)
+    #end try
+
+    failed = {path : result for (path, filename), result in zip(files,results) if isinstance(result,bytes)}
+    return report(
+        args,
+        {
+            'uploaded' : [path for path, filename in files if path not in failed],
+            'failed'   : failed,
+        })
+#end uploadCommand
+
+
+def downloadCommand(bf,args):
+    """
+    download a dataset or a collection into a local folder
+
+    :return: exit status
+    """
+    # the total size of the files to download, for the time left, is known once the dataset has been listed
+    progress = startProgress(bf,args)
+    try:
+        summary = bf.downloadCollection(
+            args.dataset,
+            args.collection,
+            args.local,
+            args.checksum,
+            PRIORITIES[args.priority],
+            progress.setTotal if progress is not None else None)
+    finally:
+        stopProgress(progress)
+    #end try
+    return report(args,summary)
+#end downloadCommand
+
+
+def syncCommand(bf,args):
+    """
+    mirror a local folder into a dataset or a collection
+
+    :return: exit status
+    """
+    if not os.path.isdir(args.local):
+        print('{} is not a folder'.format(args.local),file=sys.stderr)
+        return EXIT_USAGE
+    #end if
+
+    # the total size of the files to upload, for the time left, is known once the trees have been compared
+    progress = startProgress(bf,args)
+    try:
+        summary = bf.syncDirectory(
+            args.dataset,
+            args.local,
+            args.collection,
+            args.checksum,
+            PRIORITIES[args.priority],
+            args.replace,
+            progress.setTotal if progress is not None else None)
+    finally:
+        stopProgress(progress)
+    #end try
+    return report(args,summary)
+#end syncCommand
+
+
+def startProgress(bf,args,total=None):
+    """
+    start showing the progress, unless disabled or not on a terminal
+
+    :return: bf_progress instance, None if not shown
+    """
+    if args.quiet or not sys.stderr.isatty():
+        return None
+    #end if
+    return bf_progress(bf,total)
+#end startProgress
+
+
+def stopProgress(progress):
+    if progress is not None:
+        progress.stop()
+    #end if
+#end stopProgress
+
+
+def report(args,summary):
+    """
+    print the outcome of a transfer and return the exit status
+
+    :param args: parsed arguments
+    :param summary: dictionary with lists of files and a dictionary of the failed ones with their error
+    :return: exit status
+    """
+    failed = {
+        path : error.decode('utf-8','replace') if isinstance(error,bytes) else str(error)
+        for path, error
+        in summary.get('failed',{}).items()
+    }
+    if args.json:
+        json.dump(dict(summary,failed=failed),sys.stdout,indent=2)
+        sys.stdout.write('\n')
+    else:
+        print(', '.join(
+            '{} {}'.format(len(items),key)
+            for key, items
+            in summary.items()
+        ))
+        for path, error in failed.items():
+            print('failed: {}: {}'.format(path,error),file=sys.stderr)
+        #end for
+    #end if
+    return EXIT_PARTIAL if failed else EXIT_OK
+#end report
+
+
+def parser():
+    """
+    build the command line parser
+
+    :return: argparse.ArgumentParser
+    """
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--api-key',default=os.environ.get('BLACKFYNN_API_KEY'),help='blackfynn api key')
+    common.add_argument('--api-secret',default=os.environ.get('BLACKFYNN_API_SECRET'),help='blackfynn api secret')
+    common.add_argument('--api-url',default=os.environ.get('BLACKFYNN_API_URL','https://api.blackfynn.io'),help='blackfynn api url')
+    common.add_argument('--workers',type=int,default=8,help='files transferred at the same time')
+    common.add_argument('--chunk-concurrency',type=int,default=4,help='chunks or ranges of the same file transferred at the same time')
+    common.add_argument('--bandwidth',type=float,default=0.0,help='maximum MB/s sent, and MB/s received, 0 for unlimited')
+    common.add_argument('--priority',choices=sorted(PRIORITIES),default='normal',help='priority of the transfers when the bandwidth is capped')
+    common.add_argument('--json',action='store_true',help='print the outcome in json format')
+    common.add_argument('--quiet',action='store_true',help='do not show the progress')
+
+    parser = argparse.ArgumentParser(description='bulk transfers with blackfynn')
+    commands = parser.add_subparsers(dest='command',required=True)
+
+    command = commands.add_parser('list',parents=[common],help='list the datasets, or the packages of a dataset')
+    command.add_argument('dataset',nargs='?',help='dataset id')
+    command.add_argument('--files',action='store_true',help='list the source files of each package too')
+    command.set_defaults(function=listCommand)
+
+    command = commands.add_parser('upload',parents=[common],help='upload files into a dataset')
+    command.add_argument('dataset',help='dataset id')
+    command.add_argument('paths',nargs='+',help='local files')
+    command.add_argument('--collection',help='destination collection id')
+    command.add_argument('--resume',action='store_true',help='save the state of the uploads and resume interrupted ones')
+    command.set_defaults(function=uploadCommand)
+
+    command = commands.add_parser('download',parents=[common],help='download a dataset or a collection')
+    command.add_argument('dataset',help='dataset id')
+    command.add_argument('local',help='local folder')
+    command.add_argument('--collection',help='collection id, to download only its content')
+    command.add_argument('--checksum',action='store_true',help='compare existing files by checksum too')
+    command.set_defaults(function=downloadCommand)
+
+    command = commands.add_parser('sync',parents=[common],help='mirror a local folder into a dataset')
+    command.add_argument('dataset',help='dataset id')
+    command.add_argument('local',help='local folder')
+    command.add_argument('--collection',help='destination collection id')
+    command.add_argument('--checksum',action='store_true',help='compare files with the same size by checksum too')
+    command.add_argument('--replace',action='store_true',help='delete the packages holding the previous version of changed files')
+    command.set_defaults(function=syncCommand)
+
+    return parser
+#end parser
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    if not args.api_key or not args.api_secret:
+        print('api key and secret are required',file=sys.stderr)
+        return EXIT_USAGE
+    #end if
+    if args.workers < 1 or args.chunk_concurrency < 1:
+        print('workers and chunk concurrency must be at least 1',file=sys.stderr)
+        return EXIT_USAGE
+    #end if
+
+    bf = create(args)
+    try:
+        try:
+            bf.initSession
+        except bf_auth_error as error:
+            print('authentication failed: {}'.format(error),file=sys.stderr)
+            return EXIT_AUTH
+        #end try
+        return args.function(bf,args)
+    except KeyboardInterrupt:
+        print('interrupted',file=sys.stderr)
+        return EXIT_INTERRUPTED
+    except Exception as error:
+        print('{}: {}'.format(type(error).__name__,error),file=sys.stderr)
+        return EXIT_ERROR
+    finally:
+        bf.close()
+    #end try
+#end main
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+#end if
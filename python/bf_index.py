@@ -0,0 +1,319 @@
+"""
+persistent local index of the packages and source files of blackfynn datasets
+"""
+
+# import libraries
+import sqlite3
+import threading
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class bf_index:
+
+    # tables and indexes used by the index
+    schema = """
+        CREATE TABLE IF NOT EXISTS datasets (
+            id          TEXT PRIMARY KEY,
+            updatedAt   TEXT,
+            refreshedAt REAL
+        );
+        CREATE TABLE IF NOT EXISTS packages (
+            id          TEXT PRIMARY KEY,
+            datasetId   TEXT NOT NULL,
+            name        TEXT,
+            parentId    TEXT,
+            packageType TEXT,
+            updatedAt   TEXT,
+            path        TEXT,
+            content     TEXT
+        );
+        CREATE TABLE IF NOT EXISTS files (
+            packageId   TEXT NOT NULL,
+            id          TEXT NOT NULL,
+            name        TEXT,
+            size        INTEGER,
+            content     TEXT,
+            PRIMARY KEY (packageId, id)
+        );
+        CREATE INDEX IF NOT EXISTS packagesName ON packages (datasetId, name);
+        CREATE INDEX IF NOT EXISTS packagesParent ON packages (datasetId, parentId);
+        CREATE INDEX IF NOT EXISTS packagesPath ON packages (datasetId, path);
+        CREATE INDEX IF NOT EXISTS filesName ON files (name);
+    """
+
+    def __init__(self,bf,path):
+        """
+        When instantiated, this class opens (or creates) the sqlite index saved at the path given
+
+        :param bf: bf_rest instance used to query blackfynn
+        :param path: local path of the sqlite database
+        """
+        self.bf = bf
+        self.path = path
+        # number of concurrent requests used to retrieve the source files of changed packages
+        self.refreshWorkers = 8
+        #
+        # sqlite connection shared by all the threads, protected by the lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path,check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.executescript(self.schema)
+        #end with
+    #end __init__
+
+
+    def close(self):
+        """
+        close the sqlite database
+
+        :return: None
+        """
+        with self.lock:
+            self.connection.close()
+        #end with
+    #end close
+
+
+    def _fetchSources(self,pids):
+        """
+        retrieve the source files of the packages listed concurrently
+
+        :param pids: list of blackfynn package ids
+        :return: dictionary package id -> list of source file contents
+        """
+        def fetch(pid):
+            sources = self.bf.getPackageSources(pid)
+            if not isinstance(sources,list):
+                raise IOError('Unable to retrieve source files of package {}: {}'.format(pid,sources))
+            #end if
+            return [source.get('content',source) for source in sources]
+        #end fetch
+
+        with ThreadPoolExecutor(max_workers=self.refreshWorkers) as executor:
+            return dict(zip(pids,executor.map(fetch,pids)))
+        #end with
+    #end _fetchSources
+
+
+    def refresh(self,did,force=False,skipUnchanged=False):
+        """
+        bring the index of the dataset up to date.
+        The first refresh lists all the packages with their source files, the following ones list the packages only
+        and retrieve the source files of new or updated packages.
+        The update time of the dataset is not guaranteed to change when its packages do,
+        so the packages are listed every time unless skipUnchanged is set
+
+        :param did: blackfynn dataset id
+        :param force: re-index every package. Default: False
+        :param skipUnchanged: retrieve nothing besides the dataset itself if its update time
+                              has not changed since the last refresh. Default: False
+        :return: True if the index has been updated, False if the listing has been skipped
+        """
+
+        dataset = self.bf.getDataset(did)
+        if not isinstance(dataset,dict):
+            raise IOError('Unable to retrieve dataset {}: {}'.format(did,dataset))
+        #end if
+        updatedAt = dataset.get('content',{}).get('updatedAt')
+
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT updatedAt FROM datasets WHERE id = ?',(did,)).fetchone()
+            known = dict(self.connection.execute(
+                'SELECT id, updatedAt FROM packages WHERE datasetId = ?',(did,)).fetchall())
+        #end with
+
+        # the dataset has not been updated since last refresh, and it is trusted to
+        if skipUnchanged and not force and row is not None and updatedAt is not None and row[0] == updatedAt:
+            return False
+        #end if
+
+        if force or row is None:
+            # full listing, source files included
+            packages = list(self.bf.iterPackages(did,files=True))
+            changed = packages
+            sources = {
+                package['content']['id'] : self.bf.packageSourceFiles(package)
+                for package
+                in packages
+            }
+        else:
+            # list packages only, and retrieve the source files of what changed
+            packages = list(self.bf.iterPackages(did))
+            changed = [
+                package
+                for package
+                in packages
+                if known.get(package['content']['id'],'') != package['content'].get('updatedAt')
+            ]
+            sources = self._fetchSources([
+                package['content']['id']
+                for package
+                in changed
+                if package['content'].get('packageType') != 'Collection'
+            ])
+        #end if
+
+        # resolve parent ids, which can be integer ids, to package ids
+        intIds = {
+            package['content']['intId'] : package['content']['id']
+            for package
+            in packages
+            if 'intId' in package['content']
+        }
+        paths = self.bf.packagePaths(packages)
+        seen = set(paths.keys())
+
+        with self.lock, self.connection:
+            # remove packages that do not exist anymore
+            removed = [(pid,) for pid in known.keys() if pid not in seen]
+            self.connection.executemany('DELETE FROM packages WHERE id = ?',removed)
+            self.connection.executemany('DELETE FROM files WHERE packageId = ?',removed)
+            # insert new and updated packages with their source files
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO packages VALUES (?,?,?,?,?,?,?,?)',
+                [
+                    (
+                        package['content']['id'],
+                        did,
+                        package['content'].get('name'),
+                        intIds.get(package['content'].get('parentId'),package['content'].get('parentId')),
+                        package['content'].get('packageType'),
+                        package['content'].get('updatedAt'),
+                        paths[package['content']['id']],
+                        json.dumps(package['content']),
+                    )
+                    for package
+                    in changed
+                ])
+            self.connection.executemany(
+                'DELETE FROM files WHERE packageId = ?',
+                [(package['content']['id'],) for package in changed])
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO files VALUES (?,?,?,?,?)',
+                [
+                    (pid,str(source['id']),source.get('name'),source.get('size'),json.dumps(source))
+                    for pid, pidSources
+                    in sources.items()
+                    for source
+                    in pidSources
+                ])
+            # paths change when an ancestor is renamed or moved
+            self.connection.executemany(
+                'UPDATE packages SET path = ? WHERE id = ? AND path IS NOT ?',
+                [(path,pid,path) for pid, path in paths.items()])
+            self.connection.execute(
+                'INSERT OR REPLACE INTO datasets VALUES (?,?,?)',
+                (did,updatedAt,time.time()))
+        #end with
+
+        return True
+    #end refresh
+
+
+    def _packages(self,where,params):
+        """
+        select packages and return them as package dictionaries with their path
+
+        :param where: sql condition
+        :param params: parameters of the condition
+        :return: list of dictionaries with content and path
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT content, path FROM packages WHERE ' + where,params).fetchall()
+        #end with
+        return [
+            {
+                'content' : json.loads(content),
+                'path'    : path
+            }
+            for content, path
+            in rows
+        ]
+    #end _packages
+
+
+    def getPackage(self,pid):
+        """
+        return the package with the id given
+
+        :param pid: blackfynn package id
+        :return: package dictionary, None if it is not indexed
+        """
+        packages = self._packages('id = ?',(pid,))
+        return packages[0] if packages else None
+    #end getPackage
+
+
+    def findPackages(self,did,name):
+        """
+        return all the packages of the dataset with the name given
+
+        :param did: blackfynn dataset id
+        :param name: package name
+        :return: list of package dictionaries
+        """
+        return self._packages('datasetId = ? AND name = ?',(did,name))
+    #end findPackages
+
+
+    def getChildren(self,did,cid=None):
+        """
+        return the packages contained in a collection
+
+        :param did: blackfynn dataset id
+        :param cid: blackfynn collection id. If left empty, the packages at the root of the dataset are returned
+        :return: list of package dictionaries
+        """
+        return self._packages('datasetId = ? AND parentId IS ?',(did,cid))
+    #end getChildren
+
+
+    def getPackageByPath(self,did,path):
+        """
+        return the package at the path given, where path is made of the package names separated by "/"
+
+        :param did: blackfynn dataset id
+        :param path: path of the package inside the dataset
+        :return: package dictionary, None if it is not indexed
+        """
+        packages = self._packages('datasetId = ? AND path = ?',(did,path.strip('/')))
+        return packages[0] if packages else None
+    #end getPackageByPath
+
+
+    def getSourceFiles(self,pid):
+        """
+        return the source files of a package
+
+        :param pid: blackfynn package id
+        :return: list of dictionaries with the content of each source file
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT content FROM files WHERE packageId = ?',(pid,)).fetchall()
+        #end with
+        return [json.loads(content) for content, in rows]
+    #end getSourceFiles
+
+
+    def findSourceFiles(self,did,name):
+        """
+        return all the source files of the dataset with the name given
+
+        :param did: blackfynn dataset id
+        :param name: source file name
+        :return: list of (package id, source file content)
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT files.packageId, files.content FROM files JOIN packages ON packages.id = files.packageId '
+                'WHERE packages.datasetId = ? AND files.name = ?',(did,name)).fetchall()
+        #end with
+        return [(pid,json.loads(content)) for pid, content in rows]
+    #end findSourceFiles
+
+#end bf_index
@@ -0,0 +1,134 @@
+"""
+adaptive concurrency limiter used by bf_rest to back off when blackfynn pushes back
+"""
+
+# import libraries
+import threading
+import time
+
+
+class bf_limiter:
+
+    def __init__(self,limit,minimum=1,maximum=64,increase=1.0,decrease=0.5,cooldown=1.0):
+        """
+        When instantiated, this class allows up to limit concurrent operations.
+        The limit is adjusted with additive increase and multiplicative decrease:
+        it grows by increase every time limit operations in a row succeed while the limiter is full,
+        and it is multiplied by decrease, at most once per cooldown, when an operation is throttled.
+        Successes reported while fewer than limit operations are in flight do not raise it,
+        since the limiter is not what bounds the concurrency then
+
+        :param limit: initial number of concurrent operations allowed
+        :param minimum: lowest limit. Default: 1
+        :param maximum: highest limit. Default: 64
+        :param increase: additive increase for each window of successful operations. Default: 1.0
+        :param decrease: multiplicative decrease when throttled. Default: 0.5
+        :param cooldown: minimum seconds between two decreases. Default: 1.0
+        """
+        self.limit = float(limit)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.inFlight = 0
+        self.lastDecrease = 0.0
+        self.condition = threading.Condition()
+    #end __init__
+
+
+    def setLimit(self,limit,maximum=None):
+        """
+        set the number of concurrent operations allowed and, optionally, the highest limit,
+        e.g. to match the number of threads placing the operations
+
+        :param limit: number of concurrent operations allowed, kept between minimum and maximum
+        :param maximum: (optional) highest limit
+        :return: None
+        """
+        with self.condition:
+            if maximum is not None:
+                self.maximum = maximum
+            #end if
+            self.limit = float(max(self.minimum,min(self.maximum,limit)))
+            self.condition.notify_all()
+        #end with
+    #end setLimit
+
+
+    def acquire(self):
+        """
+        wait until the number of operations in flight is below the limit and start a new one
+
+        :return: None
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.inFlight < int(self.limit))
+            self.inFlight += 1
+        #end with
+    #end acquire
+
+
+    def release(self):
+        """
+        indicate that an operation started with acquire is over
+
+        :return: None
+        """
+        with self.condition:
+            self.inFlight -= 1
+            self.condition.notify()
+        #end with
+    #end release
+
+
+    def __enter__(self):
+        self.acquire()
+        return self
+    #end __enter__
+
+
+    def __exit__(self,excType,excValue,traceback):
+        self.release()
+        return False
+    #end __exit__
+
+
+    def onSuccess(self):
+        """
+        indicate that an operation succeeded, raising the limit additively if the limiter is full.
+        It must be called before releasing the operation
+
+        :return: None
+        """
+        with self.condition:
+            if self.inFlight < int(self.limit):
+                return
+            #end if
+            previous = int(self.limit)
+            self.limit = min(self.maximum,self.limit + self.increase / self.limit)
+            if int(self.limit) > previous:
+                self.condition.notify()
+            #end if
+        #end with
+    #end onSuccess
+
+
+    def onThrottle(self):
+        """
+        indicate that an operation has been throttled or rejected because of load, lowering the limit multiplicatively.
+        Throttles reported within cooldown of the last decrease are ignored,
+        since they were most likely caused by operations started before it
+
+        :return: None
+        """
+        with self.condition:
+            now = time.monotonic()
+            if now - self.lastDecrease >= self.cooldown:
+                self.limit = max(self.minimum,self.limit * self.decrease)
+                self.lastDecrease = now
+            #end if
+        #end with
+    #end onThrottle
+
+#end bf_limiter
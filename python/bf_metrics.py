@@ -0,0 +1,177 @@
+"""
+per-operation request metrics collected by bf_rest
+"""
+
+# import libraries
+import threading
+import time
+import json
+import bisect
+
+
+class bf_metrics:
+
+    # upper bounds in seconds of the latency histogram buckets.
+    # The last bucket collects everything slower than the last bound
+    latencyBuckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+    def __init__(self):
+        """
+        When instantiated, this class starts collecting metrics from zero
+        """
+        self.lock = threading.Lock()
+        self.hooks = []
+        self.reset()
+    #end __init__
+
+
+    def _emptyOperation(self):
+        """
+        return the metrics of an operation that has not been recorded yet
+
+        :return: dictionary with all the metrics set to zero
+        """
+        return {
+            'requests'    : 0,
+            'errors'      : 0,
+            'retries'     : 0,
+            'bytesUp'     : 0,
+            'bytesDown'   : 0,
+            'latencySum'  : 0.0,
+            'latencyMin'  : None,
+            'latencyMax'  : None,
+            'latency'     : [0] * (len(self.latencyBuckets) + 1),
+            'statusCodes' : {},
+        }
+    #end _emptyOperation
+
+
+    def reset(self):
+        """
+        discard all the metrics collected so far
+
+        :return: None
+        """
+        with self.lock:
+            self.operations = {}
+            self.started = time.time()
+        #end with
+    #end reset
+
+
+    def addHook(self,hook):
+        """
+        register a function called after every request with a dictionary describing it:
+        operation, status, latency, bytesUp, bytesDown, retries.
+        Hooks are called on the thread that placed the request, so they should return quickly
+
+        :param hook: function accepting one dictionary
+        :return: None
+        """
+        with self.lock:
+            self.hooks.append(hook)
+        #end with
+    #end addHook
+
+
+    def removeHook(self,hook):
+        """
+        unregister a function registered with addHook
+
+        :param hook: function to be removed
+        :return: None
+        """
+        with self.lock:
+            self.hooks.remove(hook)
+        #end with
+    #end removeHook
+
+
+    def record(self,operation,status,latency,bytesUp=0,bytesDown=0,retries=0):
+        """
+        record one request
+
+        :param operation: name of the logical operation, e.g. get_packages or upload_chunk
+        :param status: http status code, None if the request raised an exception
+        :param latency: seconds spent on the request
+        :param bytesUp: bytes sent. Default: 0
+        :param bytesDown: bytes received. Default: 0
+        :param retries: times the request has been retried. Default: 0
+        :return: None
+        """
+        with self.lock:
+            metrics = self.operations.get(operation)
+            if metrics is None:
+                metrics = self.operations[operation] = self._emptyOperation()
+            #end if
+            metrics['requests'] += 1
+            metrics['retries'] += retries
+            metrics['bytesUp'] += bytesUp
+            metrics['bytesDown'] += bytesDown
+            metrics['latencySum'] += latency
+            metrics['latencyMin'] = latency if metrics['latencyMin'] is None else min(metrics['latencyMin'],latency)
+            metrics['latencyMax'] = latency if metrics['latencyMax'] is None else max(metrics['latencyMax'],latency)
+            metrics['latency'][bisect.bisect_left(self.latencyBuckets,latency)] += 1
+            if status is None or status >= 400:
+                metrics['errors'] += 1
+            #end if
+            code = str(status)
+            metrics['statusCodes'][code] = metrics['statusCodes'].get(code,0) + 1
+            hooks = list(self.hooks)
+        #end with
+
+        event = {
+            'operation' : operation,
+            'status'    : status,
+            'latency'   : latency,
+            'bytesUp'   : bytesUp,
+            'bytesDown' : bytesDown,
+            'retries'   : retries,
+        }
+        for hook in hooks:
+            hook(event)
+        #end for
+    #end record
+
+
+    def snapshot(self):
+        """
+        return a copy of the metrics collected so far, with averages and rates computed
+        over the time elapsed since the metrics were reset
+
+        :return: dictionary with elapsed seconds, latency bucket bounds and a dictionary of metrics for each operation
+        """
+        with self.lock:
+            elapsed = max(time.time() - self.started,1e-9)
+            operations = {}
+            for operation, metrics in self.operations.items():
+                metrics = dict(
+                    metrics,
+                    latency = list(metrics['latency']),
+                    statusCodes = dict(metrics['statusCodes']))
+                metrics['latencyAverage'] = metrics['latencySum'] / metrics['requests']
+                metrics['requestsPerSecond'] = metrics['requests'] / elapsed
+                metrics['bytesUpPerSecond'] = metrics['bytesUp'] / elapsed
+                metrics['bytesDownPerSecond'] = metrics['bytesDown'] / elapsed
+                operations[operation] = metrics
+            #end for
+        #end with
+
+        return {
+            'elapsed'        : elapsed,
+            'latencyBuckets' : list(self.latencyBuckets),
+            'operations'     : operations,
+        }
+    #end snapshot
+
+
+    def toJson(self):
+        """
+        export a snapshot of the metrics in json format
+
+        :return: json string
+        """
+        return json.dumps(self.snapshot(),indent=2)
+    #end toJson
+
+#end bf_metrics
@@ -0,0 +1,678 @@
+"""
+local stand-in for blackfynn web api, used to test and benchmark bf_rest offline
+
+usage:
+    server = bf_mock_server(latency=0.02,bandwidth=50000000)
+    server.start()
+    bf = bf_rest('key','secret',apiUrl=server.url)
+    ...
+    server.stop()
+"""
+
+# import libraries
+import threading
+import hashlib
+import json
+import random
+import re
+import sys
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+
+class bf_mock_server:
+
+    def __init__(self,host='127.0.0.1',port=0,latency=0.0,bandwidth=0,errorRate=0.0,errorStatus=503,
+                 chunkSize=5242880,tokenExpires=3600,processingDelay=0.0,rangeRequests=True):
+        """
+        When instantiated, this class prepares an empty in-memory blackfynn organization.
+        Call start to serve it
+
+        :param host: address to listen on. Default: 127.0.0.1
+        :param port: port to listen on. Default: 0, any free port
+        :param latency: seconds added to every request. Default: 0
+        :param bandwidth: bytes per second of every request and response body, 0 for unlimited. Default: 0
+        :param errorRate: fraction of requests, besides session ones, failing with errorStatus. Default: 0
+        :param errorStatus: http status of the injected errors. Default: 503
+        :param chunkSize: chunk size returned by upload previews. Default: 5242880
+        :param tokenExpires: seconds the session tokens are valid for. Default: 3600
+        :param processingDelay: seconds uploaded packages take to settle: packages uploaded with processing
+                                stay PROCESSING before being READY, the others UNAVAILABLE before being UPLOADED. Default: 0
+        :param rangeRequests: serve range requests on storage urls. If False, the whole content is always returned,
+                              as storage ignoring the Range header does. Default: True
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.errorRate = errorRate
+        self.errorStatus = errorStatus
+        self.chunkSize = chunkSize
+        self.tokenExpires = tokenExpires
+        self.processingDelay = processingDelay
+        self.rangeRequests = rangeRequests
+        self.organization = 'N:organization:' + str(uuid.uuid4())
+        #
+        # in-memory state, protected by the lock
+        self.lock = threading.Lock()
+        self.tokens = {}
+        self.datasets = {}
+        self.packages = {}
+        self.files = {}
+        self.uploads = {}
+        self.readmes = {}
+        self.nextIntId = 1
+        #
+        # number of requests received for each route
+        self.requests = {}
+        self.server = None
+        self.thread = None
+    #end __init__
+
+
+    @property
+    def url(self):
+        """
+        base url of the server, to be passed to bf_rest as apiUrl
+
+        :return: url string
+        """
+        return 'http://{}:{}'.format(self.host,self.server.server_port)
+    #end url
+
+
+    def start(self):
+        """
+        start serving requests on a background thread
+
+        :return: self
+        """
+        mock = self
+
+        class handler(bf_mock_handler):
+            server_mock = mock
+        #end handler
+
+        self.server = bf_mock_http_server((self.host,self.port),handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever,daemon=True)
+        self.thread.start()
+        return self
+    #end start
+
+
+    def stop(self):
+        """
+        stop serving requests
+
+        :return: None
+        """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        #end if
+    #end stop
+
+
+    def __enter__(self):
+        return self.start()
+    #end __enter__
+
+
+    def __exit__(self,excType,excValue,traceback):
+        self.stop()
+        return False
+    #end __exit__
+
+
+    def _newIntId(self):
+        """
+        return a new integer id. Must be called holding the lock
+
+        :return: integer id
+        """
+        intId = self.nextIntId
+        self.nextIntId += 1
+        return intId
+    #end _newIntId
+
+
+    def _touch(self,did):
+        """
+        mark the dataset as updated. Must be called holding the lock
+
+        :param did: dataset id
+        :return: None
+        """
+        self.datasets[did]['content']['updatedAt'] = '{:.6f}'.format(time.time())
+    #end _touch
+
+
+    def createDataset(self,name):
+        """
+        create a dataset directly, without going through the api
+
+        :param name: dataset name
+        :return: dataset id
+        """
+        with self.lock:
+            did = 'N:dataset:' + str(uuid.uuid4())
+            self.datasets[did] = {
+                'content' : {
+                    'id'        : did,
+                    'intId'     : self._newIntId(),
+                    'name'      : name,
+                    'updatedAt' : '',
+                }
+            }
+            self._touch(did)
+        #end with
+        return did
+    #end createDataset
+
+
+    def createPackage(self,did,name,packageType,parent=None,content=None):
+        """
+        create a package directly, without going through the api.
+        Packages other than collections get one source file with the content given
+
+        :param did: dataset id
+        :param name: package name
+        :param packageType: package type, e.g. Collection or Unsupported
+        :param parent: id of the parent collection, None for the root of the dataset
+        :param content: content of the source file. Default: empty
+        :return: package id
+        """
+        with self.lock:
+            pid = 'N:{}:{}'.format('collection' if packageType == 'Collection' else 'package',uuid.uuid4())
+            package = {
+                'content' : {
+                    'id'          : pid,
+                    'nodeId'      : pid,
+                    'intId'       : self._newIntId(),
+                    'name'        : name,
+                    'packageType' : packageType,
+                    'datasetId'   : did,
+                    'state'       : 'READY',
+                    'createdAt'   : '{:.6f}'.format(time.time()),
+                    'updatedAt'   : '{:.6f}'.format(time.time()),
+                },
+                'sources' : [],
+            }
+            if parent is not None:
+                package['content']['parentId'] = self.packages[parent]['content']['intId']
+            #end if
+            if packageType != 'Collection':
+                fid = self._newIntId()
+                data = content if content is not None else b''
+                self.files[(pid,fid)] = data
+                package['sources'].append({
+                    'content' : {
+                        'id'       : fid,
+                        'name'     : name,
+                        'size'     : len(data),
+                        'checksum' : hashlib.sha256(data).hexdigest(),
+                    }
+                })
+            #end if
+            self.packages[pid] = package
+            self._touch(did)
+        #end with
+        return pid
+    #end createPackage
+
+
+    def _packageJson(self,package,files):
+        """
+        return the json representation of a package. Must be called holding the lock
+
+        :param package: package stored
+        :param files: include source files
+        :return: dictionary
+        """
+        result = {'content' : dict(package['content'])}
+        if time.time() < package.get('readyAt',0):
+            result['content']['state'] = package['pendingState']
+        #end if
+        if files:
+            result['objects'] = {'source' : [dict(source) for source in package['sources']]}
+        #end if
+        return result
+    #end _packageJson
+
+#end bf_mock_server
+
+
+class bf_mock_http_server(ThreadingHTTPServer):
+
+    def handle_error(self,request,client_address):
+        # clients closing streamed responses early are expected, anything else is reported
+        if not isinstance(sys.exc_info()[1],ConnectionError):
+            ThreadingHTTPServer.handle_error(self,request,client_address)
+        #end if
+    #end handle_error
+
+#end bf_mock_http_server
+
+
+class bf_mock_handler(BaseHTTPRequestHandler):
+
+    # http 1.1, so connections are kept alive
+    protocol_version = 'HTTP/1.1'
+    # bf_mock_server serving the requests, set by bf_mock_server.start
+    server_mock = None
+
+    # routes: method, path regular expression, handler method name
+    routes = [
+        ('POST', r'^/account/api/session$',                            'initSession'),
+        ('GET',  r'^/datasets/?$',                                     'getDatasets'),
+        ('POST', r'^/datasets$',                                       'createDataset'),
+        ('GET',  r'^/datasets/(?P<did>[^/]+)$',                        'getDataset'),
+        ('GET',  r'^/datasets/(?P<did>[^/]+)/readme$',                 'getReadme'),
+        ('PUT',  r'^/datasets/(?P<did>[^/]+)/readme$',                 'setReadme'),
+        ('GET',  r'^/datasets/(?P<did>[^/]+)/packages$',               'getPackages'),
+        ('POST', r'^/packages$',                                       'createPackage'),
+        ('GET',  r'^/packages/(?P<pid>[^/]+)$',                        'getPackage'),
+        ('GET',  r'^/packages/(?P<pid>[^/]+)/sources$',                'getSources'),
+        ('GET',  r'^/packages/(?P<pid>[^/]+)/files/(?P<fid>\d+)$',     'getFile'),
+        ('POST', r'^/data/delete$',                                    'deletePackages'),
+        ('GET',  r'^/storage/(?P<pid>[^/]+)/(?P<fid>\d+)$',            'getStorage'),
+        ('POST', r'^/upload/preview/organizations/(?P<oid>[^/]+)$',    'uploadPreview'),
+        ('POST', r'^/upload/chunk/organizations/(?P<oid>[^/]+)/id/(?P<iid>[^/]+)$',    'uploadChunk'),
+        ('POST', r'^/upload/complete/organizations/(?P<oid>[^/]+)/id/(?P<iid>[^/]+)$', 'uploadComplete'),
+        ('GET',  r'^/upload/status/organizations/(?P<oid>[^/]+)/id/(?P<iid>[^/]+)$',   'uploadStatus'),
+    ]
+
+    def log_message(self,format,*args):
+        # keep the console quiet
+        pass
+    #end log_message
+
+
+    def _throttle(self,size):
+        """
+        wait as long as transferring size bytes takes at the configured bandwidth
+
+        :param size: bytes transferred
+        :return: None
+        """
+        if self.server_mock.bandwidth > 0 and size > 0:
+            time.sleep(size / self.server_mock.bandwidth)
+        #end if
+    #end _throttle
+
+
+    def _reply(self,status,body=None,headers=None):
+        """
+        send a response. Dictionaries and lists are sent as json
+
+        :param status: http status
+        :param body: bytes, dictionary or list. Default: empty
+        :param headers: (optional) additional headers
+        :return: None
+        """
+        if body is None:
+            body = b''
+        elif not isinstance(body,(bytes,bytearray,memoryview)):
+            body = json.dumps(body).encode()
+        #end if
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key,value)
+        #end for
+        self.send_header('Content-Length',str(len(body)))
+        self.end_headers()
+        # send in blocks, so bandwidth is limited while sending
+        view = memoryview(body)
+        for start in range(0,len(view),65536):
+            block = view[start:start + 65536]
+            self._throttle(len(block))
+            self.wfile.write(block)
+        #end for
+    #end _reply
+
+
+    def _dispatch(self,method):
+        """
+        read the request, apply latency and error injection and route it
+
+        :param method: http method
+        :return: None
+        """
+        mock = self.server_mock
+        url = urlparse(self.path)
+        self.query = {key : values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length',0))
+        self.body = self.rfile.read(length) if length else b''
+        self._throttle(len(self.body))
+        if mock.latency > 0:
+            time.sleep(mock.latency)
+        #end if
+
+        for routeMethod, pattern, name in self.routes:
+            match = re.match(pattern,url.path)
+            if routeMethod == method and match:
+                break
+            #end if
+        else:
+            return self._reply(404,{'message' : 'not found'})
+        #end for
+
+        with mock.lock:
+            mock.requests[name] = mock.requests.get(name,0) + 1
+        #end with
+
+        if name != 'initSession':
+            if name != 'getStorage' and not self._authorized():
+                return self._reply(401,{'message' : 'unauthorized'})
+            #end if
+            if mock.errorRate > 0 and random.random() < mock.errorRate:
+                return self._reply(mock.errorStatus,{'message' : 'injected error'},{'Retry-After' : '0'})
+            #end if
+        #end if
+
+        try:
+            getattr(self,name)(**match.groupdict())
+        except KeyError as error:
+            self._reply(404,{'message' : 'unknown {}'.format(error)})
+        #end try
+    #end _dispatch
+
+
+    def _authorized(self):
+        """
+        check the session token passed as bearer token or api_key parameter
+
+        :return: True if the token is valid
+        """
+        token = self.headers.get('Authorization','')[len('Bearer '):] or self.query.get('api_key','')
+        with self.server_mock.lock:
+            expires = self.server_mock.tokens.get(token,0)
+        #end with
+        return expires > time.time()
+    #end _authorized
+
+
+    def do_GET(self):
+        self._dispatch('GET')
+    #end do_GET
+
+
+    def do_POST(self):
+        self._dispatch('POST')
+    #end do_POST
+
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+    #end do_PUT
+
+
+    def initSession(self):
+        mock = self.server_mock
+        token = str(uuid.uuid4())
+        with mock.lock:
+            mock.tokens[token] = time.time() + mock.tokenExpires
+        #end with
+        self._reply(200,{
+            'session_token' : token,
+            'organization'  : mock.organization,
+            'expires_in'    : mock.tokenExpires,
+        })
+    #end initSession
+
+
+    def getDatasets(self):
+        with self.server_mock.lock:
+            datasets = [{'content' : dict(dataset['content'])} for dataset in self.server_mock.datasets.values()]
+        #end with
+        self._reply(200,datasets)
+    #end getDatasets
+
+
+    def createDataset(self):
+        did = self.server_mock.createDataset(json.loads(self.body)['name'])
+        self.getDataset(did,201)
+    #end createDataset
+
+
+    def getDataset(self,did,status=200):
+        with self.server_mock.lock:
+            dataset = {'content' : dict(self.server_mock.datasets[did]['content'])}
+        #end with
+        self._reply(status,dataset)
+    #end getDataset
+
+
+    def getReadme(self,did):
+        with self.server_mock.lock:
+            readme = self.server_mock.readmes.get(did,'')
+        #end with
+        self._reply(200,{'readme' : readme})
+    #end getReadme
+
+
+    def setReadme(self,did):
+        with self.server_mock.lock:
+            self.server_mock.readmes[did] = json.loads(self.body)['readme']
+        #end with
+        self._reply(200,{})
+    #end setReadme
+
+
+    def getPackages(self,did):
+        mock = self.server_mock
+        pageSize = int(self.query.get('pageSize',100))
+        start = int(self.query.get('cursor',0))
+        files = self.query.get('includeSourceFiles','False').lower() == 'true'
+        with mock.lock:
+            packages = [
+                package
+                for package
+                in mock.packages.values()
+                if package['content']['datasetId'] == did
+            ]
+            page = {
+                'packages' : [mock._packageJson(package,files) for package in packages[start:start + pageSize]]
+            }
+        #end with
+        if start + pageSize < len(packages):
+            page['cursor'] = str(start + pageSize)
+        #end if
+        self._reply(200,page)
+    #end getPackages
+
+
+    def createPackage(self):
+        payload = json.loads(self.body)
+        pid = self.server_mock.createPackage(
+            payload['dataset'],
+            payload['name'],
+            'Collection' if payload['packageType'].lower() == 'collection' else payload['packageType'],
+            payload.get('parent'))
+        self.getPackage(pid,201)
+    #end createPackage
+
+
+    def getPackage(self,pid,status=200):
+        mock = self.server_mock
+        with mock.lock:
+            package = mock._packageJson(mock.packages[pid],False)
+        #end with
+        self._reply(status,package)
+    #end getPackage
+
+
+    def getSources(self,pid):
+        mock = self.server_mock
+        with mock.lock:
+            sources = mock._packageJson(mock.packages[pid],True)['objects']['source']
+        #end with
+        self._reply(200,sources)
+    #end getSources
+
+
+    def deletePackages(self):
+        mock = self.server_mock
+        result = {'success' : [], 'failures' : []}
+        with mock.lock:
+            for pid in json.loads(self.body)['things']:
+                if pid not in mock.packages:
+                    result['failures'].append({'id' : pid, 'error' : 'not found'})
+                    continue
+                #end if
+                mock._touch(mock.packages[pid]['content']['datasetId'])
+                # collections are deleted with all their content
+                pending = [pid]
+                while pending:
+                    current = pending.pop()
+                    package = mock.packages.pop(current)
+                    for source in package['sources']:
+                        mock.files.pop((current,source['content']['id']),None)
+                    #end for
+                    pending += [
+                        other
+                        for other, value
+                        in mock.packages.items()
+                        if value['content'].get('parentId') == package['content']['intId']
+                    ]
+                #end while
+                result['success'].append(pid)
+            #end for
+        #end with
+        self._reply(200,result)
+    #end deletePackages
+
+
+    def getFile(self,pid,fid):
+        with self.server_mock.lock:
+            self.server_mock.files[(pid,int(fid))]
+        #end with
+        self._reply(200,{'url' : '{}/storage/{}/{}'.format(self.server_mock.url,pid,fid)})
+    #end getFile
+
+
+    def getStorage(self,pid,fid):
+        with self.server_mock.lock:
+            data = self.server_mock.files[(pid,int(fid))]
+        #end with
+        match = re.match(r'^bytes=(\d+)-(\d*)$',self.headers.get('Range',''))
+        if match and self.server_mock.rangeRequests:
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else len(data) - 1
+            end = min(end,len(data) - 1)
+            if start >= len(data):
+                return self._reply(416,b'',{'Content-Range' : 'bytes */{}'.format(len(data))})
+            #end if
+            return self._reply(
+                206,
+                memoryview(data)[start:end + 1],
+                {
+                    'Accept-Ranges' : 'bytes',
+                    'Content-Range' : 'bytes {}-{}/{}'.format(start,end,len(data)),
+                })
+        #end if
+        self._reply(200,data,{'Accept-Ranges' : 'bytes'} if self.server_mock.rangeRequests else {})
+    #end getStorage
+
+
+    def uploadPreview(self,oid):
+        mock = self.server_mock
+        files = json.loads(self.body)['files']
+        packages = []
+        with mock.lock:
+            for previewFile in files:
+                importId = str(uuid.uuid4())
+                totalChunks = max(1,-(-previewFile['size'] // mock.chunkSize))
+                mock.uploads[importId] = {
+                    'datasetId'   : self.query['datasetId'],
+                    'fileName'    : previewFile['fileName'],
+                    'size'        : previewFile['size'],
+                    'multipartId' : str(uuid.uuid4()),
+                    'totalChunks' : totalChunks,
+                    'processing'  : previewFile.get('processing',True),
+                    'chunks'      : {},
+                }
+                packages.append({
+                    'importId'    : importId,
+                    'packageName' : previewFile['fileName'],
+                    'files'       : [{
+                        'uploadId'          : previewFile['uploadId'],
+                        'fileName'          : previewFile['fileName'],
+                        'size'              : previewFile['size'],
+                        'multipartUploadId' : mock.uploads[importId]['multipartId'],
+                        'chunkedUpload'     : {
+                            'chunkSize'   : mock.chunkSize,
+                            'totalChunks' : totalChunks,
+                        },
+                    }],
+                })
+            #end for
+        #end with
+        self._reply(201,{'packages' : packages})
+    #end uploadPreview
+
+
+    def uploadChunk(self,oid,iid):
+        if hashlib.sha256(self.body).hexdigest() != self.query['chunkChecksum']:
+            return self._reply(400,{'message' : 'checksum mismatch'})
+        #end if
+        with self.server_mock.lock:
+            upload = self.server_mock.uploads[iid]
+            if self.query['multipartId'] != upload['multipartId']:
+                return self._reply(400,{'message' : 'unknown multipart upload'})
+            #end if
+            upload['chunks'][int(self.query['chunkNumber'])] = self.body
+        #end with
+        self._reply(201,{'success' : True, 'error' : None})
+    #end uploadChunk
+
+
+    def uploadStatus(self,oid,iid):
+        with self.server_mock.lock:
+            chunks = sorted(self.server_mock.uploads[iid]['chunks'].keys())
+        #end with
+        self._reply(200,{'chunks' : chunks})
+    #end uploadStatus
+
+
+    def uploadComplete(self,oid,iid):
+        mock = self.server_mock
+        with mock.lock:
+            upload = mock.uploads[iid]
+            missing = set(range(upload['totalChunks'])) - set(upload['chunks'].keys())
+        #end with
+        if missing:
+            return self._reply(400,{'message' : 'missing chunks {}'.format(sorted(missing))})
+        #end if
+        data = b''.join(upload['chunks'][chunk] for chunk in range(upload['totalChunks']))
+        pid = mock.createPackage(
+            self.query['datasetId'],
+            upload['fileName'],
+            'Unsupported',
+            self.query.get('destinationId'),
+            data)
+        with mock.lock:
+            del mock.uploads[iid]
+            mock.packages[pid]['content']['importId'] = iid
+            mock.packages[pid]['readyAt'] = time.time() + mock.processingDelay
+            # packages uploaded without processing are never processed, so they never become ready
+            if upload['processing']:
+                mock.packages[pid]['pendingState'] = 'PROCESSING'
+            else:
+                mock.packages[pid]['pendingState'] = 'UNAVAILABLE'
+                mock.packages[pid]['content']['state'] = 'UPLOADED'
+            #end if
+            package = mock._packageJson(mock.packages[pid],False)
+        #end with
+        package['content']['state'] = 'UNAVAILABLE'
+        self._reply(200,[{
+            'manifest' : {'type' : 'upload', 'importId' : iid},
+            'package'  : package,
+        }])
+    #end uploadComplete
+
+#end bf_mock_handler
@@ -0,0 +1,268 @@
+"""
+registry of the operations in flight in bf_rest, with their byte progress
+"""
+
+# import libraries
+import threading
+import time
+import uuid
+from collections import deque
+
+
+class bf_operations:
+
+    def __init__(self,stuckAfter=300.0,rateWindow=10.0):
+        """
+        When instantiated, this class starts with no operations in flight.
+        Operations are kept in a dictionary by id, so starting, updating and stopping one takes constant time,
+        and the totals by type and the recent throughput are kept up to date as they change,
+        so they can be polled without walking all the operations
+
+        :param stuckAfter: seconds without progress after which an operation is reported as stuck. Default: 300
+        :param rateWindow: seconds over which the recent throughput is computed. Default: 10
+        """
+        self.stuckAfter = stuckAfter
+        self.rateWindow = rateWindow
+        self.lock = threading.Lock()
+        # notified every time an operation stops
+        self.stopped = threading.Condition(self.lock)
+        # operation id -> dictionary describing the operation
+        self.operations = {}
+        # operation type -> number of operations in flight
+        self.types = {}
+        # bytes transferred by all the operations, and by second over the last rateWindow seconds
+        self.bytesDone = 0
+        self.rate = deque()
+    #end __init__
+
+
+    def __len__(self):
+        return len(self.operations)
+    #end __len__
+
+
+    def start(self,operationType='operation',name=None,size=None):
+        """
+        register a new operation in flight
+
+        :param operationType: type of the operation, e.g. upload or download. Default: operation
+        :param name: (optional) id of the operation. A new unique id is generated if not passed
+        :param size: (optional) total bytes the operation is expected to transfer
+        :return: id of the operation
+        """
+        if name is None:
+            name = str(uuid.uuid4())
+        #end if
+        now = time.time()
+        with self.lock:
+            if name in self.operations:
+                raise ValueError('operation {} is already in flight'.format(name))
+            #end if
+            self.operations[name] = {
+                'id'           : name,
+                'type'         : operationType,
+                'started'      : now,
+                'lastProgress' : now,
+                'bytes'        : 0,
+                'size'         : size,
+            }
+            self.types[operationType] = self.types.get(operationType,0) + 1
+        #end with
+        return name
+    #end start
+
+
+    def progress(self,name,count):
+        """
+        add the bytes given to the progress of an operation.
+        Operations that are not in flight anymore are ignored
+
+        :param name: id of the operation
+        :param count: bytes transferred since the last update
+        :return: None
+        """
+        now = time.time()
+        second = int(now)
+        with self.lock:
+            operation = self.operations.get(name)
+            if operation is None:
+                return
+            #end if
+            operation['bytes'] += count
+            operation['lastProgress'] = now
+            self.bytesDone += count
+            if self.rate and self.rate[-1][0] == second:
+                self.rate[-1][1] += count
+            else:
+                self.rate.append([second,count])
+            #end if
+            self._dropOldRate(now)
+        #end with
+    #end progress
+
+
+    def setSize(self,name,size):
+        """
+        set the total bytes an operation is expected to transfer, once it is known
+
+        :param name: id of the operation
+        :param size: total bytes
+        :return: None
+        """
+        with self.lock:
+            operation = self.operations.get(name)
+            if operation is not None:
+                operation['size'] = size
+            #end if
+        #end with
+    #end setSize
+
+
+    def stop(self,name):
+        """
+        remove an operation from the ones in flight.
+        Operations that are not in flight are ignored
+
+        :param name: id of the operation
+        :return: number of operations still in flight
+        """
+        with self.lock:
+            operation = self.operations.pop(name,None)
+            if operation is not None:
+                remaining = self.types[operation['type']] - 1
+                if remaining:
+                    self.types[operation['type']] = remaining
+                else:
+                    del self.types[operation['type']]
+                #end if
+            #end if
+            self.stopped.notify_all()
+            return len(self.operations)
+        #end with
+    #end stop
+
+
+    def wait(self,timeout=None):
+        """
+        wait until there are no operations in flight or until the timeout expires
+
+        :param timeout: (optional) seconds to wait
+        :return: True unless the timeout expired
+        """
+        with self.stopped:
+            return self.stopped.wait_for(lambda: not self.operations,timeout)
+        #end with
+    #end wait
+
+
+    def _dropOldRate(self,now):
+        """
+        discard the throughput samples older than rateWindow. The lock must be held
+
+        :param now: current time
+        :return: None
+        """
+        while self.rate and self.rate[0][0] <= now - self.rateWindow:
+            self.rate.popleft()
+        #end while
+    #end _dropOldRate
+
+
+    def _describe(self,operation,now):
+        """
+        return a copy of an operation with its elapsed time, throughput and whether it is stuck
+
+        :param operation: dictionary describing the operation
+        :param now: current time
+        :return: dictionary
+        """
+        elapsed = max(now - operation['started'],1e-9)
+        idle = now - operation['lastProgress']
+        return dict(
+            operation,
+            elapsed = elapsed,
+            idle = idle,
+            bytesPerSecond = operation['bytes'] / elapsed,
+            fraction = operation['bytes'] / operation['size'] if operation['size'] else None,
+            stuck = idle > self.stuckAfter)
+    #end _describe
+
+
+    def get(self,name):
+        """
+        return the state of an operation in flight
+
+        :param name: id of the operation
+        :return: dictionary with id, type, started, lastProgress, bytes, size, elapsed, idle,
+                 bytesPerSecond, fraction and stuck. None if the operation is not in flight
+        """
+        now = time.time()
+        with self.lock:
+            operation = self.operations.get(name)
+            return self._describe(operation,now) if operation is not None else None
+        #end with
+    #end get
+
+
+    def summary(self):
+        """
+        return the totals of the operations in flight.
+        It does not walk the operations, so it can be polled frequently
+
+        :return: dictionary with the operations in flight, in total and by type,
+                 the bytes transferred so far and the throughput over the last rateWindow seconds
+        """
+        now = time.time()
+        with self.lock:
+            self._dropOldRate(now)
+            return {
+                'inFlight'       : len(self.operations),
+                'types'          : dict(self.types),
+                'bytes'          : self.bytesDone,
+                'bytesPerSecond' : sum(count for second, count in self.rate) / self.rateWindow,
+            }
+        #end with
+    #end summary
+
+
+    def snapshot(self,operationType=None):
+        """
+        return the state of all the operations in flight, oldest first
+
+        :param operationType: (optional) return only the operations of this type
+        :return: list of dictionaries, as returned by get
+        """
+        now = time.time()
+        with self.lock:
+            operations = [
+                self._describe(operation,now)
+                for operation
+                in self.operations.values()
+                if operationType is None or operation['type'] == operationType
+            ]
+        #end with
+        return operations
+    #end snapshot
+
+
+    def stuck(self,stuckAfter=None):
+        """
+        return the operations in flight that have not made any progress for a while
+
+        :param stuckAfter: (optional) seconds without progress. Default: the value given when instantiated
+        :return: list of dictionaries, as returned by get
+        """
+        now = time.time()
+        limit = now - (stuckAfter if stuckAfter is not None else self.stuckAfter)
+        with self.lock:
+            operations = [
+                self._describe(operation,now)
+                for operation
+                in self.operations.values()
+                if operation['lastProgress'] < limit
+            ]
+        #end with
+        return operations
+    #end stuck
+
+#end bf_operations
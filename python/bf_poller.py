@@ -0,0 +1,318 @@
+"""
+central poller of the processing state of uploaded packages, shared by many imports
+"""
+
+# import libraries
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, InvalidStateError
+
+
+class bf_import_poller:
+
+    # package states meaning that the import is over.
+    # bf_rest uploads without processing, so its packages settle in UPLOADED and never become READY
+    uploadedStates = {'UPLOADED','READY'}
+    processedStates = {'READY'}
+    failedStates = {'ERROR','FAILED','PROCESSING_FAILED','UPLOAD_FAILED','INFECTED'}
+
+    def __init__(self,bf,interval=2.0,maxInterval=60.0,backoff=1.5,batchThreshold=10,workers=4,readyStates=None):
+        """
+        When instantiated, this class starts a background thread checking the state of the packages tracked.
+        Every round, the packages are grouped by dataset: datasets with many packages tracked,
+        or with packages known only by import id, are checked listing their packages a page at a time,
+        the others getting each package, workers at a time.
+        Rounds that resolve nothing are spaced out more and more, up to maxInterval,
+        and go back to interval as soon as something is resolved or tracked.
+        The imports whose timeout expires between two rounds fail at their deadline, without waiting for the next round
+
+        :param bf: bf_rest instance
+        :param interval: seconds between rounds while imports keep completing. Default: 2
+        :param maxInterval: maximum seconds between rounds. Default: 60
+        :param backoff: factor applied to the interval after a round without progress. Default: 1.5
+        :param batchThreshold: packages tracked in a dataset from which the dataset is listed
+                               instead of getting each package. Default: 10
+        :param workers: number of packages retrieved concurrently. Default: 4
+        :param readyStates: (optional) package states meaning that the import is ready.
+                            Default: uploadedStates, as bf_rest uploads without processing.
+                            Pass processedStates for packages uploaded with processing
+        """
+        self.bf = bf
+        self.interval = interval
+        self.maxInterval = maxInterval
+        self.backoff = backoff
+        self.batchThreshold = batchThreshold
+        self.workers = workers
+        self.readyStates = set(readyStates) if readyStates is not None else self.uploadedStates
+        #
+        # imports tracked: future -> dictionary with dataset id, package id, import id and deadline.
+        # Protected by the condition, which is notified when imports are tracked or the poller is closed
+        self.condition = threading.Condition()
+        self.pending = {}
+        self.currentInterval = interval
+        self.nextRound = 0
+        self.closed = False
+        self.thread = threading.Thread(target=self._run,daemon=True)
+        self.thread.start()
+    #end __init__
+
+
+    def __enter__(self):
+        return self
+    #end __enter__
+
+
+    def __exit__(self,excType,excValue,traceback):
+        self.close()
+    #end __exit__
+
+
+    def close(self):
+        """
+        stop the poller. Imports still tracked are cancelled
+
+        :return: None
+        """
+        with self.condition:
+            self.closed = True
+            pending = list(self.pending.keys())
+            self.pending.clear()
+            self.condition.notify_all()
+        #end with
+        self.thread.join()
+        for future in pending:
+            future.cancel()
+        #end for
+    #end close
+
+
+    def track(self,did,pid=None,importId=None,callback=None,timeout=None):
+        """
+        track the import of a package, known by package id, by import id or by both
+
+        :param did: blackfynn dataset id
+        :param pid: (optional) blackfynn package id
+        :param importId: (optional) import id returned by the upload preview
+        :param callback: (optional) function called with the future once it is resolved, on the poller thread
+        :param timeout: (optional) seconds after which the future fails with TimeoutError
+        :return: future resolving to the package dictionary when it is ready, or failing with IOError
+        """
+        if pid is None and importId is None:
+            raise ValueError('either pid or importId is required')
+        #end if
+
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+        #end if
+        with self.condition:
+            if self.closed:
+                raise RuntimeError('the poller has been closed')
+            #end if
+            # new imports are checked at the base interval again
+            nextRound = time.time() + self.interval
+            self.nextRound = min(self.nextRound,nextRound) if self.pending else nextRound
+            self.currentInterval = self.interval
+            self.pending[future] = {
+                'did'      : did,
+                'pid'      : pid,
+                'importId' : importId,
+                'deadline' : time.time() + timeout if timeout is not None else None,
+            }
+            self.condition.notify_all()
+        #end with
+        return future
+    #end track
+
+
+    def trackUpload(self,did,result,callback=None,timeout=None):
+        """
+        track all the packages returned by uploadFile or by one item of uploadFiles
+
+        :param did: blackfynn dataset id
+        :param result: list returned when the upload was completed
+        :param callback: (optional) function called with each future once it is resolved, on the poller thread
+        :param timeout: (optional) seconds after which the futures fail with TimeoutError
+        :return: list of futures, as returned by track
+        """
+        # failed uploads return the plain response instead
+        if not isinstance(result,list):
+            raise ValueError('The upload failed, nothing to track: {}'.format(result))
+        #end if
+        for item in result:
+            if not isinstance(item,dict):
+                raise ValueError('Unexpected item in the upload result, nothing tracked: {}'.format(item))
+            #end if
+        #end for
+
+        return [
+            self.track(
+                did,
+                item.get('package',{}).get('content',{}).get('id'),
+                item.get('manifest',{}).get('importId'),
+                callback,
+                timeout)
+            for item
+            in result
+        ]
+    #end trackUpload
+
+
+    def _wakeUp(self):
+        """
+        return when the poller thread must wake up: at the next round, or at the nearest deadline if sooner.
+        Must be called holding the condition, with imports tracked
+
+        :return: time
+        """
+        deadlines = [entry['deadline'] for entry in self.pending.values() if entry['deadline'] is not None]
+        return min([self.nextRound] + deadlines)
+    #end _wakeUp
+
+
+    def _expire(self):
+        """
+        fail the imports whose deadline has passed with TimeoutError, without checking their state
+
+        :return: None
+        """
+        now = time.time()
+        with self.condition:
+            expired = [
+                (future,entry)
+                for future, entry
+                in self.pending.items()
+                if entry['deadline'] is not None and now >= entry['deadline']
+            ]
+            for future, entry in expired:
+                del self.pending[future]
+            #end for
+        #end with
+
+        for future, entry in expired:
+            try:
+                future.set_exception(TimeoutError('Import {} not ready after the timeout'.format(entry['pid'] or entry['importId'])))
+            except InvalidStateError:
+                # cancelled in the meantime
+                pass
+            #end try
+        #end for
+    #end _expire
+
+
+    def _run(self):
+        """
+        poll the imports tracked until the poller is closed
+
+        :return: None
+        """
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                with self.condition:
+                    while not self.closed and (not self.pending or time.time() < self._wakeUp()):
+                        self.condition.wait(self._wakeUp() - time.time() if self.pending else None)
+                    #end while
+                    if self.closed:
+                        return
+                    #end if
+                    # woken by a deadline before the next round
+                    early = time.time() < self.nextRound
+                    # group the imports by dataset
+                    byDataset = {}
+                    for future, entry in ([] if early else self.pending.items()):
+                        byDataset.setdefault(entry['did'],[]).append((future,entry))
+                    #end for
+                #end with
+                if early:
+                    self._expire()
+                    continue
+                #end if
+
+                resolved = 0
+                for did, entries in byDataset.items():
+                    try:
+                        resolved += self._pollDataset(executor,did,entries)
+                    except Exception:
+                        # transient failures are retried at the next round
+                        pass
+                    #end try
+                #end for
+
+                with self.condition:
+                    self.currentInterval = \
+                        self.interval if resolved else min(self.maxInterval,self.currentInterval * self.backoff)
+                    self.nextRound = time.time() + self.currentInterval
+                #end with
+            #end while
+        #end with
+    #end _run
+
+
+    def _pollDataset(self,executor,did,entries):
+        """
+        check the state of the imports tracked in a dataset, with one listing or with one request per package
+
+        :param executor: executor used to get the packages concurrently
+        :param did: blackfynn dataset id
+        :param entries: list of (future, entry) of the dataset
+        :return: number of imports resolved
+        """
+        if len(entries) >= self.batchThreshold or any(entry['pid'] is None for future, entry in entries):
+            found = {}
+            for package in self.bf.iterPackages(did):
+                content = package['content']
+                found[content['id']] = package
+                if content.get('importId'):
+                    found[content['importId']] = package
+                #end if
+            #end for
+            packages = [
+                found.get(entry['pid']) if entry['pid'] is not None else found.get(entry['importId'])
+                for future, entry
+                in entries
+            ]
+        else:
+            packages = [
+                package if isinstance(package,dict) else None
+                for package
+                in executor.map(lambda item: self.bf.getPackage(item[1]['pid']),entries)
+            ]
+        #end if
+
+        resolved = 0
+        now = time.time()
+        for (future, entry), package in zip(entries,packages):
+            state = package['content'].get('state') if package is not None else None
+            if state in self.readyStates:
+                outcome = package
+            elif state in self.failedStates:
+                outcome = IOError('Import of package {} failed with state {}'.format(package['content']['id'],state))
+            elif entry['deadline'] is not None and now >= entry['deadline']:
+                outcome = TimeoutError('Import {} not ready after the timeout'.format(entry['pid'] or entry['importId']))
+            elif future.cancelled():
+                outcome = None
+            else:
+                continue
+            #end if
+
+            with self.condition:
+                self.pending.pop(future,None)
+            #end with
+            try:
+                if isinstance(outcome,Exception):
+                    future.set_exception(outcome)
+                    resolved += 1
+                elif outcome is not None:
+                    future.set_result(outcome)
+                    resolved += 1
+                #end if
+            except InvalidStateError:
+                # cancelled in the meantime
+                pass
+            #end try
+        #end for
+
+        return resolved
+    #end _pollDataset
+
+#end bf_import_poller
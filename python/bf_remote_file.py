@@ -0,0 +1,293 @@
+"""
+read-only, seekable file object over the content of a blackfynn file, served with http range requests
+"""
+
+# import libraries
+import io
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class bf_remote_file(io.RawIOBase):
+
+    def __init__(self,bf,pid,fid,blockSize=1048576,cacheBlocks=64,readAhead=4,priority=None):
+        """
+        When instantiated, this class reads the first block of the file to find out its size.
+        Reads are served from an LRU cache of blocks; missing blocks are fetched with range requests,
+        and when the file is read sequentially the following blocks are fetched in the background.
+        If the storage ignores range requests, the whole content received the first time is kept
+        and every read is served from it.
+        The file is registered as one download transfer with the scheduler of bf, which grants every block received
+
+        :param bf: bf_rest instance
+        :param pid: blackfynn package id
+        :param fid: blackfynn file id
+        :param blockSize: size of the blocks fetched and cached. Default: 1048576
+        :param cacheBlocks: maximum number of blocks cached. Default: 64
+        :param readAhead: blocks fetched ahead on sequential reads, 0 to disable. Default: 4
+        :param priority: (optional) priority class in the scheduler. Default: bf_scheduler.NORMAL
+        """
+        io.RawIOBase.__init__(self)
+        self.bf = bf
+        self.pid = pid
+        self.fid = fid
+        self.blockSize = blockSize
+        self.cacheBlocks = max(cacheBlocks,readAhead + 1)
+        self.readAhead = readAhead
+        self.position = 0
+        self.lastBlock = None
+        #
+        # cached blocks and blocks being fetched in the background, protected by the lock
+        self.lock = threading.Lock()
+        self.blocks = OrderedDict()
+        self.pending = {}
+        # whole content, once the storage has returned it instead of a range
+        self.content = None
+        self.executor = ThreadPoolExecutor(max_workers=max(1,readAhead))
+        # transfer granting the bytes of the range requests, closed with the file
+        self.transfer = bf.scheduler.transfer('download',priority,str(fid))
+        #
+        # the size is known once the first block has been fetched
+        self.size = None
+        try:
+            self._getBlock(0)
+            if self.size is None:
+                raise IOError('Unable to find the size of file {} in package {}'.format(fid,pid))
+            #end if
+        except BaseException:
+            self.close()
+            raise
+        #end try
+    #end __init__
+
+
+    def _fetch(self,block):
+        """
+        fetch a block with a range request, retrying once with a new signed url if the cached one is rejected
+
+        :param block: block number
+        :return: block content
+        """
+        start = block * self.blockSize
+        end = start + self.blockSize - 1
+        for attempt in range(2):
+            response = self.bf._storageRequest(
+                'read_range',
+                'GET',
+                self.bf._getFileUrl(self.pid,self.fid),
+                headers={'Range' : 'bytes={}-{}'.format(start,end)},
+                stream=True)
+            with response:
+                if response.status_code == 403 and attempt == 0:
+                    self.bf._invalidateFileUrl(self.pid,self.fid)
+                    continue
+                #end if
+                # the content is read, block by block as the scheduler grants it, before the response is closed
+                content = self.bf._readContent(response,self.transfer if response.status_code in (200,206) else None)
+            #end with
+            break
+        #end for
+
+        if response.status_code == 416:
+            # past the end of the file
+            match = re.match(r'^bytes \*/(\d+)$',response.headers.get('Content-Range',''))
+            if match and self.size is None:
+                self.size = int(match.group(1))
+            #end if
+            return b''
+        #end if
+        response.raise_for_status()
+
+        if response.status_code == 206:
+            match = re.match(r'^bytes \d+-\d+/(\d+)$',response.headers.get('Content-Range',''))
+            if match and self.size is None:
+                self.size = int(match.group(1))
+            #end if
+            return content
+        #end if
+
+        # the storage ignored the range and returned the whole content:
+        # keep it, so the other blocks are not downloaded again
+        with self.lock:
+            self.content = content
+            self.size = len(self.content)
+            self.blocks.clear()
+        #end with
+        return self.content[start:end + 1]
+    #end _fetch
+
+
+    def _getBlock(self,block):
+        """
+        return a block from the cache, waiting for it if it is being fetched, or fetching it
+
+        :param block: block number
+        :return: block content
+        """
+        with self.lock:
+            if self.content is not None:
+                return memoryview(self.content)[block * self.blockSize:(block + 1) * self.blockSize]
+            #end if
+            if block in self.blocks:
+                self.blocks.move_to_end(block)
+                return self.blocks[block]
+            #end if
+            future = self.pending.get(block)
+        #end with
+
+        content = None
+        if future is not None:
+            try:
+                content = future.result()
+            except Exception:
+                # the background fetch failed, try again here
+                pass
+            #end try
+        #end if
+        if content is None:
+            content = self._fetch(block)
+        #end if
+        self._store(block,content)
+        return content
+    #end _getBlock
+
+
+    def _store(self,block,content):
+        """
+        save a block in the cache, dropping the least recently used ones
+
+        :param block: block number
+        :param content: block content
+        :return: None
+        """
+        with self.lock:
+            self.pending.pop(block,None)
+            self.blocks[block] = content
+            self.blocks.move_to_end(block)
+            while len(self.blocks) > self.cacheBlocks:
+                self.blocks.popitem(last=False)
+            #end while
+        #end with
+    #end _store
+
+
+    def _prefetch(self,block):
+        """
+        fetch the blocks following the one given in the background
+
+        :param block: block just read
+        :return: None
+        """
+        lastBlock = (self.size - 1) // self.blockSize
+        with self.lock:
+            if self.content is not None:
+                return
+            #end if
+            for following in range(block + 1,min(block + self.readAhead,lastBlock) + 1):
+                if following not in self.blocks and following not in self.pending:
+                    future = self.executor.submit(self._fetch,following)
+                    future.add_done_callback(
+                        lambda future, following=following:
+                            self._store(following,future.result()) if future.exception() is None else None)
+                    self.pending[following] = future
+                #end if
+            #end for
+        #end with
+    #end _prefetch
+
+
+    def readable(self):
+        return True
+    #end readable
+
+
+    def seekable(self):
+        return True
+    #end seekable
+
+
+    def tell(self):
+        return self.position
+    #end tell
+
+
+    def seek(self,offset,whence=io.SEEK_SET):
+        """
+        move the position in the file
+
+        :param offset: offset
+        :param whence: io.SEEK_SET, io.SEEK_CUR or io.SEEK_END. Default: io.SEEK_SET
+        :return: new position
+        """
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError('invalid whence {}'.format(whence))
+        #end if
+        if position < 0:
+            raise ValueError('negative seek position {}'.format(position))
+        #end if
+        self.position = position
+        return self.position
+    #end seek
+
+
+    def readinto(self,buffer):
+        """
+        read up to len(buffer) bytes into buffer from the current position
+
+        :param buffer: writable bytes-like object
+        :return: number of bytes read, 0 at the end of the file
+        """
+        if self.closed:
+            raise ValueError('I/O operation on closed file')
+        #end if
+        view = memoryview(buffer).cast('B')
+        length = min(len(view),max(0,self.size - self.position))
+        done = 0
+        while done < length:
+            block, offset = divmod(self.position + done,self.blockSize)
+            content = self._getBlock(block)
+            count = min(length - done,len(content) - offset)
+            if count <= 0:
+                break
+            #end if
+            view[done:done + count] = content[offset:offset + count]
+            done += count
+
+            # read ahead when the blocks are read in order
+            if self.readAhead > 0 and self.lastBlock is not None and block in (self.lastBlock,self.lastBlock + 1):
+                self._prefetch(block)
+            #end if
+            self.lastBlock = block
+        #end while
+        self.position += done
+        return done
+    #end readinto
+
+
+    def close(self):
+        """
+        close the file, drop the cached blocks and unregister its transfer
+
+        :return: None
+        """
+        if not self.closed:
+            self.executor.shutdown(wait=True)
+            with self.lock:
+                self.blocks.clear()
+                self.pending.clear()
+                self.content = None
+            #end with
+            self.transfer.close()
+        #end if
+        io.RawIOBase.close(self)
+    #end close
+
+#end bf_remote_file
@@ -4,15 +4,80 @@
 
 # import libraries
 import requests
+from requests.adapters import HTTPAdapter
 import os
+import shutil
 import hashlib
 import threading
-import uuid
+import json
+import time
+import random
+import email.utils
+import calendar
+import urllib.parse
+import tempfile
+import contextlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from bf_metrics import bf_metrics
+from bf_operations import bf_operations
+from bf_limiter import bf_limiter
+from bf_chunks import bf_chunk_source, bf_buffer_source, bf_stream_source, bytesView
+from bf_remote_file import bf_remote_file
+from bf_cache import bf_content_cache
+from bf_table import bf_package_table
+from bf_scheduler import bf_scheduler
+
+try:
+    import fcntl
+except ImportError:
+    # no inter-process locking on this platform
+    fcntl = None
+#end try
+
+
+class bf_auth_error(IOError):
+    """
+    raised when blackfynn rejects the api key and secret, or answers without a session token
+    """
+    pass
+#end bf_auth_error
+
+
+def retryDelay(response,retries,backoffBase,backoffMax):
+    """
+    return how long to wait before retrying a request, as done by bf_rest and bf_async.
+    The Retry-After header is honored when present, otherwise the delay is
+    a random value up to an exponential backoff (full jitter)
+
+    :param response: response object with the headers, None if the request raised an exception
+    :param retries: times the request has been retried so far
+    :param backoffBase: seconds of the backoff of the first retry
+    :param backoffMax: maximum seconds to wait
+    :return: seconds to wait
+    """
+    if response is not None and 'Retry-After' in response.headers:
+        retryAfter = response.headers['Retry-After']
+        try:
+            return min(backoffMax,max(0.0,float(retryAfter)))
+        except ValueError:
+            try:
+                retryAt = email.utils.parsedate_to_datetime(retryAfter).timestamp()
+                return min(backoffMax,max(0.0,retryAt - time.time()))
+            except (TypeError,ValueError):
+                pass
+            #end try
+        #end try
+    #end if
+
+    return random.uniform(0,min(backoffMax,backoffBase * 2 ** retries))
+#end retryDelay
+
 
 # dictionary with all the requests that we use
 class bf_rest:
 
-    def __init__(self, api_key,api_secret):
+    def __init__(self, api_key,api_secret,poolConnections=10,poolSize=10,poolBlock=False,keepAlive=True,apiUrl='https://api.blackfynn.io'):
         """
         When instantiated, this class saves the api key and secret,
         which can be obtained from user account settings
@@ -20,6 +85,12 @@ class bf_rest:
 
         :param api_key: blackfynn api key
         :param api_secret: blackfynn api secret
+        :param poolConnections: number of per-host connection pools kept by the http sessions. Default: 10
+        :param poolSize: maximum number of connections kept alive for each host. Default: 10.
+                         The storage session keeps at least bulkDownloadWorkers * downloadWorkers
+        :param poolBlock: block when all the connections to a host are in use instead of opening extra ones. Default: False
+        :param keepAlive: reuse connections across requests. Default: True
+        :param apiUrl: base url of blackfynn web api, e.g. to use a local mock server. Default: https://api.blackfynn.io
         """
         self.api_key = api_key
         self.api_secret = api_secret
@@ -27,53 +98,430 @@ class bf_rest:
         self.tokenExpires = 0
         self.sessionValid = False
         self.expirationMargin = 0.75
-        self.currentOperationsCounter = 0
-        self.currentOperationsList = []
         self.organization = ''
         self.lastResponse = None
-        self.urls = {
-            'init_session'            : 'https://api.blackfynn.io/account/api/session',
-            'get_datasets'            : 'https://api.blackfynn.io/datasets/',
-            'get_dataset'             : 'https://api.blackfynn.io/datasets/<DID>',
-            'create_dataset'          : 'https://api.blackfynn.io/datasets',
-            'set_dataset_description' : 'https://api.blackfynn.io/datasets/<DID>/readme',
-            'get_dataset_description' : 'https://api.blackfynn.io/datasets/<DID>/readme',
-            'create_package'          : 'https://api.blackfynn.io/packages',
-            'get_packages'            : 'https://api.blackfynn.io/datasets/<DID>/packages',
-            'get_file'                : 'https://api.blackfynn.io/packages/<PID>/files/<FID>',
-            'upload_preview'          : 'https://api.blackfynn.io/upload/preview/organizations/<OID>',
-            'upload_chunk'            : 'https://api.blackfynn.io/upload/chunk/organizations/<OID>/id/<IID>',
-            'upload_complete'         : 'https://api.blackfynn.io/upload/complete/organizations/<OID>/id/<IID>',
-            'upload_status'           : 'https://api.blackfynn.io/upload/status/organizations/<OID>/id/<IID>',
-        }
+        # latency, throughput and error metrics of every operation
+        self.metrics = bf_metrics()
+        # operations in flight, with their progress
+        self.operations = bf_operations()
+        self.urls = self.apiUrls(apiUrl)
         self.pageSize = 1000
         self.chunkSize = 5000000
+        # number of chunks uploaded concurrently
+        self.uploadWorkers = 4
+        # maximum number of bytes read from disk and not yet uploaded
+        self.uploadMemoryBudget = 100000000
+        # maximum number of files included in a single upload preview
+        self.previewBatchSize = 500
+        # number of concurrent collections created and checksums computed when syncing a directory or creating collection trees
+        self.syncWorkers = 8
+        # file where the checksums of local files are cached
+        self.checksumCacheFile = os.path.join(os.path.expanduser('~'),'.bf_rest','checksums.json')
+        # folder where the state of resumable uploads is saved
+        self.resumeDir = os.path.join(os.path.expanduser('~'),'.bf_rest','uploads')
+        # block size used when streaming downloads to disk
+        self.downloadBlockSize = 1048576
+        # number of ranges downloaded concurrently for large files
+        self.downloadWorkers = 4
+        # files at least this large are downloaded in parallel ranges
+        self.rangeThreshold = 67108864
+        # size of each range
+        self.rangeSize = 16777216
+        # number of files downloaded concurrently by downloadDataset and downloadCollection
+        self.bulkDownloadWorkers = 8
+        #
+        # cache of signed file urls: (package id, file id) -> (url, expiration)
+        self.fileUrlCache = OrderedDict()
+        self.fileUrlCacheLock = threading.Lock()
+        self.fileUrlCacheSize = 10000
+        # seconds a signed url is assumed to be valid for, when it does not say
+        self.fileUrlTtl = 300
+        # seconds before the expiration a cached url is not used anymore
+        self.fileUrlMargin = 30
+        # number of signed urls resolved concurrently by resolveFileUrls
+        self.urlResolveWorkers = 8
+        # local content cache, disabled until enableContentCache is called
+        self.contentCache = None
+        # bandwidth limits and priorities shared by all the chunk uploads and file downloads
+        self.scheduler = bf_scheduler()
+
+        #
+        # pooled http sessions.
+        # the api session carries the authentication headers and parameters,
+        # the storage session is used for signed urls, which must not carry them
+        self.poolConnections = poolConnections
+        self.poolSize = poolSize
+        self.poolBlock = poolBlock
+        self.keepAlive = keepAlive
+        self.session = self._createSession()
+        # the storage pool keeps a connection for every range of every file downloaded at the same time
+        self.storagePoolSize = self._storagePoolSize()
+        self.storageSession = self._createSession(self.storagePoolSize)
+        # lock used to update the session token and the default authentication
+        self.sessionLock = threading.Lock()
+        # lock used to renew the session token one thread at a time,
+        # and timer renewing the session token ahead of its expiration
+        self.renewLock = threading.RLock()
+        self.renewTimer = None
+        # seconds to wait before trying again a failed renewal
+        self.renewRetryDelay = 30
+        #
+        # retry policy.
+        # throttled requests are always retried, other server errors only when it is safe
+        self.maxRetries = 5
+        self.backoffBase = 0.5
+        self.backoffMax = 60.0
+        self.throttleStatuses = {429,503}
+        self.retryStatuses = {429,500,502,503,504}
+        self.idempotentOperations = {'upload_chunk'}
+        # adaptive concurrency of chunk uploads and package listing.
+        # Chunk uploads never exceed the threads uploading them, so neither does their limit
+        self.uploadLimiter = bf_limiter(self.uploadWorkers,maximum=self.uploadWorkers)
+        self.listingLimiter = bf_limiter(4)
 
         #
         # instantiate the threading condition using by the initSession
         # to notify all the users that the session token has been updated
         self.sessionUpdatedCondition = threading.Condition()
-        #
-        # lock used to update how many operation are currently running
-        self.currentOperationsLock = threading.Lock()
-        # condition used to notify all the processes waiting for all current operations to finish
-        self.currentOperationsCondition = threading.Condition()
+
+
+    @staticmethod
+    def apiUrls(apiUrl):
+        """
+        build the dictionary with the urls of all the requests that we use
+
+        :param apiUrl: base url of blackfynn web api
+        :return: dictionary request name -> url
+        """
+        return {
+            'init_session'            : apiUrl + '/account/api/session',
+            'get_datasets'            : apiUrl + '/datasets/',
+            'get_dataset'             : apiUrl + '/datasets/<DID>',
+            'create_dataset'          : apiUrl + '/datasets',
+            'set_dataset_description' : apiUrl + '/datasets/<DID>/readme',
+            'get_dataset_description' : apiUrl + '/datasets/<DID>/readme',
+            'create_package'          : apiUrl + '/packages',
+            'get_packages'            : apiUrl + '/datasets/<DID>/packages',
+            'get_package'             : apiUrl + '/packages/<PID>',
+            'get_package_sources'     : apiUrl + '/packages/<PID>/sources',
+            'get_file'                : apiUrl + '/packages/<PID>/files/<FID>',
+            'delete_packages'         : apiUrl + '/data/delete',
+            'upload_preview'          : apiUrl + '/upload/preview/organizations/<OID>',
+            'upload_chunk'            : apiUrl + '/upload/chunk/organizations/<OID>/id/<IID>',
+            'upload_complete'         : apiUrl + '/upload/complete/organizations/<OID>/id/<IID>',
+            'upload_status'           : apiUrl + '/upload/status/organizations/<OID>/id/<IID>',
+        }
+    #end apiUrls
+
+
+    def _createSession(self,poolSize=None):
+        """
+        create a requests session with a connection pool mounted for http and https
+
+        :param poolSize: (optional) maximum number of connections kept alive for each host. Default: poolSize
+        :return: requests.Session object
+        """
+        session = requests.Session()
+        self._mountPool(session,poolSize if poolSize is not None else self.poolSize)
+        if not self.keepAlive:
+            session.headers['Connection'] = 'close'
+        #end if
+
+        return session
+    #end _createSession
+
+
+    def _mountPool(self,session,poolSize):
+        """
+        mount a connection pool for http and https on a session, replacing the current one
+
+        :param session: requests.Session object
+        :param poolSize: maximum number of connections kept alive for each host
+        :return: None
+        """
+        adapter = HTTPAdapter(
+            pool_connections = self.poolConnections,
+            pool_maxsize = poolSize,
+            pool_block = self.poolBlock
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+    #end _mountPool
+
+
+    def _storagePoolSize(self):
+        """
+        return the connections needed by the storage session:
+        one for each range of each file downloaded concurrently, and at least poolSize
+
+        :return: number of connections
+        """
+        return max(self.poolSize,self.bulkDownloadWorkers * self.downloadWorkers)
+    #end _storagePoolSize
+
+
+    def _ensureStoragePool(self):
+        """
+        grow the storage connection pool if bulkDownloadWorkers or downloadWorkers have been raised
+        since it was created, so concurrent downloads do not open and discard extra connections.
+        Must be called before starting the downloads
+
+        :return: None
+        """
+        poolSize = self._storagePoolSize()
+        if poolSize > self.storagePoolSize:
+            self.storagePoolSize = poolSize
+            self._mountPool(self.storageSession,poolSize)
+        #end if
+    #end _ensureStoragePool
+
+
+    def _setSessionToken(self,token):
+        """
+        save the session token and set it as default authentication
+        for all the requests placed through the api session
+
+        :param token: blackfynn session token
+        :return: None
+        """
+        with self.sessionLock:
+            self.sessionToken = token
+            self.session.headers['Authorization'] = 'Bearer ' + token
+            self.session.params['api_key'] = token
+        #end with
+    #end _setSessionToken
+
+
+    def _retryDelay(self,response,retries):
+        """
+        return how long to wait before retrying a request, as described in retryDelay
+
+        :param response: requestsResponse object, None if the request raised an exception
+        :param retries: times the request has been retried so far
+        :return: seconds to wait
+        """
+        return retryDelay(response,retries,self.backoffBase,self.backoffMax)
+    #end _retryDelay
+
+
+    def _send(self,session,operation,method,url,limiter=None,**kwargs):
+        """
+        place a request, retrying it with backoff when it is throttled or fails transiently.
+        Throttled requests (429, 503) are always retried, since they have not been processed.
+        Other server errors and connection errors are retried only for idempotent methods
+        and for the operations listed in idempotentOperations.
+        A request rejected with 401 by the api renews the session token and is retried once.
+        The request is recorded in the metrics under the operation name.
+        Streamed requests are recorded when the response is closed,
+        so their latency and bytes received cover the body actually read
+
+        :param session: requests session used to place the request
+        :param operation: name of the logical operation
+        :param method: http method
+        :param url: request url
+        :param limiter: (optional) bf_limiter bounding the concurrency of this kind of requests,
+                        which is notified of successes and throttles
+        :param kwargs: any other argument accepted by requests
+        :return: requestsResponse object
+        """
+        retries = 0
+        renewed = False
+        idempotent = method in ('GET','HEAD','PUT','DELETE') or operation in self.idempotentOperations
+        started = time.perf_counter()
+        while True:
+            response = None
+            token = self.sessionToken
+            if limiter is not None:
+                limiter.acquire()
+            #end if
+            try:
+                response = session.request(method,url,**kwargs)
+                # the limiter is told the outcome while the request still counts as in flight
+                if limiter is not None:
+                    if response.status_code in self.throttleStatuses:
+                        limiter.onThrottle()
+                    elif response.status_code < 500:
+                        limiter.onSuccess()
+                    #end if
+                #end if
+            except (requests.exceptions.ConnectionError,requests.exceptions.Timeout):
+                if not idempotent or retries >= self.maxRetries:
+                    self.metrics.record(operation,None,time.perf_counter() - started,retries=retries)
+                    raise
+                #end if
+            except Exception:
+                self.metrics.record(operation,None,time.perf_counter() - started,retries=retries)
+                raise
+            finally:
+                if limiter is not None:
+                    limiter.release()
+                #end if
+            #end try
+
+            if response is not None:
+                throttled = response.status_code in self.throttleStatuses
+
+                if session is self.session and response.status_code == 401 \
+                        and url != self.urls['init_session'] and token and not renewed:
+                    # the token expired or was revoked before being renewed.
+                    # Renew it, unless another thread already did, and try once more
+                    response.close()
+                    self._renewExpiredToken(token)
+                    renewed = True
+                    retries += 1
+                    continue
+                #end if
+
+                retryable = throttled or (idempotent and response.status_code in self.retryStatuses)
+                if not retryable or retries >= self.maxRetries:
+                    break
+                #end if
+                response.close()
+            #end if
+
+            # wait and try again
+            time.sleep(self._retryDelay(response,retries))
+            retries += 1
+        #end while
+
+        if kwargs.get('stream'):
+            self._recordOnClose(response,operation,started,retries)
+        else:
+            self.metrics.record(
+                operation,
+                response.status_code,
+                time.perf_counter() - started,
+                self._bodySize(response.request.body),
+                len(response.content),
+                retries)
+        #end if
+        return response
+    #end _send
+
+
+    def _recordOnClose(self,response,operation,started,retries):
+        """
+        record a streamed response in the metrics once it is closed,
+        with the time elapsed until then and the bytes read from its body
+
+        :param response: requestsResponse object placed with stream=True
+        :param operation: name of the logical operation
+        :param started: time the request was first placed, from time.perf_counter
+        :param retries: times the request has been retried
+        :return: None
+        """
+        close = response.close
+        recorded = threading.Event()
+
+        def closeAndRecord():
+            if not recorded.is_set():
+                recorded.set()
+                self.metrics.record(
+                    operation,
+                    response.status_code,
+                    time.perf_counter() - started,
+                    self._bodySize(response.request.body),
+                    response.raw.tell() if hasattr(response.raw,'tell') else 0,
+                    retries)
+            #end if
+            close()
+        #end closeAndRecord
+
+        response.close = closeAndRecord
+    #end _recordOnClose
+
+
+    def _request(self,operation,method,url,limiter=None,**kwargs):
+        """
+        place a request with blackfynn web api through the pooled api session.
+        Authentication headers and parameters are added by the session.
+        The request is retried and recorded in the metrics as described in _send
+
+        :param operation: name of the logical operation, usually the key of the url in urls
+        :param method: http method
+        :param url: request url
+        :param limiter: (optional) bf_limiter bounding the concurrency of this kind of requests
+        :param kwargs: any other argument accepted by requests
+        :return: requestsResponse object
+        """
+        response = self._send(self.session,operation,method,url,limiter,**kwargs)
+        self.lastResponse = response
+        return response
+    #end _request
+
+
+    def _storageRequest(self,operation,method,url,**kwargs):
+        """
+        place a request to a signed storage url through the pooled storage session.
+        The request is retried and recorded in the metrics as described in _send.
+        Streamed responses must be closed, e.g. with a with statement, to be recorded
+
+        :param operation: name of the logical operation
+        :param method: http method
+        :param url: signed url
+        :param kwargs: any other argument accepted by requests
+        :return: requestsResponse object
+        """
+        return self._send(self.storageSession,operation,method,url,**kwargs)
+    #end _storageRequest
+
+
+    @staticmethod
+    def _bodySize(body):
+        """
+        return the size of a request body
+
+        :param body: request body
+        :return: size in bytes, 0 if it cannot be determined
+        """
+        try:
+            return len(body) if body is not None else 0
+        except TypeError:
+            return 0
+        #end try
+    #end _bodySize
+
+
+    def close(self):
+        """
+        close the http sessions, release all the pooled connections and stop renewing the session token
+
+        :return: None
+        """
+        with self.renewLock:
+            if self.renewTimer is not None:
+                self.renewTimer.cancel()
+                self.renewTimer = None
+            #end if
+        #end with
+        self.session.close()
+        self.storageSession.close()
+    #end close
 
 
     @property
     def initSession(self):
         """
         initiate the session with blackfynn web api using api key and secret
-        provided when the class was instantiated
+        provided when the class was instantiated.
+        The session token is then renewed in the background ahead of its expiration
 
         :return: requestsResponse object
         """
 
-        # set sessionValid flag to false
-        self.sessionValid = False
+        return self._renewSession()
+    #end initSession
+
+
+    def _renewSession(self):
+        """
+        request a new session token and swap it in place of the current one.
+        Requests in flight keep going, the following ones use the new token.
+        A new renewal is scheduled ahead of the token expiration.
+        Credentials rejected with 401 or 403, or a response without a session token, raise bf_auth_error
 
-        # wait for all the current operations to be completed
-        self.waitForCurrentOperations()
+        :return: requestsResponse object
+        """
 
         # curl command to create a session
         # curl 
@@ -85,31 +533,105 @@ class bf_rest:
         #      \"secret\": \"3e929a00-d9cf-4f42-aba0-ed4032648399\"}
         #
 
-        # request new session
-        response = requests.post(
-            self.urls['init_session'],
-            json = {
-                'tokenId' : self.api_key,
-                'secret' : self.api_secret,
-            }
-        )
-        self.lastResponse = response
-        # save session token to be reused for all subsequent requests
-        jsonResponse = response.json()
-        self.sessionToken = jsonResponse['session_token']
-        self.organization = jsonResponse['organization']
-        self.tokenExpires = jsonResponse['expires_in'] * self.expirationMargin
-
-        # start time to re-init session
-        timer = threading.Timer(self.tokenExpires, self.initSession)
-        timer.start()
+        with self.renewLock:
+            try:
+                # request new session
+                response = self._request(
+                    'init_session',
+                    'POST',
+                    self.urls['init_session'],
+                    json = {
+                        'tokenId' : self.api_key,
+                        'secret' : self.api_secret,
+                    }
+                )
+                if response.status_code in (401,403):
+                    raise bf_auth_error('Authentication rejected with status {}'.format(response.status_code))
+                #end if
+                response.raise_for_status()
+                try:
+                    jsonResponse = response.json()
+                    jsonResponse['session_token']
+                except (ValueError,KeyError,TypeError):
+                    raise bf_auth_error('No session token in the response of blackfynn')
+                #end try
+                # save session token to be reused for all subsequent requests
+                self._setSessionToken(jsonResponse['session_token'])
+                self.organization = jsonResponse['organization']
+                self.tokenExpires = jsonResponse['expires_in'] * self.expirationMargin
+                self.sessionValid = True
+                delay = self.tokenExpires
+            except Exception:
+                # once a session has been established, try again shortly, the current token might still be valid.
+                # A first session that fails, e.g. with wrong credentials, is not retried in the background
+                if self.sessionValid:
+                    self._scheduleRenewal(self.renewRetryDelay)
+                #end if
+                raise
+            #end try
+
+            # start timer to renew the session
+            self._scheduleRenewal(delay)
+        #end with
 
         #
         # notify every process waiting on init session
-        self.sessionUpdatedCondition.notify_all()
+        with self.sessionUpdatedCondition:
+            self.sessionUpdatedCondition.notify_all()
+        #end with
 
         # return response
         return response
+    #end _renewSession
+
+
+    def _scheduleRenewal(self,delay):
+        """
+        schedule the renewal of the session token in the background, replacing any renewal already scheduled
+
+        :param delay: seconds before the renewal
+        :return: None
+        """
+        with self.renewLock:
+            if self.renewTimer is not None:
+                self.renewTimer.cancel()
+            #end if
+            self.renewTimer = threading.Timer(delay,self._renewSessionInBackground)
+            self.renewTimer.daemon = True
+            self.renewTimer.start()
+        #end with
+    #end _scheduleRenewal
+
+
+    def _renewSessionInBackground(self):
+        """
+        renew the session token from the timer thread.
+        Failures are retried by _renewSession, so they are not raised any further
+
+        :return: None
+        """
+        try:
+            self._renewSession()
+        except Exception:
+            pass
+        #end try
+    #end _renewSessionInBackground
+
+
+    def _renewExpiredToken(self,token):
+        """
+        renew the session token after it has been rejected,
+        unless it has been renewed already since it was used
+
+        :param token: session token that has been rejected
+        :return: None
+        """
+        with self.renewLock:
+            if self.sessionToken == token:
+                self._renewSession()
+            #end if
+        #end with
+    #end _renewExpiredToken
 
 
     def waitForSessionUpdate(self,timeout=None):
@@ -118,7 +640,9 @@ class bf_rest:
 
         :return: True unless timeout expered
         """
-        return self.sessionUpdatedCondition.wait(timeout)
+        with self.sessionUpdatedCondition:
+            return self.sessionUpdatedCondition.wait(timeout)
+        #end with
 
 
     def waitForCurrentOperations(self,timeout=None):
@@ -127,44 +651,42 @@ class bf_rest:
 
         :return: TRue unless timeout expired
         """
-        return self.currentOperationsCondition.wait(timeout)
+        return self.operations.wait(timeout)
 
 
-    def startOperation(self,name=str(uuid.uuid4())):
+    def startOperation(self,name=None,operationType='operation',size=None):
         """
-        indicates hat we are starting an operation with blackfynn web api
-        Increment the counter and insert name in list
+        indicates that we are starting an operation with blackfynn web api.
+        The operation is registered in operations, where its progress can be followed
 
-        :param name:(optional) name of the operation
-        :return:
+        :param name: (optional) id of the operation. A new unique id is generated if not passed
+        :param operationType: (optional) type of the operation. Default: operation
+        :param size: (optional) total bytes the operation is expected to transfer
+        :return: id of the operation
         """
-        self.currentOperationsLock.acquire()
-        self.currentOperationsCounter += 1
-        self.currentOperationsList.append(name)
-        self.currentOperationsLock.release()
-
-        return name
+        return self.operations.start(operationType,name,size)
 
 
-    def stopOperation(self, name):
+    def operationProgress(self,name,count):
         """
-        indicates hat we are starting an operation with blackfynn web api
-        Increment the counter and insert name in list
+        indicates that an operation has transferred some more bytes
 
-        :param name:(optional) name of the operation
-        :return:
+        :param name: id of the operation
+        :param count: bytes transferred since the last update
+        :return: None
         """
-        if self.currentOperationsCounter > 0:
-            self.currentOperationsLock.acquire()
-            self.currentOperationsCounter -= 1
-            self.currentOperationsList.remove(name)
-            self.currentOperationsLock.release()
-        #end if
+        self.operations.progress(name,count)
 
-        # notify all the threads that are waiting for current operations to finish
-        self.currentOperationsCondition.notify_all()
 
-        return self.currentOperationsCounter
+    def stopOperation(self, name):
+        """
+        indicates that an operation with blackfynn web api is over,
+        and notifies all the threads waiting for current operations to finish
+
+        :param name: id of the operation
+        :return: number of operations still running
+        """
+        return self.operations.stop(name)
 
 
     def getDatasets(self):
@@ -175,14 +697,12 @@ class bf_rest:
         """
 
         # place the correct request
-        response = requests.get(
-            self.urls['get_datasets'],
-            params={
-                'api_key' : self.sessionToken
-            }
+        response = self._request(
+            'get_datasets',
+            'GET',
+            self.urls['get_datasets']
         )
         # returns the json format of the answer
-        self.lastResponse = response
         return response.json()
 
 
@@ -198,15 +718,13 @@ class bf_rest:
         url = self.urls['get_dataset'].replace('<DID>',did)
 
         # execute request
-        response = requests.get(
-            url,
-            params={
-                'api_key' : self.sessionToken
-            }
+        response = self._request(
+            'get_dataset',
+            'GET',
+            url
         )
 
         # return json dictionary if successful, plain response if not
-        self.lastResponse = response
         return response.json() if response.status_code == 200 else response.content
     # end getDataset
 
@@ -237,15 +755,13 @@ class bf_rest:
             "contributors": contributors,
             "automaticallyProcessPackages": processPackages }
 
-        response = requests.post(
+        response = self._request(
+            'create_dataset',
+            'POST',
             url,
-            params={
-                'api_key': self.sessionToken
-            },
             json=payload
         )
 
-        self.lastResponse = response
         return response
     #end createDataset
 
@@ -262,15 +778,13 @@ class bf_rest:
         url = self.urls['get_dataset_description'].replace('<DID',did)
 
         # execute requests
-        response = requests.get(
-            url,
-            params={
-                'api_key': self.sessionToken
-            }
+        response = self._request(
+            'get_dataset_description',
+            'GET',
+            url
         )
 
         # return true if successful. False otherwise
-        self.lastResponse = response
         return response.content
 
 
@@ -293,16 +807,14 @@ class bf_rest:
         }
 
         # execute requests
-        response = requests.put(
+        response = self._request(
+            'set_dataset_description',
+            'PUT',
             url,
-            params={
-                'api_key': self.sessionToken
-            },
             json=payload
         )
 
         # return true if successful. False otherwise
-        self.lastResponse = response
         return (response.status_code == 200)
 
 
@@ -369,185 +881,1215 @@ class bf_rest:
         # url
         url = self.urls['create_package']
         # post the request
-        response = requests.post(
+        response = self._request(
+            'create_package',
+            'POST',
             url,
-            params = {
-                'api_key' : self.sessionToken
-            },
             json = payload
         )
 
         # return json dictionary if successful, plain response if not
-        self.lastResponse = response
         return response.json() if response.status_code == 201 else response.content
     # end createCollection
 
 
-    def getPackages(self,did,files=False,visual=False):
+    def _getPackagesPage(self,url,files,cursor=None):
         """
-        Retrieve all the packages in this dataset and returns the dictionary
+        Retrieve one page of packages
+
+        :param url: packages url of the dataset
+        :param files: retrieve source files too
+        :param cursor: cursor returned with the previous page. None for the first page
+        :return: dictionary with the packages and, if there are more pages, the cursor to the next one
+        """
+
+        params = {
+            'pageSize' : self.pageSize,
+            'includeSourceFiles' : files,
+        }
+        if cursor is not None:
+            params['cursor'] = cursor
+        #end if
+
+        # place get request
+        # and extract response in json format
+        return self._request(
+            'get_packages',
+            'GET',
+            url,
+            limiter=self.listingLimiter,
+            params = params
+        ).json()
+    #end _getPackagesPage
+
+
+    def iterPackages(self,did,files=False,visual=False):
+        """
+        Iterate over all the packages in this dataset as the pages are retrieved.
+        The next page is requested in the background while the current one is being consumed
 
         :param did: blackfynn dataset id
         :param files: retrieve source files too. Default: False
         :param visual: provide visual feedback for each request placed. Default: False
-        :return: dictionary containing all the packages contained in this dataset
+        :return: generator of dictionaries, one for each package contained in this dataset
         """
 
         # define get url
         url = self.urls['get_packages'].replace('<DID>',did)
-        # place get request
-        rawResponse = requests.get(
-            url,
-            params = {
-                'pageSize' : self.pageSize,
-                'includeSourceFiles' : files,
-                'api_key' : self.sessionToken
-            }
-        )
-        # extract response in json format
-        self.lastResponse = rawResponse
-        response = rawResponse.json();
-        # extract data from response
-        data = response['packages']
-        self._provide_visual(visual)
-        # we get only the first n packages with the first call
-        # now we keep looping to get all the others
-        while 'cursor' in response.keys():
-            # place next request for next batch of packages
-            rawResponse = requests.get(
-                url,
-                params = {
-                    'pageSize' : self.pageSize,
-                    'includeSourceFiles' : files,
-                    'api_key' : self.sessionToken,
-                    'cursor' : response['cursor']
-                }
-            )
-            # extract response
-            self.lastResponse = rawResponse
-            response = rawResponse.json()
-            # append data
-            data += response['packages']
-            self._provide_visual(visual)
-        # end while
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            # we get only the first n packages with the first call
+            # now we keep looping to get all the others
+            nextPage = executor.submit(self._getPackagesPage,url,files)
+            while nextPage is not None:
+                response = nextPage.result()
+                self._provide_visual(visual)
+                # place next request for next batch of packages
+                # before handing out the current one
+                nextPage = executor.submit(self._getPackagesPage,url,files,response['cursor']) \
+                    if 'cursor' in response.keys() \
+                    else None
+                for package in response['packages']:
+                    yield package
+                #end for
+            # end while
+        #end with
+    #end iterPackages
+
+
+    def getPackages(self,did,files=False,visual=False):
+        """
+        Retrieve all the packages in this dataset and returns the dictionary
+
+        :param did: blackfynn dataset id
+        :param files: retrieve source files too. Default: False
+        :param visual: provide visual feedback for each request placed. Default: False
+        :return: dictionary containing all the packages contained in this dataset
+        """
 
         # return all the data retrieved
-        return data
+        return list(self.iterPackages(did,files,visual))
     #end getPackages
 
 
-    def getFileContent(self,pid,fid):
+    def getPackageTable(self,did,files=False,visual=False):
+        """
+        Retrieve all the packages in this dataset into a compact bf_package_table.
+        Packages are added to the table as each page is retrieved, so their dictionaries are not kept
+
+        :param did: blackfynn dataset id
+        :param files: retrieve source files too. Default: False
+        :param visual: provide visual feedback for each request placed. Default: False
+        :return: bf_package_table object
+        """
+
+        table = bf_package_table()
+        for package in self.iterPackages(did,files,visual):
+            table.add(package)
+        #end for
+        return table
+    #end getPackageTable
+
+
+    def getPackage(self,pid):
         """
-        Retrieve the file content, given the package and file id
+        Retrieve a single package
 
         :param pid: blackfynn package id
-        :param fid: balckfynn file id
-        :return:
+        :return: package dictionary if successful, plain response if not
         """
 
-        # test retrieving a file
-        url = self.urls['get_file'].replace('<PID>',pid).replace('<FID>',str(fid))
-        # get url to the file
-        rawResponse = requests.get(
-            url,
-            params = {
-                'api_key' : self.sessionToken,
-            }
+        url = self.urls['get_package'].replace('<PID>',pid)
+        response = self._request(
+            'get_package',
+            'GET',
+            url
         )
-        self.lastResponse = rawResponse
-        # get file content
-        fc = requests.get(rawResponse.json()['url'])
-        # return content as it is
-        return fc.content
-    #end getFileContent
 
+        # return json dictionary if successful, plain response if not
+        return response.json() if response.status_code == 200 else response.content
+    #end getPackage
 
-    def downloadFile(self,pid,fid,filename):
+
+    def getPackageSources(self,pid):
         """
-        Download file and save it with the file name given
+        Retrieve the source files of a package
 
         :param pid: blackfynn package id
-        :param fid: blackfynn file id
-        :param filename: local file path
-        :return: none
+        :return: list of dictionaries, one for each source file, if successful, plain response if not
         """
 
-        # open file in writing
-        with open(filename,'wb') as fh:
-            # retrieve file content
-            # and save it in the file just opened
-            fh.write(
-                self.getFileContent(pid,fid)
-            )
-        # end with
-    # end downloadFile
+        url = self.urls['get_package_sources'].replace('<PID>',pid)
+        response = self._request(
+            'get_package_sources',
+            'GET',
+            url
+        )
 
-    def uploadFile(self,did,path,filename,cid=None,oid=None):
-        """
-        upload the local file to the blackfynn container with the specified name
+        # return json dictionary if successful, plain response if not
+        return response.json() if response.status_code == 200 else response.content
+    #end getPackageSources
 
-        :param did: blackfynn id of the dataset where the file should be saved
-        :param path: local path to the file being uploaded
-        :param filename: file name on blackfynn
-        :param cid: blackfynn id of the collection where the file should be saved
-        :param oid: blackfynn id of the organization. If not passed, it will used the organization id saved when session was initialized
 
-        :return: dictionary containing the info provided by blackfynn when the upload has been complete
+    def deletePackages(self,pids):
         """
+        Delete packages, or collections with all their content
 
-        # check oid
-        if oid is None:
-            oid = self.organization
-        #end if
+        :param pids: list of blackfynn package or collection ids
+        :return: dictionary with the ids deleted under success and the ones that could not be under failures
+                 if successful, plain response if not
+        """
 
-        # create an upload preview
         # POST
-        # https://api.blackfynn.io/
-        #   upload/
-        #   preview/
-        #   organizations/
-        #   N:organization:618e8dd9-f8d2-4dc4-9abb-c6aaab2e78a0
-        #     ?
-        #     append=false&
-        #     dataset_id=422&
-        #     destinationId=N:collection:045bb60b-540c-42d7-9090-855d5aed87d9
-        #
-        #  or
-        # https://api.blackfynn.io/
-        #   upload/
-        #   preview/
-        #   organizations/
-        #   N:organization:618e8dd9-f8d2-4dc4-9abb-c6aaab2e78a0
-        #     ?
-        #     append=false&
-        #     dataset_id=422
+        # https://api.blackfynn.io/data/delete
         #
-        #  payload
-        # {
-        #  "files" : [
-        #   {
-        #    "uploadId" : 0,
-        #    "fileName" : "mdfObjTemplate.json",
-        #    "size" : 606,
-        #    "importId" : "038694bb0-fcac-11e9-b50c-6595234c9b76",
-        #    "processing":true,
-        #    "file" : {
-        #     "uploadId" : 0
-        #    }
-        #   }
-        #  ]
-        # }
+        # payload
+        # {"things" : ["N:package:ae7f0109-91ba-49bf-9852-832b07c2ba00"]}
         #
         # Response
-        # {
-        #  "packages" : [
-        #   {
-        #    "files" : [
-        #     {
-        #      "uploadId":1,
-        #      "fileName":"mdfObjTemplate.json",
-        #      "size":606,
-        #      "multipartUploadId":"iQ41EO3fi92hTv33ON57gJijn8C9OuXQ71SCyRsWuZ8TeMFGRNEQ5jP.lEwYiSbTpCkXub97l0DJM4Bkcf9u8XAqJqP35G4dRpdxje6gplDp0oT8rVnDpjS2F_UBdEciC7E3DqcuEMmOB4TGHmyAtZeywbvbtO.2sm8jZGxuyz4-",
+        # {"success" : ["N:package:ae7f0109-91ba-49bf-9852-832b07c2ba00"], "failures" : []}
+        response = self._request(
+            'delete_packages',
+            'POST',
+            self.urls['delete_packages'],
+            json = {'things' : list(pids)}
+        )
+
+        # return json dictionary if successful, plain response if not
+        return response.json() if response.status_code == 200 else response.content
+    #end deletePackages
+
+
+    @staticmethod
+    def packageSourceFiles(package):
+        """
+        Extract the source files from a package retrieved with its source files
+
+        :param package: package dictionary
+        :return: list of dictionaries with the content of each source file
+        """
+        return [
+            source.get('content',source)
+            for source
+            in package.get('objects',{}).get('source',[])
+        ]
+    #end packageSourceFiles
+
+
+    @staticmethod
+    def packagePaths(packages):
+        """
+        Compute the path of each package inside its dataset, joining the names of its ancestors with "/".
+        Parents are matched either by package id or by package integer id
+
+        :param packages: list of package dictionaries of the same dataset
+        :return: dictionary package id -> path
+        """
+
+        # index packages by both ids that can be used as parent id
+        byId = {}
+        for package in packages:
+            content = package['content']
+            byId[content['id']] = content
+            if 'intId' in content:
+                byId[content['intId']] = content
+            #end if
+        #end for
+
+        paths = {}
+        for package in packages:
+            # walk up to the first ancestor with a known path
+            chain = []
+            content = package['content']
+            while content is not None and content['id'] not in paths and len(chain) <= len(packages):
+                chain.append(content)
+                content = byId.get(content.get('parentId'))
+            #end while
+            path = paths[content['id']] if content is not None and content['id'] in paths else ''
+            for content in reversed(chain):
+                path = path + '/' + content['name'] if path else content['name']
+                paths[content['id']] = path
+            #end for
+        #end for
+
+        return paths
+    #end packagePaths
+
+
+    @staticmethod
+    def sourceFileName(source):
+        """
+        Return the name of a source file, including its extension.
+        The name is taken from the storage key when available, since package names have no extension
+
+        :param source: dictionary with the content of the source file
+        :return: file name
+        """
+        if source.get('s3key'):
+            return source['s3key'].rsplit('/',1)[-1]
+        #end if
+        return source.get('name','')
+    #end sourceFileName
+
+
+    def _remoteTree(self,did,cid=None):
+        """
+        Retrieve the collections and the source files of a dataset, or of a collection in it, by path.
+        Paths are relative to the collection, made of the names of the collections separated by "/",
+        followed by the source file name for files.
+        When more than one package holds a file with the same path, e.g. after a file has been uploaded again,
+        the most recently created one is returned, whatever the order the packages are listed in,
+        and the others are returned as duplicates
+
+        :param did: blackfynn dataset id
+        :param cid: blackfynn collection id. If left empty, the whole dataset is retrieved
+        :return: (dictionary path -> collection id,
+                  dictionary path -> (package dictionary, source file content),
+                  dictionary path -> list of older (package dictionary, source file content) with the same path)
+        """
+
+        packages = list(self.iterPackages(did,files=True))
+        paths = self.packagePaths(packages)
+        byId = {}
+        for package in packages:
+            byId[package['content']['id']] = package['content']
+            if 'intId' in package['content']:
+                byId[package['content']['intId']] = package['content']
+            #end if
+        #end for
+
+        # only what is inside the collection requested, with paths relative to it
+        prefix = paths[cid] + '/' if cid is not None else ''
+
+        collections = {'' : cid}
+        files = {}
+        duplicates = {}
+        for package in packages:
+            content = package['content']
+            if not paths[content['id']].startswith(prefix):
+                continue
+            #end if
+            if content.get('packageType') == 'Collection':
+                collections[paths[content['id']][len(prefix):]] = content['id']
+                continue
+            #end if
+            parent = byId.get(content.get('parentId'))
+            parentPath = paths[parent['id']][len(prefix):] if parent is not None else ''
+            for source in self.packageSourceFiles(package):
+                name = self.sourceFileName(source)
+                path = parentPath + '/' + name if parentPath else name
+                if path in files:
+                    # keep the newest, and the others as duplicates
+                    older, newer = sorted([files[path],(package,source)],key=lambda item: self._createdKey(item[0]))
+                    files[path] = newer
+                    duplicates.setdefault(path,[]).append(older)
+                else:
+                    files[path] = (package,source)
+                #end if
+            #end for
+        #end for
+
+        return collections, files, duplicates
+    #end _remoteTree
+
+
+    @staticmethod
+    def _createdKey(package):
+        """
+        return a sort key ordering packages by creation time, then by integer id
+
+        :param package: package dictionary
+        :return: tuple
+        """
+        content = package['content']
+        return (content.get('createdAt') or content.get('updatedAt') or '',content.get('intId') or 0)
+    #end _createdKey
+
+
+    def _fileUrlExpiration(self,url):
+        """
+        Return when a signed url expires, from its X-Amz-Date and X-Amz-Expires or Expires parameters.
+        Urls without them are assumed to be valid for fileUrlTtl seconds
+
+        :param url: signed url
+        :return: expiration time in seconds since the epoch
+        """
+        query = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+        try:
+            if 'X-Amz-Date' in query and 'X-Amz-Expires' in query:
+                signed = calendar.timegm(time.strptime(query['X-Amz-Date'][0],'%Y%m%dT%H%M%SZ'))
+                return signed + int(query['X-Amz-Expires'][0])
+            #end if
+            if 'Expires' in query:
+                return int(query['Expires'][0])
+            #end if
+        except ValueError:
+            pass
+        #end try
+        return time.time() + self.fileUrlTtl
+    #end _fileUrlExpiration
+
+
+    def _getFileUrl(self,pid,fid):
+        """
+        Retrieve the signed url to the file content, given the package and file id.
+        Urls are cached until fileUrlMargin seconds before they expire
+
+        :param pid: blackfynn package id
+        :param fid: blackfynn file id
+        :return: signed url string
+        """
+
+        key = (pid,str(fid))
+        with self.fileUrlCacheLock:
+            cached = self.fileUrlCache.get(key)
+            if cached is not None:
+                if cached[1] - self.fileUrlMargin > time.time():
+                    self.fileUrlCache.move_to_end(key)
+                    return cached[0]
+                #end if
+                del self.fileUrlCache[key]
+            #end if
+        #end with
+
+        # get url to the file
+        url = self.urls['get_file'].replace('<PID>',pid).replace('<FID>',str(fid))
+        rawResponse = self._request(
+            'get_file',
+            'GET',
+            url
+        )
+        fileUrl = rawResponse.json()['url']
+
+        with self.fileUrlCacheLock:
+            self.fileUrlCache[key] = (fileUrl,self._fileUrlExpiration(fileUrl))
+            # drop the least recently used urls
+            while len(self.fileUrlCache) > self.fileUrlCacheSize:
+                self.fileUrlCache.popitem(last=False)
+            #end while
+        #end with
+
+        return fileUrl
+    #end _getFileUrl
+
+
+    def _invalidateFileUrl(self,pid,fid):
+        """
+        Remove the signed url of a file from the cache, e.g. because it has been rejected
+
+        :param pid: blackfynn package id
+        :param fid: blackfynn file id
+        :return: None
+        """
+        with self.fileUrlCacheLock:
+            self.fileUrlCache.pop((pid,str(fid)),None)
+        #end with
+    #end _invalidateFileUrl
+
+
+    def resolveFileUrls(self,files):
+        """
+        Retrieve the signed urls of many files concurrently, with urlResolveWorkers threads.
+        Urls already cached are not requested again
+
+        :param files: list of (package id, file id)
+        :return: dictionary (package id, file id) -> signed url
+        """
+        files = list(files)
+        with ThreadPoolExecutor(max_workers=self.urlResolveWorkers) as executor:
+            urls = list(executor.map(lambda item: self._getFileUrl(*item),files))
+        #end with
+        return dict(zip([tuple(item) for item in files],urls))
+    #end resolveFileUrls
+
+
+    def _cachedContent(self,pid,fid,source=None):
+        """
+        return the path of the cached content of a file, if it matches the size and checksum of the source file.
+        When the source file is not given, it is looked up in the source files of the package, only if the file is cached
+
+        :param pid: blackfynn package id
+        :param fid: blackfynn file id
+        :param source: (optional) dictionary with the content of the source file
+        :return: path to the content, None if not cached, stale or the source file is not found
+        """
+        if self.contentCache.get(pid,fid) is None:
+            return None
+        #end if
+        if source is None:
+            sources = self.getPackageSources(pid)
+            if isinstance(sources,bytes):
+                return None
+            #end if
+            source = next((item['content'] for item in sources if str(item['content']['id']) == str(fid)),None)
+            if source is None:
+                return None
+            #end if
+        #end if
+        return self.contentCache.get(pid,fid,source.get('size'),self._remoteChecksum(source))
+    #end _cachedContent
+
+
+    def getFileContent(self,pid,fid,priority=None,source=None):
+        """
+        Retrieve the file content, given the package and file id.
+        The content is streamed in blocks of downloadBlockSize bytes, each granted by the scheduler before it is read
+
+        :param pid: blackfynn package id
+        :param fid: balckfynn file id
+        :param priority: (optional) priority class in the scheduler. Default: bf_scheduler.NORMAL
+        :param source: (optional) dictionary with the content of the source file, to validate the cached content against.
+                       Retrieved if needed and not given
+        :return:
+        """
+
+        # serve it from the content cache, if enabled and up to date
+        if self.contentCache is not None:
+            cached = self._cachedContent(pid,fid,source)
+            if cached is not None:
+                try:
+                    with open(cached,'rb') as fh:
+                        return fh.read()
+                    #end with
+                except FileNotFoundError:
+                    # evicted in the meantime
+                    pass
+                #end try
+            #end if
+        #end if
+
+        # get file content
+        # signed urls are fetched without the api authentication
+        with self.scheduler.transfer('download',priority,str(fid)) as transfer:
+            for attempt in range(2):
+                with self._storageRequest('get_file_content','GET',self._getFileUrl(pid,fid),stream=True) as fc:
+                    if fc.status_code == 403 and attempt == 0:
+                        # the cached url has been rejected, get a new one
+                        self._invalidateFileUrl(pid,fid)
+                        continue
+                    #end if
+                    content = self._readContent(fc,transfer)
+                    status = fc.status_code
+                #end with
+                break
+            #end for
+        #end with
+        if self.contentCache is not None and status == 200:
+            self.contentCache.store(pid,fid,content)
+        #end if
+        # return content as it is
+        return content
+    #end getFileContent
+
+
+    def openFile(self,pid,fid,blockSize=1048576,cacheBlocks=64,readAhead=4,priority=None):
+        """
+        Open a file for reading without downloading it.
+        The file object returned is read-only and seekable; reads are served with range requests
+        through an LRU cache of blocks, reading ahead when the file is read sequentially.
+        The range requests are granted by the scheduler as one transfer, until the file is closed
+
+        :param pid: blackfynn package id
+        :param fid: blackfynn file id
+        :param blockSize: size of the blocks fetched and cached. Default: 1048576
+        :param cacheBlocks: maximum number of blocks cached. Default: 64
+        :param readAhead: blocks fetched ahead on sequential reads, 0 to disable. Default: 4
+        :param priority: (optional) priority class in the scheduler. Default: bf_scheduler.NORMAL
+        :return: bf_remote_file object
+        """
+        return bf_remote_file(self,pid,fid,blockSize,cacheBlocks,readAhead,priority)
+    #end openFile
+
+
+    def _readBlocks(self,response,transfer=None):
+        """
+        iterate over the content of a streamed response in blocks of downloadBlockSize bytes.
+        Each block is granted by the transfer before it is read from the connection,
+        so a bandwidth limit holds the reads back instead of pausing after them.
+        When the length of the content is known, the last block is granted only the bytes left
+
+        :param response: streamed requestsResponse object
+        :param transfer: (optional) bf_transfer every block is granted by
+        :return: generator of blocks
+        """
+        remaining = None
+        if 'Content-Length' in response.headers and 'Content-Encoding' not in response.headers:
+            remaining = int(response.headers['Content-Length'])
+        #end if
+        while remaining is None or remaining > 0:
+            count = self.downloadBlockSize if remaining is None else min(self.downloadBlockSize,remaining)
+            if transfer is not None:
+                transfer.acquire(count)
+            #end if
+            block = response.raw.read(count,decode_content=True)
+            if not block:
+                break
+            #end if
+            if remaining is not None:
+                remaining -= len(block)
+            #end if
+            yield block
+        #end while
+    #end _readBlocks
+
+
+    def _readContent(self,response,transfer=None):
+        """
+        read the whole content of a streamed response, as described in _readBlocks
+
+        :param response: streamed requestsResponse object
+        :param transfer: (optional) bf_transfer every block is granted by
+        :return: content
+        """
+        return b''.join(self._readBlocks(response,transfer))
+    #end _readContent
+
+
+    def _downloadRange(self,url,filename,start,end,operation=None,transfer=None):
+        """
+        Download the bytes between start and end (inclusive) of the remote file
+        and write them at the same offset in the local file, which must already exist
+
+        :param url: signed url to the file
+        :param filename: local file path
+        :param start: first byte of the range
+        :param end: last byte of the range
+        :param operation: (optional) id of the operation whose progress is updated with every block written
+        :param transfer: (optional) bf_transfer every block is granted by before it is read
+        :return: number of bytes written
+        """
+
+        written = 0
+        with self._storageRequest('download_range','GET',url,headers={'Range' : 'bytes={}-{}'.format(start,end)},stream=True) as response:
+            if response.status_code != 206:
+                response.raise_for_status()
+                raise IOError('Range request not honored for bytes {}-{}'.format(start,end))
+            #end if
+            with open(filename,'r+b') as fh:
+                fh.seek(start)
+                for block in self._readBlocks(response,transfer):
+                    fh.write(block)
+                    written += len(block)
+                    if operation is not None:
+                        self.operations.progress(operation,len(block))
+                    #end if
+                #end for
+            #end with
+        #end with
+
+        if written != end - start + 1:
+            raise IOError('Incomplete range for bytes {}-{}'.format(start,end))
+        #end if
+
+        return written
+    #end _downloadRange
+
+
+    def downloadFile(self,pid,fid,filename,priority=None,source=None):
+        """
+        Download file and save it with the file name given.
+        The content is streamed to disk in blocks of downloadBlockSize bytes.
+        Files larger than rangeThreshold are fetched in parallel ranges of rangeSize bytes
+        by downloadWorkers threads, if the storage supports range requests.
+        If the content cache is enabled, cached files matching the size and checksum of the source file are copied from it
+        and downloaded files are added to it.
+        Every block is granted by the scheduler, which applies the download bandwidth limit and priorities
+
+        :param pid: blackfynn package id
+        :param fid: blackfynn file id
+        :param filename: local file path
+        :param priority: (optional) priority class in the scheduler. Default: bf_scheduler.NORMAL
+        :param source: (optional) dictionary with the content of the source file, to validate the cached content against.
+                       Retrieved if needed and not given
+        :return: none
+        """
+
+        if self.contentCache is not None:
+            cached = self._cachedContent(pid,fid,source)
+            if cached is not None:
+                try:
+                    # copied by the kernel where supported
+                    shutil.copyfile(cached,filename)
+                    return
+                except FileNotFoundError:
+                    # evicted in the meantime
+                    pass
+                #end try
+            #end if
+        #end if
+
+        with self.scheduler.transfer('download',priority,filename) as transfer:
+            try:
+                self._downloadUrl(self._getFileUrl(pid,fid),filename,transfer)
+            except requests.exceptions.HTTPError as error:
+                if error.response is None or error.response.status_code != 403:
+                    raise
+                #end if
+                # the cached url has been rejected, get a new one
+                self._invalidateFileUrl(pid,fid)
+                self._downloadUrl(self._getFileUrl(pid,fid),filename,transfer)
+            #end try
+        #end with
+
+        if self.contentCache is not None:
+            cached = self.contentCache.tempPath()
+            shutil.copyfile(filename,cached)
+            self.contentCache.insert(pid,fid,cached)
+        #end if
+    # end downloadFile
+
+
+    def enableContentCache(self,root,maxBytes):
+        """
+        Keep the content of the files retrieved with getFileContent and downloadFile in a local cache,
+        so following requests for the same files are served from disk.
+        The cache can be shared by several processes
+
+        :param root: cache folder
+        :param maxBytes: maximum total size of the files cached. Least recently used files are evicted
+        :return: bf_content_cache object
+        """
+        self.contentCache = bf_content_cache(root,maxBytes)
+        return self.contentCache
+    #end enableContentCache
+
+
+    def _downloadUrl(self,url,filename,transfer=None):
+        """
+        Download the content of a signed url and save it with the file name given,
+        as described in downloadFile
+
+        :param url: signed url to the file
+        :param filename: local file path
+        :param transfer: (optional) bf_transfer every block is granted by before it is read
+        :return: none
+        """
+
+        # tracked in operations while in flight
+        operation = self.startOperation(operationType='download')
+        try:
+            with self._storageRequest('download_file','GET',url,stream=True) as response:
+                response.raise_for_status()
+                size = int(response.headers.get('Content-Length',-1))
+                ranged = \
+                    self.downloadWorkers > 1 and \
+                    size >= self.rangeThreshold and \
+                    response.headers.get('Accept-Ranges','') == 'bytes' and \
+                    'Content-Encoding' not in response.headers
+
+                if size >= 0:
+                    self.operations.setSize(operation,size)
+                #end if
+
+                if not ranged:
+                    # open file in writing
+                    # and stream the content in it
+                    with open(filename,'wb') as fh:
+                        for block in self._readBlocks(response,transfer):
+                            fh.write(block)
+                            self.operations.progress(operation,len(block))
+                        #end for
+                    #end with
+                    return
+                #end if
+            #end with
+
+            # preallocate the file and fetch all the ranges in parallel
+            with open(filename,'wb') as fh:
+                fh.truncate(size)
+            #end with
+            with ThreadPoolExecutor(max_workers=self.downloadWorkers) as executor:
+                futures = [
+                    executor.submit(self._downloadRange,url,filename,start,min(start + self.rangeSize,size) - 1,operation,transfer)
+                    for start
+                    in range(0,size,self.rangeSize)
+                ]
+            #end with
+            # raise the first error encountered, if any
+            for future in futures:
+                future.result()
+            #end for
+        finally:
+            self.stopOperation(operation)
+        #end try
+    # end _downloadUrl
+
+    def _uploadChunk(self,url,filename,multipartId,chunk,content,checksum=None,transfer=None):
+        """
+        upload a single chunk of a file
+
+        :param url: chunk upload url for this import
+        :param filename: file name on blackfynn
+        :param multipartId: multipart upload id returned by the upload preview
+        :param chunk: chunk number
+        :param content: chunk content, any bytes-like object
+        :param checksum: (optional) sha256 checksum of the content. Computed if not passed
+        :param transfer: (optional) bf_transfer that must be granted the chunk before it is sent
+        :return: requestsResponse object
+        """
+        if transfer is not None:
+            transfer.acquire(len(content))
+        #end if
+        # tracked in operations while in flight
+        operation = self.startOperation(operationType='upload_chunk',size=len(content))
+        try:
+            response = self._request(
+                'upload_chunk',
+                'POST',
+                url,
+                limiter=self.uploadLimiter,
+                params={
+                    'filename'       : filename,
+                    'multipartId'    : multipartId,
+                    'chunkNumber'    : chunk,
+                    'chunkSize'      : len(content),
+                    'chunkChecksum'  : checksum if checksum is not None else hashlib.sha256(content).hexdigest()
+                },
+                data = content
+            )
+            if response.status_code == 201:
+                self.operations.progress(operation,len(content))
+            #end if
+        finally:
+            self.stopOperation(operation)
+        #end try
+
+        return response
+    #end _uploadChunk
+
+
+    def _submitChunks(self,executor,slots,failed,url,source,filename,multipartId,onChunk=None,transfer=None):
+        """
+        submit the upload of the chunks handed out by a chunk source to the executor.
+        Each chunk is sent as a slice of the file map, buffer or stream piece, without copying it,
+        while the checksum of the next chunk is computed in the background.
+        A slot is acquired before submitting each chunk and released when its upload is over,
+        so slots bounds how many chunks are queued.
+        No more chunks are submitted once failed is set
+
+        :param executor: executor running the uploads
+        :param slots: semaphore bounding the chunks held in memory
+        :param failed: event set as soon as any chunk fails
+        :param url: chunk upload url for this import
+        :param source: bf_chunk_source, bf_buffer_source or bf_stream_source. It is closed once all the chunks are done
+        :param filename: file name on blackfynn
+        :param multipartId: multipart upload id returned by the upload preview
+        :param onChunk: (optional) function called with the chunk number every time a chunk is accepted
+        :param transfer: (optional) bf_transfer that must grant each chunk before it is sent
+        :return: list of futures, one for each chunk submitted
+        """
+
+        def chunkDone(chunk,content,future):
+            source.release(content)
+            slots.release()
+            if future.exception() is not None or future.result().status_code != 201:
+                failed.set()
+            elif onChunk is not None:
+                onChunk(chunk)
+            #end if
+        #end chunkDone
+
+        futures = []
+        sourceChunks = iter(source)
+        try:
+            for chunk, content, checksum in sourceChunks:
+                slots.acquire()
+                if failed.is_set():
+                    slots.release()
+                    source.release(content)
+                    break
+                #end if
+                # upload
+                future = executor.submit(self._uploadChunk,url,filename,multipartId,chunk,content,checksum,transfer)
+                future.add_done_callback(lambda future, chunk=chunk, content=content: chunkDone(chunk,content,future))
+                futures.append(future)
+            #end for
+        finally:
+            # the source is closed once all the chunks submitted are done
+            sourceChunks.close()
+            source.close()
+        #end try
+
+        return futures
+    #end _submitChunks
+
+
+    def _firstFailedChunk(self,futures):
+        """
+        wait for the chunk uploads and return the first one that failed, in chunk order
+
+        :param futures: list of futures returned by _submitChunks
+        :return: None if all the chunks have been accepted, the first failed response otherwise
+        """
+        for future in futures:
+            response = future.result()
+            if response.status_code != 201:
+                return response
+            #end if
+        #end for
+
+        return None
+    #end _firstFailedChunk
+
+
+    def _uploadChunks(self,url,source,filename,multipartId,onChunk=None,transfer=None):
+        """
+        upload the chunks handed out by a chunk source concurrently.
+        At most uploadWorkers chunks are in flight at any time and no more than
+        uploadMemoryBudget bytes are read ahead of the uploads.
+        Chunks can complete in any order.
+
+        :param url: chunk upload url for this import
+        :param source: bf_chunk_source, bf_buffer_source or bf_stream_source
+        :param filename: file name on blackfynn
+        :param multipartId: multipart upload id returned by the upload preview
+        :param onChunk: (optional) function called with the chunk number every time a chunk is accepted
+        :param transfer: (optional) bf_transfer that must grant each chunk before it is sent
+        :return: None if all the chunks have been accepted, the first failed response otherwise
+        """
+
+        # limit how many chunks can be held in memory
+        slots = threading.BoundedSemaphore(max(1,self.uploadMemoryBudget // source.chunkSize))
+        # set as soon as any chunk fails, so no more chunks are read
+        failed = threading.Event()
+
+        with ThreadPoolExecutor(max_workers=self.uploadWorkers) as executor:
+            futures = self._submitChunks(executor,slots,failed,url,source,filename,multipartId,onChunk,transfer)
+        #end with
+
+        # check results in chunk order
+        return self._firstFailedChunk(futures)
+    #end _uploadChunks
+
+
+    def getUploadStatus(self,importId,filename=None,multipartId=None,oid=None):
+        """
+        retrieve the status of an ongoing chunked upload
+
+        :param importId: import id returned by the upload preview
+        :param filename: (optional) file name on blackfynn
+        :param multipartId: (optional) multipart upload id returned by the upload preview
+        :param oid: blackfynn id of the organization. If not passed, it will used the organization id saved when session was initialized
+        :return: requestsResponse object
+        """
+
+        # check oid
+        if oid is None:
+            oid = self.organization
+        #end if
+
+        url = self.urls['upload_status'].replace('<OID>',oid).replace('<IID>',importId)
+        params = {}
+        if filename is not None:
+            params['filename'] = filename
+        if multipartId is not None:
+            params['multipartId'] = multipartId
+
+        return self._request(
+            'upload_status',
+            'GET',
+            url,
+            params = params
+        )
+    #end getUploadStatus
+
+
+    def _acceptedChunks(self,status):
+        """
+        extract the chunk numbers already received from an upload status.
+        The status can be a list of chunks or a dictionary with such a list
+        under 'chunks', where each chunk is its number or a dictionary with 'chunkNumber'
+
+        :param status: json upload status
+        :return: set of chunk numbers, None if they could not be found in the status
+        """
+
+        if isinstance(status,dict):
+            status = status.get('chunks')
+        #end if
+        if not isinstance(status,list):
+            return None
+        #end if
+
+        return set(
+            chunk['chunkNumber'] if isinstance(chunk,dict) else int(chunk)
+            for chunk
+            in status
+        )
+    #end _acceptedChunks
+
+
+    def _uploadStateFile(self,did,path,filename,cid,extension='.json'):
+        """
+        return the path of the file where the state of the upload is saved.
+        The state is tied to the local file size and modification time,
+        so a modified file is never resumed.
+        The same name with other extensions is used for the log of accepted chunks and for the lock of the upload
+
+        :param did: blackfynn id of the dataset
+        :param path: local path to the file being uploaded
+        :param filename: file name on blackfynn
+        :param cid: blackfynn id of the collection, or None
+        :param extension: (optional) .json for the state, .chunks for the log, .lock for the lock. Default: .json
+        :return: path to the state file
+        """
+        stat = os.stat(path)
+        key = json.dumps([did,cid,os.path.abspath(path),filename,stat.st_size,stat.st_mtime])
+        return os.path.join(self.resumeDir,hashlib.sha256(key.encode()).hexdigest() + extension)
+    #end _uploadStateFile
+
+
+    @contextlib.contextmanager
+    def _lockUploadState(self,did,path,filename,cid):
+        """
+        hold the lock of a resumable upload, so the same file is not uploaded
+        by two threads or, where supported, two processes at the same time.
+        The lock is not waited for: if it is held, the upload is already in progress
+
+        :param did: blackfynn id of the dataset
+        :param path: local path to the file being uploaded
+        :param filename: file name on blackfynn
+        :param cid: blackfynn id of the collection, or None
+        :return: context manager
+        """
+        os.makedirs(self.resumeDir,exist_ok=True)
+        stateFile = self._uploadStateFile(did,path,filename,cid)
+        lockFile = self._uploadStateFile(did,path,filename,cid,'.lock')
+        while True:
+            fh = open(lockFile,'a')
+            if fcntl is None:
+                break
+            #end if
+            try:
+                fcntl.flock(fh,fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                fh.close()
+                raise IOError('The upload of {} is already in progress'.format(path))
+            #end try
+            # the lock file may have been removed by the upload holding it until now: lock the current one
+            try:
+                if os.fstat(fh.fileno()).st_ino == os.stat(lockFile).st_ino:
+                    break
+                #end if
+            except FileNotFoundError:
+                pass
+            #end try
+            fh.close()
+        #end while
+
+        try:
+            yield
+        finally:
+            # once the upload is over, the lock file is removed while still held
+            if not os.path.exists(stateFile):
+                try:
+                    os.remove(lockFile)
+                except FileNotFoundError:
+                    pass
+                #end try
+            #end if
+            fh.close()
+        #end try
+    #end _lockUploadState
+
+
+    def _saveUploadState(self,did,path,filename,cid,state):
+        """
+        save the upload state in resumeDir and start a new, empty log of accepted chunks.
+        The caller must hold the lock of the upload
+
+        :param did: blackfynn id of the dataset
+        :param path: local path to the file being uploaded
+        :param filename: file name on blackfynn
+        :param cid: blackfynn id of the collection, or None
+        :param state: dictionary with importId, multipartId, chunkSize, totalChunks and accepted chunks
+        :return: None
+        """
+        stateFile = self._uploadStateFile(did,path,filename,cid)
+        os.makedirs(self.resumeDir,exist_ok=True)
+        # write a temporary file and move it in place,
+        # so the state on disk is never partially written
+        fd, tmpFile = tempfile.mkstemp(dir=self.resumeDir,suffix='.tmp')
+        try:
+            with os.fdopen(fd,'w') as fh:
+                json.dump(dict(state,did=did,path=os.path.abspath(path),filename=filename,cid=cid),fh)
+            #end with
+            os.replace(tmpFile,stateFile)
+        except BaseException:
+            os.remove(tmpFile)
+            raise
+        #end try
+        # the chunks accepted so far are in the state
+        open(self._uploadStateFile(did,path,filename,cid,'.chunks'),'wb').close()
+    #end _saveUploadState
+
+
+    @staticmethod
+    def _loadUploadState(stateFile):
+        """
+        load an upload state saved in resumeDir, adding the chunks recorded in its log.
+        A chunk number partially written at the end of the log is ignored
+
+        :param stateFile: path to the state file
+        :return: upload state
+        """
+        with open(stateFile) as fh:
+            state = json.load(fh)
+        #end with
+        chunks = set(state['chunks'])
+        try:
+            with open(os.path.splitext(stateFile)[0] + '.chunks','rb') as fh:
+                for line in fh:
+                    if line.endswith(b'\n'):
+                        chunks.add(int(line))
+                    #end if
+                #end for
+            #end with
+        except FileNotFoundError:
+            pass
+        #end try
+        state['chunks'] = sorted(chunks)
+        return state
+    #end _loadUploadState
+
+
+    def _removeUploadState(self,did,path,filename,cid):
+        """
+        remove the upload state and its log from resumeDir
+
+        :param did: blackfynn id of the dataset
+        :param path: local path to the file being uploaded
+        :param filename: file name on blackfynn
+        :param cid: blackfynn id of the collection, or None
+        :return: None
+        """
+        for extension in ('.json','.chunks'):
+            try:
+                os.remove(self._uploadStateFile(did,path,filename,cid,extension))
+            except FileNotFoundError:
+                pass
+            #end try
+        #end for
+    #end _removeUploadState
+
+
+    def _resumeUploadState(self,did,path,filename,cid):
+        """
+        load the state of a previous upload of this file and
+        update the accepted chunks with the upload status from blackfynn
+
+        :param did: blackfynn id of the dataset
+        :param path: local path to the file being uploaded
+        :param filename: file name on blackfynn
+        :param cid: blackfynn id of the collection, or None
+        :return: upload state, None if there is nothing to resume
+        """
+        try:
+            state = self._loadUploadState(self._uploadStateFile(did,path,filename,cid))
+        except (FileNotFoundError,ValueError):
+            return None
+        #end try
+
+        # if the upload is not known anymore, it needs to start over
+        statusResponse = self.getUploadStatus(state['importId'],filename,state['multipartId'])
+        if statusResponse.status_code != 200:
+            self._removeUploadState(did,path,filename,cid)
+            return None
+        #end if
+
+        # the chunks received by blackfynn take precedence over the local chunk map
+        accepted = self._acceptedChunks(statusResponse.json())
+        if accepted is not None:
+            state['chunks'] = sorted(accepted)
+        #end if
+
+        return state
+    #end _resumeUploadState
+
+
+    def pendingUploads(self):
+        """
+        list the uploads saved in resumeDir that have not been completed yet
+
+        :return: list of upload states
+        """
+        states = []
+        if os.path.isdir(self.resumeDir):
+            for name in sorted(os.listdir(self.resumeDir)):
+                if not name.endswith('.json'):
+                    continue
+                #end if
+                try:
+                    states.append(self._loadUploadState(os.path.join(self.resumeDir,name)))
+                except (FileNotFoundError,ValueError):
+                    pass
+                #end try
+            #end for
+        #end if
+
+        return states
+    #end pendingUploads
+
+
+    def _uploadPreview(self,oid,did,cid,files):
+        """
+        create an upload preview for the files listed.
+        Files are assigned upload ids starting from 1, in the order they are listed
+
+        :param oid: blackfynn id of the organization
+        :param did: blackfynn id of the dataset where the files should be saved
+        :param cid: blackfynn id of the collection where the files should be saved, or None
+        :param files: list of (file name on blackfynn, size in bytes)
+        :return: requestsResponse object
+        """
+
+        # POST
+        # https://api.blackfynn.io/
+        #   upload/
+        #   preview/
+        #   organizations/
+        #   N:organization:618e8dd9-f8d2-4dc4-9abb-c6aaab2e78a0
+        #     ?
+        #     append=false&
+        #     dataset_id=422&
+        #     destinationId=N:collection:045bb60b-540c-42d7-9090-855d5aed87d9
+        #
+        #  or
+        # https://api.blackfynn.io/
+        #   upload/
+        #   preview/
+        #   organizations/
+        #   N:organization:618e8dd9-f8d2-4dc4-9abb-c6aaab2e78a0
+        #     ?
+        #     append=false&
+        #     dataset_id=422
+        #
+        #  payload
+        # {
+        #  "files" : [
+        #   {
+        #    "uploadId" : 0,
+        #    "fileName" : "mdfObjTemplate.json",
+        #    "size" : 606,
+        #    "importId" : "038694bb0-fcac-11e9-b50c-6595234c9b76",
+        #    "processing":true,
+        #    "file" : {
+        #     "uploadId" : 0
+        #    }
+        #   }
+        #  ]
+        # }
+        #
+        # Response
+        # {
+        #  "packages" : [
+        #   {
+        #    "files" : [
+        #     {
+        #      "uploadId":1,
+        #      "fileName":"mdfObjTemplate.json",
+        #      "size":606,
+        #      "multipartUploadId":"iQ41EO3fi92hTv33ON57gJijn8C9OuXQ71SCyRsWuZ8TeMFGRNEQ5jP.lEwYiSbTpCkXub97l0DJM4Bkcf9u8XAqJqP35G4dRpdxje6gplDp0oT8rVnDpjS2F_UBdEciC7E3DqcuEMmOB4TGHmyAtZeywbvbtO.2sm8jZGxuyz4-",
         #      "chunkedUpload": {
         #       "chunkSize":5242880,
         #       "totalChunks":1
@@ -578,40 +2120,104 @@ class bf_rest:
         if cid:
             params['destinationId'] = cid
 
-        previewResponse = requests.post(
+        return self._request(
+            'upload_preview',
+            'POST',
             url,
             params=params,
             headers={
                 'accept'         : 'application/json',
                 'Content-Type'   : 'application/json',
-                'Authorization'  : 'Bearer ' + self.sessionToken
             },
             json = {
                 'files': [
                     {
-                        'uploadId'   : 1,
+                        'uploadId'   : uploadId,
                         'fileName'   : filename,
-                        'size'       : os.path.getsize(path),
+                        'size'       : size,
                         'processing' : False,
                     }
+                    for uploadId, (filename, size)
+                    in enumerate(files,1)
                 ]
             }
         )
-        self.lastResponse = previewResponse
+    #end _uploadPreview
 
-        # check if request was successful
-        # if it failed, return content
-        if previewResponse.status_code != 201:
-            return previewResponse.content
+
+    def uploadFile(self,did,path,filename,cid=None,oid=None,resume=False,priority=None):
+        """
+        upload the local file to the blackfynn container with the specified name
+
+        :param did: blackfynn id of the dataset where the file should be saved
+        :param path: local path to the file being uploaded
+        :param filename: file name on blackfynn
+        :param cid: blackfynn id of the collection where the file should be saved
+        :param oid: blackfynn id of the organization. If not passed, it will used the organization id saved when session was initialized
+        :param resume: save the upload state in resumeDir and continue a previous upload of the same file, if any.
+                       The upload holds a lock on its state, so the same file cannot be resumed twice at the same time. Default: False
+        :param priority: (optional) priority class of the chunks in the scheduler. Default: bf_scheduler.NORMAL
+
+        :return: dictionary containing the info provided by blackfynn when the upload has been complete
+        """
+
+        if resume:
+            with self._lockUploadState(did,path,filename,cid):
+                return self._uploadFile(did,path,filename,cid,oid,resume,priority)
+            #end with
         #end if
+        return self._uploadFile(did,path,filename,cid,oid,resume,priority)
+    #end uploadFile
 
-        # extract some values that are useful
-        preview = previewResponse.json()
-        preview_file = preview['packages'][0]['files'][0]
-        multipartId = preview_file['multipartUploadId']
-        chunkSize = preview_file['chunkedUpload']['chunkSize']
-        totalChunks = preview_file['chunkedUpload']['totalChunks']
-        importId = preview['packages'][0]['importId']
+
+    def _uploadFile(self,did,path,filename,cid,oid,resume,priority):
+        """
+        upload the local file as described in uploadFile.
+        With resume, the caller must hold the lock of the upload state
+
+        :param did: blackfynn id of the dataset where the file should be saved
+        :param path: local path to the file being uploaded
+        :param filename: file name on blackfynn
+        :param cid: blackfynn id of the collection where the file should be saved
+        :param oid: blackfynn id of the organization, or None
+        :param resume: save the upload state in resumeDir and continue a previous upload of the same file, if any
+        :param priority: priority class of the chunks in the scheduler, or None
+        :return: dictionary containing the info provided by blackfynn when the upload has been complete
+        """
+
+        # check oid
+        if oid is None:
+            oid = self.organization
+        #end if
+
+        # look for a previous attempt at this same upload
+        state = self._resumeUploadState(did,path,filename,cid) if resume else None
+
+        if state is None:
+            # create an upload preview
+            # if it failed, return content
+            previewResponse = self._uploadPreview(oid,did,cid,[(filename,os.path.getsize(path))])
+            if previewResponse.status_code != 201:
+                return previewResponse.content
+            #end if
+
+            # extract some values that are useful
+            preview = previewResponse.json()
+            preview_file = preview['packages'][0]['files'][0]
+            state = {
+                'importId'    : preview['packages'][0]['importId'],
+                'multipartId' : preview_file['multipartUploadId'],
+                'chunkSize'   : preview_file['chunkedUpload']['chunkSize'],
+                'totalChunks' : preview_file['chunkedUpload']['totalChunks'],
+                'chunks'      : [],
+            }
+        #end if
+
+        multipartId = state['multipartId']
+        chunkSize = state['chunkSize']
+        totalChunks = state['totalChunks']
+        importId = state['importId']
+        missingChunks = sorted(set(range(totalChunks)) - set(state['chunks']))
 
         # loop through the content and send all the chunks
         # POST
@@ -692,38 +2298,38 @@ class bf_rest:
 
         # get url for chunked upload
         url = self.urls['upload_chunk'].replace('<OID>',self.organization).replace('<IID>',importId)
-        # open file in binary reading
-        fh = open(path,'rb')
-        fh.seek(0)
-        # upload as many chunks are needed
-        for chunk in range(totalChunks):
-            # read chunk
-            content = fh.read(chunkSize)
-
-            # upload
-            chunkResponse = requests.post(
-                url,
-                params={
-                    'filename'       : filename,
-                    'multipartId'    : multipartId,
-                    'chunkNumber'    : chunk,
-                    'chunkSize'      : len(content),
-                    'chunkChecksum'  : hashlib.sha256(content).hexdigest()
-                },
-                headers={
-                    'Authorization'  : 'Bearer ' + self.sessionToken
-                },
-                data = content
-            )
-            self.lastResponse = chunkResponse
-
-            # check results
-            # if it failed, return content
-            if chunkResponse.status_code != 201:
-                return chunkResponse.content
-            # end if
-
-        #end for
+        # upload all the chunks concurrently
+        # if any of them failed, return content
+        if resume:
+            # record every accepted chunk, appending its number to the log of the upload, so it can be resumed.
+            # Each number is a single write to the unbuffered log, so the workers do not need a lock
+            self._saveUploadState(did,path,filename,cid,state)
+            chunkLog = open(self._uploadStateFile(did,path,filename,cid,'.chunks'),'ab',buffering=0)
+            def chunkAccepted(chunk):
+                chunkLog.write(b'%d\n' % chunk)
+            #end chunkAccepted
+        else:
+            chunkLog = None
+            chunkAccepted = None
+        #end if
+        try:
+            with self.scheduler.transfer('upload',priority,filename) as transfer:
+                failedResponse = self._uploadChunks(
+                    url,
+                    bf_chunk_source(path,chunkSize,missingChunks),
+                    filename,
+                    multipartId,
+                    chunkAccepted,
+                    transfer)
+            #end with
+        finally:
+            if chunkLog is not None:
+                chunkLog.close()
+            #end if
+        #end try
+        if failedResponse is not None:
+            return failedResponse.content
+        #end if
 
         # complete upload
         # POST
@@ -788,29 +2394,744 @@ class bf_rest:
         #  }
         # ]
 
-        # get url to complete upload
-        url = self.urls['upload_complete'].replace('<OID>',self.organization).replace('<IID>',importId)
+        # complete the upload
+        result = self._completeUpload(importId,did,cid)
+
+        # the upload is over, there is nothing left to resume
+        if resume and not isinstance(result,bytes):
+            self._removeUploadState(did,path,filename,cid)
+        #end if
+
+        # return response
+        return result
+
+    #end _uploadFile
+
 
-        # prepare parameters
+    def _completeUpload(self,importId,did,cid):
+        """
+        complete the upload of all the files belonging to an import
+
+        :param importId: import id returned by the upload preview
+        :param did: blackfynn id of the dataset where the files should be saved
+        :param cid: blackfynn id of the collection where the files should be saved, or None
+        :return: dictionary returned by blackfynn if successful, plain response if not
+        """
+
+        url = self.urls['upload_complete'].replace('<OID>',self.organization).replace('<IID>',importId)
         params = {
             'datasetId'     : did,
         }
         if cid:
             params['destinationId'] = cid
 
-        completeResponse = requests.post(
+        completeResponse = self._request(
+            'upload_complete',
+            'POST',
             url,
-            params = params,
-            headers={
-                'Authorization': 'Bearer ' + self.sessionToken
-            },
+            params = params
         )
-        self.lastResponse = completeResponse
 
-        # return response
         return completeResponse.json() if completeResponse.status_code == 200 else completeResponse.content
+    #end _completeUpload
 
-    #end uploadFile
 
+    def uploadFiles(self,did,files,cid=None,oid=None,priority=None):
+        """
+        upload many local files to the same blackfynn container, or each to its own collection.
+        Files are previewed in batches of previewBatchSize files going to the same collection with a single request each,
+        and the chunks of all the files are uploaded by a shared pool of uploadWorkers threads.
+        Each package is completed once all the chunks of its files have been accepted
+
+        :param did: blackfynn id of the dataset where the files should be saved
+        :param files: list of local paths, (local path, file name on blackfynn) tuples
+                      or (local path, file name on blackfynn, collection id) tuples
+        :param cid: blackfynn id of the collection where the files without their own collection should be saved
+        :param oid: blackfynn id of the organization. If not passed, it will used the organization id saved when session was initialized
+        :param priority: (optional) priority class of the chunks in the scheduler. Default: bf_scheduler.NORMAL
+
+        :return: list with, for each file, the dictionary provided by blackfynn when its upload has been complete
+                 or the plain response of the request that failed
+        """
+
+        # check oid
+        if oid is None:
+            oid = self.organization
+        #end if
+
+        # normalize the list of files to (local path, file name, collection id)
+        files = [
+            (item,os.path.basename(item),cid) if isinstance(item,str) else (tuple(item) + (cid,))[:3]
+            for item
+            in files
+        ]
+        results = [None] * len(files)
+
+        # batches of files previewed together, going to the same collection
+        byCollection = OrderedDict()
+        for index, (path, filename, destination) in enumerate(files):
+            byCollection.setdefault(destination,[]).append(index)
+        #end for
+        batches = [
+            (destination,indexes[start:start + self.previewBatchSize])
+            for destination, indexes
+            in byCollection.items()
+            for start
+            in range(0,len(indexes),self.previewBatchSize)
+        ]
+
+        # limit how many chunks can be held in memory.
+        # Created with the chunk size of the first preview, as the chunk size is chosen by blackfynn
+        slots = None
+        # packages uploaded: (importId, collection id, list of file indexes, list of chunk futures)
+        packages = []
+        # one transfer in the scheduler for each package, all closed even if a file cannot be read
+        transfers = []
+
+        with ThreadPoolExecutor(max_workers=self.uploadWorkers) as executor:
+            try:
+                for destination, batch in batches:
+                    # create one upload preview for all the files in the batch
+                    # if it failed, it is the result of all of them
+                    previewResponse = self._uploadPreview(
+                        oid,did,destination,
+                        [(files[index][1],os.path.getsize(files[index][0])) for index in batch])
+                    if previewResponse.status_code != 201:
+                        for index in batch:
+                            results[index] = previewResponse.content
+                        #end for
+                        continue
+                    #end if
+
+                    preview = previewResponse.json()
+                    if slots is None:
+                        chunkSize = max(
+                            previewFile['chunkedUpload']['chunkSize']
+                            for package in preview['packages']
+                            for previewFile in package['files'])
+                        slots = threading.BoundedSemaphore(max(1,self.uploadMemoryBudget // chunkSize))
+                    #end if
+
+                    # map every file returned back to the local file, using the upload id
+                    for package in preview['packages']:
+                        importId = package['importId']
+                        url = self.urls['upload_chunk'].replace('<OID>',self.organization).replace('<IID>',importId)
+                        indexes = []
+                        futures = []
+                        # failures are tracked per package, so a failed file does not stop the others
+                        failed = threading.Event()
+                        transfer = self.scheduler.transfer('upload',priority,package.get('packageName',importId))
+                        transfers.append(transfer)
+                        for previewFile in package['files']:
+                            index = batch[previewFile['uploadId'] - 1]
+                            path, filename = files[index][:2]
+                            indexes.append(index)
+                            source = bf_chunk_source(
+                                path,
+                                previewFile['chunkedUpload']['chunkSize'],
+                                range(previewFile['chunkedUpload']['totalChunks']))
+                            futures += self._submitChunks(
+                                executor,slots,failed,url,source,filename,
+                                previewFile['multipartUploadId'],
+                                transfer=transfer)
+                        #end for
+                        packages.append((importId,destination,indexes,futures))
+                    #end for
+                #end for
+
+                # complete every package whose chunks have all been accepted
+                completions = []
+                for (importId, destination, indexes, futures), transfer in zip(packages,transfers):
+                    try:
+                        failedResponse = self._firstFailedChunk(futures)
+                    finally:
+                        transfer.close()
+                    #end try
+                    if failedResponse is not None:
+                        for index in indexes:
+                            results[index] = failedResponse.content
+                        #end for
+                    else:
+                        completions.append((indexes,executor.submit(self._completeUpload,importId,did,destination)))
+                    #end if
+                #end for
+                for indexes, future in completions:
+                    for index in indexes:
+                        results[index] = future.result()
+                    #end for
+                #end for
+            finally:
+                for transfer in transfers:
+                    transfer.close()
+                #end for
+            #end try
+        #end with
+
+        return results
+    #end uploadFiles
+
+
+    def _uploadSource(self,did,filename,size,makeSource,cid=None,oid=None,priority=None):
+        """
+        upload content that is not a local file with the same preview, chunk and complete steps of uploadFile
+
+        :param did: blackfynn id of the dataset where the file should be saved
+        :param filename: file name on blackfynn
+        :param size: size of the content in bytes
+        :param makeSource: function returning the chunk source, given the chunk size and the total number of chunks
+        :param cid: blackfynn id of the collection where the file should be saved
+        :param oid: blackfynn id of the organization. If not passed, it will used the organization id saved when session was initialized
+        :param priority: (optional) priority class of the chunks in the scheduler. Default: bf_scheduler.NORMAL
+        :return: dictionary containing the info provided by blackfynn when the upload has been complete
+        """
+
+        # check oid
+        if oid is None:
+            oid = self.organization
+        #end if
+
+        # create an upload preview
+        # if it failed, return content
+        previewResponse = self._uploadPreview(oid,did,cid,[(filename,size)])
+        if previewResponse.status_code != 201:
+            return previewResponse.content
+        #end if
+        preview = previewResponse.json()
+        previewFile = preview['packages'][0]['files'][0]
+        importId = preview['packages'][0]['importId']
+
+        # upload all the chunks concurrently
+        # if any of them failed, return content
+        url = self.urls['upload_chunk'].replace('<OID>',self.organization).replace('<IID>',importId)
+        source = makeSource(previewFile['chunkedUpload']['chunkSize'],previewFile['chunkedUpload']['totalChunks'])
+        with self.scheduler.transfer('upload',priority,filename) as transfer:
+            failedResponse = self._uploadChunks(url,source,filename,previewFile['multipartUploadId'],transfer=transfer)
+        #end with
+        if failedResponse is not None:
+            return failedResponse.content
+        #end if
+
+        # complete the upload
+        return self._completeUpload(importId,did,cid)
+    #end _uploadSource
+
+
+    def uploadBuffer(self,did,buffer,filename,cid=None,oid=None,priority=None):
+        """
+        upload content held in memory, without writing it to a file first.
+        Chunks are sent as slices of the buffer, so the content is never copied
+
+        :param did: blackfynn id of the dataset where the file should be saved
+        :param buffer: bytes-like object, e.g. bytes, bytearray, memoryview or a contiguous numpy array
+        :param filename: file name on blackfynn
+        :param cid: blackfynn id of the collection where the file should be saved
+        :param oid: blackfynn id of the organization. If not passed, it will used the organization id saved when session was initialized
+        :param priority: (optional) priority class of the chunks in the scheduler. Default: bf_scheduler.NORMAL
+        :return: dictionary containing the info provided by blackfynn when the upload has been complete,
+                 or the content of the request that failed
+        """
+        with bytesView(buffer) as view:
+            size = view.nbytes
+        #end with
+        return self._uploadSource(
+            did,
+            filename,
+            size,
+            lambda chunkSize, totalChunks: bf_buffer_source(buffer,chunkSize,range(totalChunks)),
+            cid,
+            oid,
+            priority)
+    #end uploadBuffer
+
+
+    def uploadStream(self,did,stream,size,filename,cid=None,oid=None,priority=None):
+        """
+        upload content produced piece by piece, e.g. by a generator, without writing it to a file first.
+        The size must be known in advance, as the upload preview requires it.
+        Pieces are cut into chunks as they arrive: chunks within a piece are sent as slices of it,
+        and only chunks spanning more than one piece are copied.
+        The stream is read once, so uploads from streams cannot be resumed
+
+        :param did: blackfynn id of the dataset where the file should be saved
+        :param stream: iterable of bytes-like objects
+        :param size: total bytes yielded by the stream. ValueError is raised if the stream yields a different amount
+        :param filename: file name on blackfynn
+        :param cid: blackfynn id of the collection where the file should be saved
+        :param oid: blackfynn id of the organization. If not passed, it will used the organization id saved when session was initialized
+        :param priority: (optional) priority class of the chunks in the scheduler. Default: bf_scheduler.NORMAL
+        :return: dictionary containing the info provided by blackfynn when the upload has been complete,
+                 or the content of the request that failed
+        """
+        return self._uploadSource(
+            did,
+            filename,
+            size,
+            lambda chunkSize, totalChunks: bf_stream_source(stream,chunkSize,size),
+            cid,
+            oid,
+            priority)
+    #end uploadStream
+
+
+    def _localChecksums(self,paths):
+        """
+        compute the sha256 checksum of the local files concurrently.
+        Checksums are cached in checksumCacheFile by path, size and modification time,
+        so files that did not change are not read again
+
+        :param paths: list of local paths
+        :return: dictionary path -> hexadecimal digest
+        """
+        try:
+            with open(self.checksumCacheFile) as fh:
+                cache = json.load(fh)
+            #end with
+        except (FileNotFoundError,ValueError):
+            cache = {}
+        #end try
+
+        def checksum(path):
+            stat = os.stat(path)
+            key = os.path.abspath(path)
+            cached = cache.get(key)
+            if cached is not None and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+                return cached[2]
+            #end if
+            digest = hashlib.sha256()
+            with open(path,'rb') as fh:
+                for block in iter(lambda: fh.read(self.downloadBlockSize),b''):
+                    digest.update(block)
+                #end for
+            #end with
+            cache[key] = [stat.st_size,stat.st_mtime_ns,digest.hexdigest()]
+            return cache[key][2]
+        #end checksum
+
+        with ThreadPoolExecutor(max_workers=self.syncWorkers) as executor:
+            checksums = dict(zip(paths,executor.map(checksum,paths)))
+        #end with
+
+        self._saveChecksumCache({
+            os.path.abspath(path) : cache[os.path.abspath(path)]
+            for path
+            in paths
+        })
+
+        return checksums
+    #end _localChecksums
+
+
+    def _saveChecksumCache(self,entries):
+        """
+        add the entries given to checksumCacheFile.
+        The cache is read again and written through a unique temporary file while holding a lock on it,
+        where supported, so concurrent syncs, also from other processes, neither corrupt it nor drop each other's entries
+
+        :param entries: dictionary absolute path -> [size, modification time in ns, hexadecimal digest]
+        :return: None
+        """
+        folder = os.path.dirname(self.checksumCacheFile)
+        os.makedirs(folder,exist_ok=True)
+        with open(self.checksumCacheFile + '.lock','a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock,fcntl.LOCK_EX)
+            #end if
+            try:
+                with open(self.checksumCacheFile) as fh:
+                    cache = json.load(fh)
+                #end with
+            except (FileNotFoundError,ValueError):
+                cache = {}
+            #end try
+            cache.update(entries)
+            fd, tmpFile = tempfile.mkstemp(dir=folder,suffix='.tmp')
+            try:
+                with os.fdopen(fd,'w') as fh:
+                    json.dump(cache,fh)
+                #end with
+                os.replace(tmpFile,self.checksumCacheFile)
+            except BaseException:
+                os.remove(tmpFile)
+                raise
+            #end try
+        #end with
+    #end _saveChecksumCache
+
+
+    @staticmethod
+    def _remoteChecksum(source):
+        """
+        return the sha256 checksum of the whole file, if the source file exposes it
+
+        :param source: dictionary with the content of the source file
+        :return: hexadecimal digest, None if not available
+        """
+        checksum = source.get('checksum')
+        if isinstance(checksum,dict):
+            checksum = checksum.get('checksum')
+        #end if
+        return checksum if isinstance(checksum,str) and len(checksum) == 64 else None
+    #end _remoteChecksum
+
+
+    @staticmethod
+    def _collectionPaths(spec,prefix=''):
+        """
+        Flatten a collection tree spec into the list of all the paths in it, ancestors included
+
+        :param spec: nested dictionary name -> spec of the children (None or empty for none),
+                     or list of paths with names separated by "/"
+        :param prefix: path of the collection containing the spec
+        :return: list of paths
+        """
+        paths = []
+        if isinstance(spec,dict):
+            for name, children in spec.items():
+                path = prefix + '/' + name if prefix else name
+                paths.append(path)
+                if children:
+                    paths += bf_rest._collectionPaths(children,path)
+                #end if
+            #end for
+        else:
+            for path in spec:
+                names = [name for name in path.strip('/').split('/') if name]
+                for depth in range(1,len(names) + 1):
+                    paths.append('/'.join([prefix] + names[:depth] if prefix else names[:depth]))
+                #end for
+            #end for
+        #end if
+
+        # unique, in order
+        return list(OrderedDict.fromkeys(paths))
+    #end _collectionPaths
+
+
+    def createCollectionTree(self,did,spec,cid=None,collections=None):
+        """
+        Create a tree of nested collections in the dataset, or in a collection in it.
+        Collections that already exist are reused. The missing ones are created one depth at a time,
+        all the siblings at the same depth in parallel with syncWorkers threads,
+        so the number of rounds depends on the depth of the tree and not on its size
+
+        :param did: blackfynn dataset id
+        :param spec: nested dictionary name -> spec of the children (None or empty for none),
+                     e.g. {'raw' : {'day1' : None, 'day2' : None}, 'derived' : {}},
+                     or list of paths with names separated by "/", e.g. ['raw/day1','raw/day2','derived']
+        :param cid: blackfynn id of the collection where the tree is created. If left empty, the root of the dataset
+        :param collections: (optional) dictionary path -> collection id of the collections that already exist,
+                            as returned by _remoteTree. Retrieved from the dataset if not passed
+        :return: dictionary path -> collection id, for every path in the spec
+        """
+
+        if collections is None:
+            collections = self._remoteTree(did,cid)[0]
+        #end if
+        collections = dict(collections)
+        collections[''] = cid
+
+        paths = self._collectionPaths(spec)
+        missing = [path for path in paths if path not in collections]
+        with ThreadPoolExecutor(max_workers=self.syncWorkers) as executor:
+            for depth in sorted(set(path.count('/') for path in missing)):
+                level = [path for path in missing if path.count('/') == depth]
+                futures = [
+                    executor.submit(
+                        self.createCollection,
+                        path.rsplit('/',1)[-1],
+                        did,
+                        collections[path.rsplit('/',1)[0] if '/' in path else ''])
+                    for path
+                    in level
+                ]
+                # wait for the whole level, then report the first failure, if any
+                results = [future.result() for future in futures]
+                for path, result in zip(level,results):
+                    if not isinstance(result,dict):
+                        raise IOError('Unable to create collection {}: {}'.format(path,result))
+                    #end if
+                    collections[path] = result['content']['id']
+                #end for
+            #end for
+        #end with
+
+        return {path : collections[path] for path in paths}
+    #end createCollectionTree
+
+
+    def syncDirectory(self,did,localPath,cid=None,checksum=False,priority=None,replace=False,onTotal=None):
+        """
+        Mirror a local directory into a dataset, or into a collection in it.
+        The local tree is compared by path and size with the collections and source files already on blackfynn,
+        and by checksum too when requested and exposed by blackfynn.
+        When a path is held by more than one package, it is compared with the newest one.
+        Only the missing collections are created and only new or changed files are uploaded,
+        all of them at once with uploadFiles, whatever their collection.
+        Changed files are uploaded as new packages, and the packages holding the previous version are kept.
+        With replace, they are deleted once the new version has been uploaded, unless they hold other files too
+
+        :param did: blackfynn dataset id
+        :param localPath: local directory
+        :param cid: blackfynn id of the collection mirroring the directory. If left empty, the root of the dataset
+        :param checksum: compare files with the same size by sha256 checksum too. Default: False
+        :param priority: (optional) priority class of the uploads in the scheduler. Default: bf_scheduler.NORMAL
+        :param replace: delete the packages holding the previous version of the files uploaded again. Default: False
+        :param onTotal: (optional) function called with the total bytes to upload, once the files to upload are known
+        :return: dictionary with the lists of collections created, files uploaded, files skipped,
+                 paths still held by more than one package, ids of the packages deleted
+                 and a dictionary of the files that failed with their error
+        """
+
+        collections, remoteFiles, duplicates = self._remoteTree(did,cid)
+
+        # walk the local tree
+        localDirs = []
+        localFiles = {}
+        for root, dirs, files in os.walk(localPath):
+            dirs.sort()
+            relativeRoot = os.path.relpath(root,localPath).replace(os.sep,'/')
+            relativeRoot = '' if relativeRoot == '.' else relativeRoot
+            if relativeRoot:
+                localDirs.append(relativeRoot)
+            #end if
+            for name in sorted(files):
+                localFiles[relativeRoot + '/' + name if relativeRoot else name] = os.path.join(root,name)
+            #end for
+        #end for
 
+        # find the files that are new or changed
+        toUpload = [
+            path
+            for path, local
+            in localFiles.items()
+            if path not in remoteFiles or os.path.getsize(local) != remoteFiles[path][1].get('size')
+        ]
+        if checksum:
+            sameSize = [
+                path
+                for path
+                in localFiles.keys()
+                if path not in toUpload and self._remoteChecksum(remoteFiles[path][1]) is not None
+            ]
+            checksums = self._localChecksums([localFiles[path] for path in sameSize])
+            toUpload += [
+                path
+                for path
+                in sameSize
+                if checksums[localFiles[path]] != self._remoteChecksum(remoteFiles[path][1])
+            ]
+        #end if
+
+        if onTotal is not None:
+            onTotal(sum(os.path.getsize(localFiles[path]) for path in toUpload))
+        #end if
+
+        # create the missing collections
+        created = [path for path in localDirs if path not in collections]
+        collections.update(self.createCollectionTree(did,localDirs,cid,collections))
+
+        # upload new and changed files, each to its collection, through one shared pool
+        summary = {
+            'collections' : created,
+            'uploaded'    : [],
+            'skipped'     : sorted(set(localFiles.keys()) - set(toUpload)),
+            'duplicates'  : [],
+            'deleted'     : [],
+            'failed'      : {},
+        }
+        paths = sorted(toUpload)
+        results = self.uploadFiles(
+            did,
+            [
+                (localFiles[path],path.rsplit('/',1)[-1],collections[path.rsplit('/',1)[0] if '/' in path else ''])
+                for path
+                in paths
+            ],
+            priority=priority)
+        for path, result in zip(paths,results):
+            if isinstance(result,bytes):
+                summary['failed'][path] = result
+            else:
+                summary['uploaded'].append(path)
+            #end if
+        #end for
+
+        # delete the previous versions of the files uploaded again,
+        # skipping packages that also hold files that have not been replaced
+        replaced = set(summary['uploaded']) & set(remoteFiles.keys()) if replace else set()
+        holders = {}
+        for path, item in remoteFiles.items():
+            for package, source in [item] + duplicates.get(path,[]):
+                holders.setdefault(package['content']['id'],set()).add(path)
+            #end for
+        #end for
+        stale = sorted(pid for pid, held in holders.items() if held <= replaced)
+        if stale:
+            result = self.deletePackages(stale)
+            if not isinstance(result,dict):
+                result = {'success' : [], 'failures' : [{'id' : pid, 'error' : result} for pid in stale]}
+            #end if
+            summary['deleted'] = sorted(result.get('success',[]))
+            for failure in result.get('failures',[]):
+                for path in sorted(holders.get(failure.get('id'),())):
+                    summary['failed'][path] = 'uploaded, but the previous version was not deleted: {}'.format(failure.get('error'))
+                #end for
+            #end for
+        #end if
+        # paths still held by more than one package
+        deleted = set(summary['deleted'])
+        for path, item in sorted(remoteFiles.items()):
+            remaining = [package for package, source in [item] + duplicates.get(path,[]) if package['content']['id'] not in deleted]
+            if len(remaining) + (1 if path in summary['uploaded'] else 0) > 1:
+                summary['duplicates'].append(path)
+            #end if
+        #end for
+
+        return summary
+    #end syncDirectory
+
+
+    def downloadCollection(self,did,cid,localPath,checksum=False,priority=None,onTotal=None):
+        """
+        Download all the files in a collection, recreating its collection hierarchy as folders under the local path.
+        Signed urls are resolved and files are streamed by bulkDownloadWorkers threads at a time.
+        Files that already exist locally with the same size, and the same checksum when requested
+        and exposed by blackfynn, are skipped.
+        Each file is written to a temporary ".part" file and renamed once complete
+
+        :param did: blackfynn dataset id
+        :param cid: blackfynn collection id. If None, the whole dataset is downloaded
+        :param localPath: local folder
+        :param checksum: compare files with the same size by sha256 checksum too. Default: False
+        :param priority: (optional) priority class of the downloads in the scheduler. Default: bf_scheduler.NORMAL
+        :param onTotal: (optional) function called with the total bytes to download, once the files to download are known
+        :return: dictionary with the lists of files downloaded and skipped, of the paths held by more than one package,
+                 of which the newest is downloaded, and a dictionary of the files that failed with their error
+        """
+
+        collections, remoteFiles, duplicates = self._remoteTree(did,cid)
+        self._ensureStoragePool()
+
+        # recreate the collection hierarchy
+        for path in collections.keys():
+            os.makedirs(os.path.join(localPath,*path.split('/')),exist_ok=True)
+        #end for
+
+        localFiles = {
+            path : os.path.join(localPath,*path.split('/'))
+            for path
+            in remoteFiles.keys()
+        }
+
+        # skip files already downloaded
+        existing = [
+            path
+            for path, local
+            in localFiles.items()
+            if os.path.isfile(local) and os.path.getsize(local) == remoteFiles[path][1].get('size')
+        ]
+        if checksum:
+            checksums = self._localChecksums([localFiles[path] for path in existing])
+            existing = [
+                path
+                for path
+                in existing
+                if self._remoteChecksum(remoteFiles[path][1]) in (None,checksums[localFiles[path]])
+            ]
+        #end if
+        existing = set(existing)
+
+        summary = {
+            'downloaded' : [],
+            'skipped'    : sorted(existing),
+            'duplicates' : sorted(duplicates.keys()),
+            'failed'     : {},
+        }
+
+        # remote files that would be written to the same local file or temporary file,
+        # e.g. a.bin and a.bin.part, or names differing only by case on case-insensitive systems,
+        # are not downloaded, as they would overwrite each other
+        toDownload = sorted(set(remoteFiles.keys()) - existing)
+        targets = {}
+        for path in toDownload:
+            for target in (localFiles[path],localFiles[path] + '.part'):
+                targets.setdefault(os.path.normcase(os.path.normpath(target)),[]).append(path)
+            #end for
+        #end for
+        for paths in targets.values():
+            if len(paths) > 1:
+                for path in paths:
+                    summary['failed'][path] = 'local file conflicts with {}'.format(
+                        ', '.join(other for other in paths if other != path))
+                #end for
+            #end if
+        #end for
+        toDownload = [path for path in toDownload if path not in summary['failed']]
+        if onTotal is not None:
+            onTotal(sum(remoteFiles[path][1].get('size') or 0 for path in toDownload))
+        #end if
+
+        def download(path):
+            package, source = remoteFiles[path]
+            try:
+                self.downloadFile(package['content']['id'],source['id'],localFiles[path] + '.part',priority,source)
+            except BaseException:
+                # nothing partial is left behind
+                try:
+                    os.remove(localFiles[path] + '.part')
+                except FileNotFoundError:
+                    pass
+                #end try
+                raise
+            #end try
+            os.replace(localFiles[path] + '.part',localFiles[path])
+        #end download
+
+        with ThreadPoolExecutor(max_workers=self.bulkDownloadWorkers) as executor:
+            # the signed urls are resolved with resolveFileUrls in batches, each while the previous ones are downloaded,
+            # small enough to stay in the url cache until they are used
+            futures = []
+            batchSize = max(1,self.fileUrlCacheSize // 2)
+            for start in range(0,len(toDownload),batchSize):
+                batch = toDownload[start:start + batchSize]
+                try:
+                    self.resolveFileUrls([
+                        (remoteFiles[path][0]['content']['id'],remoteFiles[path][1]['id'])
+                        for path
+                        in batch
+                    ])
+                except Exception:
+                    # the urls that could not be resolved are requested again by their download, which reports the error
+                    pass
+                #end try
+                futures += [executor.submit(download,path) for path in batch]
+            #end for
+        #end with
+        for path, future in zip(toDownload,futures):
+            if future.exception() is not None:
+                summary['failed'][path] = str(future.exception())
+            else:
+                summary['downloaded'].append(path)
+            #end if
+        #end for
+
+        return summary
+    #end downloadCollection
+
+
+    def downloadDataset(self,did,localPath,checksum=False,priority=None,onTotal=None):
+        """
+        Download all the files in a dataset, recreating its collection hierarchy as folders under the local path.
+        See downloadCollection
+
+        :param did: blackfynn dataset id
+        :param localPath: local folder
+        :param checksum: compare files with the same size by sha256 checksum too. Default: False
+        :param priority: (optional) priority class of the downloads in the scheduler. Default: bf_scheduler.NORMAL
+        :param onTotal: (optional) function called with the total bytes to download, once the files to download are known
+        :return: dictionary with the lists of files downloaded and skipped
+                 and a dictionary of the files that failed with their error
+        """
+        return self.downloadCollection(did,None,localPath,checksum,priority,onTotal)
+    #end downloadDataset
 
@@ -0,0 +1,433 @@
+"""
+bandwidth scheduler shared by all the transfers of bf_rest, with priorities and fair sharing
+"""
+
+# import libraries
+import asyncio
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class bf_transfer_cancelled(IOError):
+    """
+    raised by the transfers that have been cancelled
+    """
+    pass
+#end bf_transfer_cancelled
+
+
+class bf_transfer:
+
+    def __init__(self,scheduler,direction,priority,name):
+        """
+        When instantiated, this class represents one transfer registered with the scheduler.
+        Every block of the transfer asks the scheduler for its bytes with acquire before being sent or received
+
+        :param scheduler: bf_scheduler instance
+        :param direction: upload or download
+        :param priority: priority class, lower values first
+        :param name: name of the transfer
+        """
+        self.scheduler = scheduler
+        self.direction = direction
+        self.priority = priority
+        self.name = name
+        self.cancelled = False
+        self.bytes = 0
+        # requests waiting to be granted, in order
+        self.waiting = []
+    #end __init__
+
+
+    def acquire(self,count):
+        """
+        wait until the scheduler grants the bytes given to this transfer
+
+        :param count: bytes about to be transferred
+        :return: None
+        """
+        self.scheduler._acquire(self,count)
+    #end acquire
+
+
+    async def acquireAsync(self,count):
+        """
+        wait until the scheduler grants the bytes given to this transfer, from a coroutine.
+        The event loop is not blocked and no thread is held while waiting
+
+        :param count: bytes about to be transferred
+        :return: None
+        """
+        await self.scheduler._acquireAsync(self,count)
+    #end acquireAsync
+
+
+    def cancel(self):
+        """
+        cancel the transfer: blocks waiting and following ones fail with bf_transfer_cancelled
+
+        :return: None
+        """
+        self.scheduler._cancel(self)
+    #end cancel
+
+
+    def close(self):
+        """
+        unregister the transfer once it is over
+
+        :return: None
+        """
+        self.scheduler._close(self)
+    #end close
+
+
+    def __enter__(self):
+        return self
+    #end __enter__
+
+
+    def __exit__(self,excType,excValue,traceback):
+        self.close()
+    #end __exit__
+
+#end bf_transfer
+
+
+class bf_scheduler:
+
+    # priority classes, served in this order
+    INTERACTIVE = 0
+    NORMAL = 1
+    BULK = 2
+
+    directions = ('upload','download')
+
+    def __init__(self,uploadRate=0,downloadRate=0,burst=1.0):
+        """
+        When instantiated, this class limits the bytes per second of each direction with a token bucket.
+        When the bucket is empty, the blocks waiting are granted in priority order:
+        a class is served only when no block of a higher class is waiting,
+        and within a class the transfers take turns, one block each, so concurrent transfers share the bandwidth.
+        With no limit, blocks are granted right away.
+        Threads wait on a condition, coroutines on an event set from any thread when the scheduler changes
+
+        :param uploadRate: maximum bytes per second uploaded, 0 for unlimited. Default: 0
+        :param downloadRate: maximum bytes per second downloaded, 0 for unlimited. Default: 0
+        :param burst: seconds of bandwidth that can be accumulated while idle. Default: 1.0
+        """
+        self.burst = burst
+        self.condition = threading.Condition()
+        self.rates = {'upload' : uploadRate, 'download' : downloadRate}
+        self.tokens = {direction : 0.0 for direction in self.directions}
+        self.refilled = {direction : time.monotonic() for direction in self.directions}
+        # transfers registered: direction -> priority -> transfer -> None, in turn order
+        self.transfers = {direction : {} for direction in self.directions}
+        # functions called with the lock held every time the waiting threads are notified, waking the coroutines waiting
+        self.listeners = set()
+    #end __init__
+
+
+    def _notify(self):
+        """
+        wake up the threads and the coroutines waiting for their blocks to be granted. The lock must be held
+
+        :return: None
+        """
+        self.condition.notify_all()
+        for listener in self.listeners:
+            listener()
+        #end for
+    #end _notify
+
+
+    def setRate(self,direction,rate):
+        """
+        change the maximum bytes per second of a direction
+
+        :param direction: upload or download
+        :param rate: maximum bytes per second, 0 for unlimited
+        :return: None
+        """
+        with self.condition:
+            self._refill(direction)
+            self.rates[direction] = rate
+            self.tokens[direction] = min(self.tokens[direction],rate * self.burst)
+            self._notify()
+        #end with
+    #end setRate
+
+
+    def transfer(self,direction,priority=None,name=None):
+        """
+        register a new transfer
+
+        :param direction: upload or download
+        :param priority: (optional) priority class. Default: NORMAL
+        :param name: (optional) name of the transfer, e.g. the file name
+        :return: bf_transfer object, to be closed once the transfer is over
+        """
+        if direction not in self.directions:
+            raise ValueError('unknown direction {}'.format(direction))
+        #end if
+        transfer = bf_transfer(
+            self,
+            direction,
+            priority if priority is not None else self.NORMAL,
+            name if name is not None else str(uuid.uuid4()))
+        with self.condition:
+            self.transfers[direction].setdefault(transfer.priority,OrderedDict())[transfer] = None
+        #end with
+        return transfer
+    #end transfer
+
+
+    def active(self,direction=None):
+        """
+        return the transfers registered
+
+        :param direction: (optional) upload or download. Default: both
+        :return: list of bf_transfer objects
+        """
+        with self.condition:
+            return [
+                transfer
+                for current in self.directions
+                if direction in (None,current)
+                for priority in sorted(self.transfers[current])
+                for transfer in self.transfers[current][priority]
+            ]
+        #end with
+    #end active
+
+
+    def cancel(self,priority=None,direction=None):
+        """
+        cancel all the transfers registered, or only those of a priority class or of a direction
+
+        :param priority: (optional) priority class
+        :param direction: (optional) upload or download
+        :return: number of transfers cancelled
+        """
+        transfers = [
+            transfer
+            for transfer
+            in self.active(direction)
+            if priority is None or transfer.priority == priority
+        ]
+        for transfer in transfers:
+            transfer.cancel()
+        #end for
+        return len(transfers)
+    #end cancel
+
+
+    def _refill(self,direction):
+        """
+        add the tokens accumulated since the last refill. The lock must be held
+
+        :param direction: upload or download
+        :return: None
+        """
+        now = time.monotonic()
+        rate = self.rates[direction]
+        self.tokens[direction] = min(rate * self.burst,self.tokens[direction] + rate * (now - self.refilled[direction]))
+        self.refilled[direction] = now
+    #end _refill
+
+
+    def _next(self,direction):
+        """
+        return the transfer whose turn it is: the first one with blocks waiting in the highest priority class.
+        The lock must be held
+
+        :param direction: upload or download
+        :return: bf_transfer object, None if no block is waiting
+        """
+        for priority in sorted(self.transfers[direction]):
+            for transfer in self.transfers[direction][priority]:
+                if transfer.waiting:
+                    return transfer
+                #end if
+            #end for
+        #end for
+        return None
+    #end _next
+
+
+    def _enqueue(self,transfer,count):
+        """
+        queue a request of the transfer for the bytes given, granting them right away without a limit.
+        The lock must be held
+
+        :param transfer: bf_transfer object
+        :param count: bytes about to be transferred
+        :return: request to pass to _grant and _dequeue, None if granted right away
+        """
+        direction = transfer.direction
+        if transfer.cancelled:
+            raise bf_transfer_cancelled('transfer {} has been cancelled'.format(transfer.name))
+        #end if
+        if transfer not in self.transfers[direction].get(transfer.priority,{}):
+            raise ValueError('transfer {} has been closed'.format(transfer.name))
+        #end if
+        if not self.rates[direction]:
+            transfer.bytes += count
+            return None
+        #end if
+
+        request = object()
+        transfer.waiting.append(request)
+        return request
+    #end _enqueue
+
+
+    def _grant(self,transfer,count,request):
+        """
+        grant the bytes of a request queued if it is its turn and the bucket holds them. The lock must be held
+
+        :param transfer: bf_transfer object
+        :param count: bytes about to be transferred
+        :param request: request returned by _enqueue
+        :return: (True, None) once granted, otherwise (False, seconds to wait before trying again,
+                 None to wait until the waiting ones are notified)
+        """
+        direction = transfer.direction
+        if transfer.cancelled:
+            raise bf_transfer_cancelled('transfer {} has been cancelled'.format(transfer.name))
+        #end if
+        rate = self.rates[direction]
+        # without a limit, e.g. removed in the meantime, it is granted right away
+        if rate:
+            self._refill(direction)
+            if self._next(direction) is not transfer or transfer.waiting[0] is not request:
+                return False, None
+            #end if
+            # blocks larger than the bucket are granted when it is full, going into debt
+            needed = min(count,rate * self.burst)
+            if self.tokens[direction] < needed:
+                return False, (needed - self.tokens[direction]) / rate
+            #end if
+            self.tokens[direction] -= count
+        #end if
+        transfer.bytes += count
+        # next turn to the following transfer of the same class
+        queue = self.transfers[direction].get(transfer.priority)
+        if queue is not None and transfer in queue:
+            queue.move_to_end(transfer)
+        #end if
+        return True, None
+    #end _grant
+
+
+    def _dequeue(self,transfer,request):
+        """
+        remove a request of the transfer, granted or not, and let the following ones be granted. The lock must be held
+
+        :param transfer: bf_transfer object
+        :param request: request returned by _enqueue
+        :return: None
+        """
+        transfer.waiting.remove(request)
+        self._notify()
+    #end _dequeue
+
+
+    def _acquire(self,transfer,count):
+        """
+        wait until the bytes given are granted to the transfer, as described in the class
+
+        :param transfer: bf_transfer object
+        :param count: bytes about to be transferred
+        :return: None
+        """
+        with self.condition:
+            request = self._enqueue(transfer,count)
+            if request is None:
+                return
+            #end if
+            try:
+                while True:
+                    granted, timeout = self._grant(transfer,count,request)
+                    if granted:
+                        break
+                    #end if
+                    self.condition.wait(timeout)
+                #end while
+            finally:
+                self._dequeue(transfer,request)
+            #end try
+        #end with
+    #end _acquire
+
+
+    async def _acquireAsync(self,transfer,count):
+        """
+        wait until the bytes given are granted to the transfer, as _acquire, from a coroutine.
+        The coroutine sleeps on an event, set through the event loop whenever the waiting ones are notified.
+        If it is cancelled while waiting, its request is removed and the transfer can go on
+
+        :param transfer: bf_transfer object
+        :param count: bytes about to be transferred
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+        def listener():
+            loop.call_soon_threadsafe(changed.set)
+        #end listener
+
+        with self.condition:
+            request = self._enqueue(transfer,count)
+            if request is None:
+                return
+            #end if
+            self.listeners.add(listener)
+        #end with
+        try:
+            while True:
+                with self.condition:
+                    # cleared holding the lock, so no notification is missed until the next wait
+                    changed.clear()
+                    granted, timeout = self._grant(transfer,count,request)
+                #end with
+                if granted:
+                    break
+                #end if
+                try:
+                    await asyncio.wait_for(changed.wait(),timeout)
+                except asyncio.TimeoutError:
+                    pass
+                #end try
+            #end while
+        finally:
+            with self.condition:
+                self.listeners.discard(listener)
+                self._dequeue(transfer,request)
+            #end with
+        #end try
+    #end _acquireAsync
+
+
+    def _cancel(self,transfer):
+        with self.condition:
+            transfer.cancelled = True
+            self._notify()
+        #end with
+    #end _cancel
+
+
+    def _close(self,transfer):
+        with self.condition:
+            queue = self.transfers[transfer.direction].get(transfer.priority,{})
+            queue.pop(transfer,None)
+            if not queue:
+                self.transfers[transfer.direction].pop(transfer.priority,None)
+            #end if
+            self._notify()
+        #end with
+    #end _close
+
+#end bf_scheduler
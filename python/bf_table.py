@@ -0,0 +1,409 @@
+"""
+compact columnar table of the packages and source files of a blackfynn dataset
+"""
+
+# import libraries
+from array import array
+
+
+class bf_package_table:
+
+    def __init__(self):
+        """
+        When instantiated, this class holds an empty table. Packages are added with add or addPage,
+        parsing only the fields kept, so the package dictionaries can be dropped right after.
+        Packages and source files are rows in parallel columns: ids and repeated strings (names, types, states)
+        are stored once in a shared pool and referenced by index, and numbers (parent row, sizes) are kept in arrays.
+        Children and files of a package are linked lists through the rows,
+        so adding a package or a file takes constant time, in any order of parents and children.
+        Packages whose parent is never added are kept at the root, and packages in a parent cycle get a partial path
+        """
+        #
+        # ids and strings shared by many rows: value -> index, and index -> value
+        self.stringIndex = {}
+        self.strings = []
+        #
+        # package columns, one item per row. Ids are indexes in the shared pool
+        self.ids = array('i')
+        self.names = array('i')
+        self.types = array('i')
+        self.states = array('i')
+        self.parents = array('i')
+        # first child and next sibling of each package, -1 for none
+        self.firstChild = array('i')
+        self.nextSibling = array('i')
+        # first source file of each package, -1 for none
+        self.firstFile = array('i')
+        #
+        # file columns, one item per file row. Ids are indexes in the shared pool
+        self.fileIds = array('i')
+        self.fileNames = array('i')
+        self.fileSizes = array('q')
+        self.filePackages = array('i')
+        self.fileChecksums = []
+        # next file of the same package, -1 for none
+        self.nextFile = array('i')
+        #
+        # package id (and integer id) -> row
+        self.rows = {}
+        # parent id -> rows of the children added before their parent
+        self.orphans = {}
+        # path -> row, built on first use and dropped when rows are added
+        self.pathIndex = None
+        self.filePathIndex = None
+    #end __init__
+
+
+    def __len__(self):
+        return len(self.ids)
+    #end __len__
+
+
+    def _string(self,value):
+        """
+        return the index of a shared id or string, adding it if new
+
+        :param value: string or id, or None
+        :return: index, -1 for None
+        """
+        if value is None:
+            return -1
+        #end if
+        index = self.stringIndex.get(value)
+        if index is None:
+            index = self.stringIndex[value] = len(self.strings)
+            self.strings.append(value)
+        #end if
+        return index
+    #end _string
+
+
+    def _value(self,index):
+        return self.strings[index] if index >= 0 else None
+    #end _value
+
+
+    def _link(self,row,parent):
+        """
+        set the parent of a row and add the row to the children of the parent
+
+        :param row: child row
+        :param parent: parent row
+        :return: None
+        """
+        self.parents[row] = parent
+        self.nextSibling[row] = self.firstChild[parent]
+        self.firstChild[parent] = row
+    #end _link
+
+
+    def add(self,package):
+        """
+        add a package, and its source files if it has been retrieved with them.
+        Packages already in the table are ignored
+
+        :param package: package dictionary
+        :return: row of the package
+        """
+        content = package['content']
+        if content['id'] in self.rows:
+            return self.rows[content['id']]
+        #end if
+
+        row = len(self.ids)
+        self.ids.append(self._string(content['id']))
+        self.names.append(self._string(content.get('name')))
+        self.types.append(self._string(content.get('packageType')))
+        self.states.append(self._string(content.get('state')))
+        self.parents.append(-1)
+        self.firstChild.append(-1)
+        self.nextSibling.append(-1)
+        self.firstFile.append(-1)
+        self.rows[self._value(self.ids[row])] = row
+        if 'intId' in content:
+            self.rows[content['intId']] = row
+        #end if
+        self.pathIndex = None
+        self.filePathIndex = None
+
+        # parents are matched by package id or by integer id
+        parentId = content.get('parentId')
+        if parentId is not None:
+            parent = self.rows.get(parentId)
+            if parent is not None:
+                self._link(row,parent)
+            else:
+                self.orphans.setdefault(parentId,[]).append(row)
+            #end if
+        #end if
+        for key in (content['id'],content.get('intId')):
+            for child in self.orphans.pop(key,[]):
+                self._link(child,row)
+            #end for
+        #end for
+
+        for source in package.get('objects',{}).get('source',[]):
+            self._addFile(row,source.get('content',source))
+        #end for
+
+        return row
+    #end add
+
+
+    def _addFile(self,row,source):
+        """
+        add a source file to a package
+
+        :param row: package row
+        :param source: dictionary with the content of the source file
+        :return: file row
+        """
+        fileRow = len(self.fileIds)
+        self.fileIds.append(self._string(source.get('id')))
+        # file name as in bf_rest.sourceFileName
+        if source.get('s3key'):
+            name = source['s3key'].rsplit('/',1)[-1]
+        else:
+            name = source.get('name','')
+        #end if
+        self.fileNames.append(self._string(name))
+        self.fileSizes.append(source.get('size') if source.get('size') is not None else -1)
+        self.filePackages.append(row)
+        checksum = source.get('checksum')
+        self.fileChecksums.append(checksum.get('checksum') if isinstance(checksum,dict) else checksum)
+        self.nextFile.append(self.firstFile[row])
+        self.firstFile[row] = fileRow
+        self.filePathIndex = None
+        return fileRow
+    #end _addFile
+
+
+    def addPage(self,page):
+        """
+        add all the packages of a page
+
+        :param page: dictionary with the packages of a page, as returned by the api, or list of packages
+        :return: None
+        """
+        for package in page['packages'] if isinstance(page,dict) else page:
+            self.add(package)
+        #end for
+    #end addPage
+
+
+    def row(self,pid):
+        """
+        return the row of a package
+
+        :param pid: package id or integer id
+        :return: row, None if not in the table
+        """
+        return self.rows.get(pid)
+    #end row
+
+
+    def package(self,row):
+        """
+        return the fields of a package
+
+        :param row: package row
+        :return: dictionary with id, name, packageType, state, parentId and path
+        """
+        parent = self.parents[row]
+        return {
+            'id'          : self._value(self.ids[row]),
+            'name'        : self._value(self.names[row]),
+            'packageType' : self._value(self.types[row]),
+            'state'       : self._value(self.states[row]),
+            'parentId'    : self._value(self.ids[parent]) if parent >= 0 else None,
+            'path'        : self.path(row),
+        }
+    #end package
+
+
+    def parent(self,row):
+        """
+        return the row of the parent of a package
+
+        :param row: package row
+        :return: parent row, None at the root of the dataset
+        """
+        parent = self.parents[row]
+        return parent if parent >= 0 else None
+    #end parent
+
+
+    def children(self,row=None):
+        """
+        iterate over the children of a package, or over the packages at the root of the dataset
+
+        :param row: package row. If left empty, the root of the dataset
+        :return: generator of rows
+        """
+        if row is None:
+            return (child for child in range(len(self.ids)) if self.parents[child] < 0)
+        #end if
+        return self._chain(self.firstChild[row],self.nextSibling)
+    #end children
+
+
+    def walk(self,row=None):
+        """
+        iterate over all the descendants of a package, or over all the packages reachable from the root,
+        parents before children. Packages in a parent cycle are not reached from the root
+
+        :param row: package row. If left empty, the root of the dataset
+        :return: generator of rows
+        """
+        stack = list(self.children(row))
+        while stack:
+            current = stack.pop()
+            if current == row:
+                # back to the package given, through a parent cycle
+                continue
+            #end if
+            yield current
+            stack.extend(self.children(current))
+        #end while
+    #end walk
+
+
+    @staticmethod
+    def _chain(first,following):
+        """
+        iterate over a linked list of rows
+
+        :param first: first row, -1 for an empty list
+        :param following: array with the next row of each row
+        :return: generator of rows
+        """
+        current = first
+        while current >= 0:
+            yield current
+            current = following[current]
+        #end while
+    #end _chain
+
+
+    def path(self,row):
+        """
+        return the path of a package, joining the names of its ancestors with "/".
+        In a parent cycle, the path is partial, from the first ancestor met twice
+
+        :param row: package row
+        :return: path string
+        """
+        names = []
+        seen = set()
+        current = row
+        while current >= 0 and current not in seen:
+            seen.add(current)
+            names.append(self._value(self.names[current]) or '')
+            current = self.parents[current]
+        #end while
+        return '/'.join(reversed(names))
+    #end path
+
+
+    def _rowPaths(self):
+        """
+        compute the path of every package, walking parents before children.
+        The packages not reached from the root, in a parent cycle or below one, get their partial path
+
+        :return: dictionary row -> path
+        """
+        paths = {}
+        for row in self.walk():
+            parent = self.parents[row]
+            name = self._value(self.names[row]) or ''
+            paths[row] = paths[parent] + '/' + name if parent >= 0 else name
+        #end for
+        if len(paths) < len(self.ids):
+            for row in range(len(self.ids)):
+                if row not in paths:
+                    paths[row] = self.path(row)
+                #end if
+            #end for
+        #end if
+        return paths
+    #end _rowPaths
+
+
+    def pathRow(self,path):
+        """
+        return the row of the package with the path given.
+        The index of paths is built on the first lookup after packages have been added
+
+        :param path: path string
+        :return: row, None if not in the table
+        """
+        if self.pathIndex is None:
+            self.pathIndex = {path : row for row, path in self._rowPaths().items()}
+        #end if
+        return self.pathIndex.get(path)
+    #end pathRow
+
+
+    def files(self,row):
+        """
+        iterate over the source files of a package
+
+        :param row: package row
+        :return: generator of file rows
+        """
+        return self._chain(self.firstFile[row],self.nextFile)
+    #end files
+
+
+    def file(self,fileRow):
+        """
+        return the fields of a source file
+
+        :param fileRow: file row
+        :return: dictionary with id, name, size, checksum and package id
+        """
+        size = self.fileSizes[fileRow]
+        return {
+            'id'        : self._value(self.fileIds[fileRow]),
+            'name'      : self._value(self.fileNames[fileRow]),
+            'size'      : size if size >= 0 else None,
+            'checksum'  : self.fileChecksums[fileRow],
+            'packageId' : self._value(self.ids[self.filePackages[fileRow]]),
+        }
+    #end file
+
+
+    def filePath(self,fileRow):
+        """
+        return the path of a source file: the path of the collection containing its package and its file name
+
+        :param fileRow: file row
+        :return: path string
+        """
+        parent = self.parents[self.filePackages[fileRow]]
+        name = self._value(self.fileNames[fileRow])
+        return self.path(parent) + '/' + name if parent >= 0 else name
+    #end filePath
+
+
+    def fileRow(self,path):
+        """
+        return the row of the source file with the path given.
+        The index of file paths is built on the first lookup after files have been added
+
+        :param path: path string
+        :return: file row, None if not in the table
+        """
+        if self.filePathIndex is None:
+            paths = self._rowPaths()
+            self.filePathIndex = {}
+            for fileRow in range(len(self.fileIds)):
+                parent = self.parents[self.filePackages[fileRow]]
+                name = self._value(self.fileNames[fileRow])
+                self.filePathIndex[paths[parent] + '/' + name if parent >= 0 else name] = fileRow
+            #end for
+        #end if
+        return self.filePathIndex.get(path)
+    #end fileRow
+
+#end bf_package_table
@@ -0,0 +1,63 @@
+"""
+fixtures shared by the tests, which run offline against bf_mock_server
+
+usage:
+    cd python
+    python -m pytest -q
+"""
+
+# import libraries
+import os
+import sys
+import pytest
+
+# the modules are imported flat, as the scripts in python do
+sys.path.insert(0,os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bf_mock_server import bf_mock_server
+from bf_rest import bf_rest
+
+
+@pytest.fixture
+def server():
+    """
+    mock server with small chunks, so small files are uploaded in several of them
+    """
+    with bf_mock_server(chunkSize=1024) as server:
+        yield server
+    #end with
+#end server
+
+
+@pytest.fixture
+def bf(server,tmp_path):
+    """
+    client with an open session on the mock server, saving the upload states in the test folder
+    """
+    bf = bf_rest('key','secret',apiUrl=server.url)
+    bf.resumeDir = str(tmp_path / 'uploads')
+    bf.initSession
+    yield bf
+    bf.close()
+#end bf
+
+
+def remoteContents(server,did):
+    """
+    return the content of the source files stored by the mock server for a dataset
+
+    :param server: bf_mock_server object
+    :param did: dataset id
+    :return: dictionary package name -> list of contents, in creation order
+    """
+    contents = {}
+    with server.lock:
+        for (pid, fid), data in server.files.items():
+            package = server.packages.get(pid)
+            if package is not None and package['content']['datasetId'] == did:
+                contents.setdefault(package['content']['name'],[]).append(data)
+            #end if
+        #end for
+    #end with
+    return contents
+#end remoteContents
@@ -0,0 +1,205 @@
+"""
+tests of the asyncio client, skipped if aiohttp is not installed
+"""
+
+# import libraries
+import asyncio
+import os
+import threading
+import time
+import pytest
+from bf_mock_server import bf_mock_handler
+from conftest import remoteContents
+
+pytest.importorskip('aiohttp')
+from bf_async import bf_async
+from bf_rest import bf_auth_error
+from bf_scheduler import bf_scheduler
+
+
+def test_expired_token_renewed_once(server):
+    did = server.createDataset('renewal')
+
+    async def run():
+        async with bf_async('key','secret',apiUrl=server.url) as bf:
+            # revoke the token: every request is rejected with 401 until it is renewed
+            with server.lock:
+                server.tokens.clear()
+            #end with
+            sessions = server.requests['initSession']
+            datasets = await asyncio.gather(*[bf.getDataset(did) for _ in range(20)])
+            assert server.requests['initSession'] - sessions == 1
+            assert all(dataset['content']['id'] == did for dataset in datasets)
+            assert bf.metrics.snapshot()['operations']['get_dataset']['errors'] == 0
+        #end async with
+    #end run
+
+    asyncio.run(run())
+#end test_expired_token_renewed_once
+
+
+def test_rejected_credentials(server,monkeypatch):
+    monkeypatch.setattr(bf_mock_handler,'initSession',lambda handler: handler._reply(401,b'<html>Unauthorized</html>'))
+
+    async def run():
+        bf = bf_async('key','secret',apiUrl=server.url)
+        try:
+            with pytest.raises(bf_auth_error):
+                await bf.initSession()
+            #end with
+        finally:
+            await bf.close()
+        #end try
+    #end run
+
+    asyncio.run(run())
+#end test_rejected_credentials
+
+
+def test_transfers_through_scheduler(server,tmp_path):
+    did = server.createDataset('async')
+    data = os.urandom(5000)
+    path = tmp_path / 'file.bin'
+    path.write_bytes(data)
+
+    async def run():
+        async with bf_async('key','secret',apiUrl=server.url) as bf:
+            bf.scheduler.setRate('upload',1048576)
+            bf.scheduler.setRate('download',1048576)
+            result = await bf.uploadFile(did,str(path),'file.bin')
+            assert not isinstance(result,bytes)
+
+            with server.lock:
+                pid = next(iter(server.packages))
+                fid = server.packages[pid]['sources'][0]['content']['id']
+            #end with
+            assert await bf.getFileContent(pid,fid) == data
+            local = str(tmp_path / 'copy.bin')
+            await bf.downloadFile(pid,fid,local)
+            with open(local,'rb') as fh:
+                assert fh.read() == data
+            #end with
+
+            assert bf.scheduler.active() == []
+        #end async with
+    #end run
+
+    asyncio.run(run())
+    assert remoteContents(server,did) == {'file.bin' : [data]}
+#end test_transfers_through_scheduler
+
+
+def test_failed_download_keeps_existing_file(server,tmp_path,monkeypatch):
+    did = server.createDataset('failed')
+    pid = server.createPackage(did,'file.bin','Unsupported',content=os.urandom(5000))
+    with server.lock:
+        fid = server.packages[pid]['sources'][0]['content']['id']
+    #end with
+    local = tmp_path / 'file.bin'
+    local.write_bytes(b'previous')
+
+    async def run():
+        async with bf_async('key','secret',apiUrl=server.url) as bf:
+            bf.maxRetries = 0
+
+            # rejected before anything is written
+            monkeypatch.setattr(bf_mock_handler,'getStorage',lambda handler, pid, fid: handler._reply(500,b'failed'))
+            with pytest.raises(Exception):
+                await bf.downloadFile(pid,fid,str(local))
+            #end with
+            assert os.listdir(str(tmp_path)) == ['file.bin']
+            monkeypatch.undo()
+
+            # interrupted in the middle of the content
+            readBlocks = bf._readBlocks
+            async def failingBlocks(response,transfer):
+                async for block in readBlocks(response,transfer):
+                    yield block
+                    raise IOError('connection dropped')
+                #end for
+            #end failingBlocks
+            bf._readBlocks = failingBlocks
+            with pytest.raises(IOError):
+                await bf.downloadFile(pid,fid,str(local))
+            #end with
+            assert os.listdir(str(tmp_path)) == ['file.bin']
+            assert local.read_bytes() == b'previous'
+
+            bf._readBlocks = readBlocks
+            await bf.downloadFile(pid,fid,str(local))
+        #end async with
+    #end run
+
+    asyncio.run(run())
+    with server.lock:
+        assert local.read_bytes() == server.files[(pid,fid)]
+    #end with
+    assert os.listdir(str(tmp_path)) == ['file.bin']
+#end test_failed_download_keeps_existing_file
+
+
+def test_scheduler_waits_without_threads():
+    scheduler = bf_scheduler(downloadRate=100000,burst=0.01)
+
+    async def run():
+        threads = threading.active_count()
+        order = []
+        bulk = [scheduler.transfer('download',bf_scheduler.BULK,'bulk{}'.format(index)) for index in range(20)]
+        interactive = scheduler.transfer('download',bf_scheduler.INTERACTIVE,'interactive')
+
+        async def acquire(transfer):
+            await transfer.acquireAsync(1000)
+            order.append(transfer.name)
+        #end acquire
+        tasks = [asyncio.ensure_future(acquire(transfer)) for transfer in bulk]
+        await asyncio.sleep(0.02)
+        # queued after the bulk ones, granted before most of them
+        tasks.append(asyncio.ensure_future(acquire(interactive)))
+        await asyncio.sleep(0.02)
+        assert threading.active_count() == threads
+
+        started = time.monotonic()
+        await asyncio.gather(*tasks)
+        assert time.monotonic() - started > 0.05
+        assert order.index('interactive') < 10
+        for transfer in bulk + [interactive]:
+            transfer.close()
+        #end for
+    #end run
+
+    asyncio.run(run())
+    assert scheduler.listeners == set()
+#end test_scheduler_waits_without_threads
+
+
+def test_scheduler_cancelled_wait_withdrawn():
+    scheduler = bf_scheduler(downloadRate=1000,burst=1.0)
+
+    async def run():
+        first = scheduler.transfer('download',name='first')
+        second = scheduler.transfer('download',name='second')
+        # drains the bucket, the next block waits about a second
+        await first.acquireAsync(1000)
+        waiting = asyncio.ensure_future(first.acquireAsync(1000))
+        await asyncio.sleep(0.05)
+        assert len(first.waiting) == 1
+
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        #end with
+        assert first.waiting == []
+        assert not first.cancelled
+
+        # a thread and a coroutine waiting together
+        thread = threading.Thread(target=second.acquire,args=(100,))
+        thread.start()
+        await first.acquireAsync(100)
+        await asyncio.get_running_loop().run_in_executor(None,thread.join)
+        assert second.bytes == 100
+        first.close()
+        second.close()
+    #end run
+
+    asyncio.run(run())
+#end test_scheduler_cancelled_wait_withdrawn
@@ -0,0 +1,114 @@
+"""
+tests of the on-disk content cache and of its use by bf_rest
+"""
+
+# import libraries
+import hashlib
+import json
+import os
+from bf_cache import bf_content_cache
+
+
+def test_insert_get_remove(tmp_path):
+    cache = bf_content_cache(str(tmp_path / 'cache'),1000)
+    data = os.urandom(100)
+
+    path = cache.store('N:package:1',1,data)
+
+    assert cache.get('N:package:1',1) == path
+    assert cache.read('N:package:1',1,100,hashlib.sha256(data).hexdigest()) == data
+    assert bytes(cache.map('N:package:1',1)) == data
+    assert cache.get('N:package:1',2) is None
+
+    # a size or checksum that does not match removes the entry
+    assert cache.read('N:package:1',1,checksum=hashlib.sha256(b'other').hexdigest()) is None
+    assert cache.get('N:package:1',1) is None
+
+    cache.store('N:package:1',1,data)
+    assert cache.get('N:package:1',1,size=99) is None
+    assert cache.get('N:package:1',1) is None
+#end test_insert_get_remove
+
+
+def test_least_recently_used_evicted(tmp_path):
+    cache = bf_content_cache(str(tmp_path / 'cache'),250)
+    for index in range(3):
+        cache.store('N:package:{}'.format(index),index,b'x' * 100)
+        # distinct modification times, whatever the resolution of the file system
+        os.utime(cache._paths('N:package:{}'.format(index),index)[0],(index,index))
+    #end for
+
+    assert cache.get('N:package:0',0) is None
+    assert cache.get('N:package:1',1) is not None
+    assert cache.get('N:package:2',2) is not None
+#end test_least_recently_used_evicted
+
+
+def test_total_kept_in_index(tmp_path,monkeypatch):
+    cache = bf_content_cache(str(tmp_path / 'cache'),1000)
+    cache.store('N:package:1',1,b'x' * 100)
+    cache.store('N:package:2',2,b'x' * 200)
+    # replaced
+    cache.store('N:package:2',2,b'x' * 50)
+    cache.remove('N:package:1',1)
+
+    with open(cache.indexFile) as fh:
+        assert json.load(fh)['total'] == 50
+    #end with
+
+    # the folder is not listed while within the limit
+    scans = []
+    scandir = os.scandir
+    monkeypatch.setattr(os,'scandir',lambda path: scans.append(path) or scandir(path))
+    for index in range(10):
+        cache.store('N:package:{}'.format(index),index,b'x' * 10)
+    #end for
+    assert scans == []
+
+    cache.clear()
+    with open(cache.indexFile) as fh:
+        assert json.load(fh)['total'] == 0
+    #end with
+#end test_total_kept_in_index
+
+
+def test_missing_index_computed_again(tmp_path):
+    cache = bf_content_cache(str(tmp_path / 'cache'),150)
+    cache.store('N:package:1',1,b'x' * 100)
+    os.remove(cache.indexFile)
+
+    cache.store('N:package:2',2,b'x' * 100)
+
+    with open(cache.indexFile) as fh:
+        assert json.load(fh)['total'] == 100
+    #end with
+#end test_missing_index_computed_again
+
+
+def test_stale_content_not_served(server,bf,tmp_path):
+    did = server.createDataset('cache')
+    pid = server.createPackage(did,'file.bin','Unsupported',content=b'1' * 100)
+    with server.lock:
+        fid = server.packages[pid]['sources'][0]['content']['id']
+    #end with
+    bf.enableContentCache(str(tmp_path / 'cache'),1000000)
+
+    assert bf.getFileContent(pid,fid) == b'1' * 100
+    downloads = server.requests['getStorage']
+    assert bf.getFileContent(pid,fid) == b'1' * 100
+    assert server.requests['getStorage'] == downloads
+
+    # the file changes on blackfynn, with the same ids
+    with server.lock:
+        server.files[(pid,fid)] = b'2' * 100
+        server.packages[pid]['sources'][0]['content']['checksum'] = hashlib.sha256(b'2' * 100).hexdigest()
+    #end with
+
+    assert bf.getFileContent(pid,fid) == b'2' * 100
+    local = str(tmp_path / 'file.bin')
+    bf.downloadFile(pid,fid,local)
+    with open(local,'rb') as fh:
+        assert fh.read() == b'2' * 100
+    #end with
+    assert server.requests['getStorage'] == downloads + 1
+#end test_stale_content_not_served
@@ -0,0 +1,178 @@
+"""
+tests of the chunk sources used by the uploads
+"""
+
+# import libraries
+import hashlib
+import os
+from array import array
+import pytest
+from bf_chunks import bf_buffer_source, bf_chunk_source, bf_stream_source
+from conftest import remoteContents
+
+
+def test_file_chunks_are_slices_of_the_map(tmp_path):
+    data = os.urandom(10000)
+    path = tmp_path / 'file.bin'
+    path.write_bytes(data)
+    source = bf_chunk_source(str(path),4096,[2,0,1])
+
+    chunks = []
+    for chunk, view, checksum in source:
+        # handed out without copying the file
+        assert view.obj is source.map
+        assert checksum == hashlib.sha256(view).hexdigest()
+        chunks.append((chunk,bytes(view)))
+        source.release(view)
+    #end for
+    source.close()
+
+    assert chunks == [(2,data[8192:]),(0,data[:4096]),(1,data[4096:8192])]
+    assert source.map.closed
+    assert source.fh.closed
+#end test_file_chunks_are_slices_of_the_map
+
+
+def test_file_closed_once_chunks_are_released(tmp_path):
+    path = tmp_path / 'file.bin'
+    path.write_bytes(os.urandom(5000))
+    source = bf_chunk_source(str(path),1024,range(5))
+
+    views = [view for chunk, view, checksum in source]
+    source.close()
+    # the uploads still hold slices of the map
+    assert not source.map.closed
+    for view in views[:-1]:
+        source.release(view)
+    #end for
+    assert not source.map.closed
+
+    source.release(views[-1])
+    assert source.map.closed
+    assert source.fh.closed
+#end test_file_closed_once_chunks_are_released
+
+
+def test_empty_file(tmp_path):
+    path = tmp_path / 'empty.bin'
+    path.write_bytes(b'')
+    source = bf_chunk_source(str(path),1024,[0])
+
+    chunks = []
+    for chunk, view, checksum in source:
+        chunks.append((chunk,bytes(view),checksum))
+        source.release(view)
+    #end for
+    source.close()
+
+    assert chunks == [(0,b'',hashlib.sha256(b'').hexdigest())]
+    assert source.fh.closed
+#end test_empty_file
+
+
+def test_upload_checksums_computed_ahead(server,bf,tmp_path):
+    did = server.createDataset('hashing')
+    data = os.urandom(8 * 1024)
+    path = tmp_path / 'file.bin'
+    path.write_bytes(data)
+
+    # the mock server rejects chunks whose checksum does not match their content
+    result = bf.uploadFile(did,str(path),'file.bin')
+
+    assert not isinstance(result,bytes)
+    assert server.requests['uploadChunk'] == 8
+    with server.lock:
+        assert list(server.files.values()) == [data]
+    #end with
+#end test_upload_checksums_computed_ahead
+
+
+def test_buffer_chunks_are_slices_of_the_buffer():
+    data = bytearray(os.urandom(5000))
+    source = bf_buffer_source(data,2048,range(3))
+
+    chunks = []
+    for chunk, view, checksum in source:
+        assert view.obj is data
+        assert checksum == hashlib.sha256(view).hexdigest()
+        chunks.append(bytes(view))
+        source.release(view)
+    #end for
+    source.close()
+
+    assert b''.join(chunks) == data
+    # the buffer can be resized again once the source has released it
+    data.extend(b'more')
+#end test_buffer_chunks_are_slices_of_the_buffer
+
+
+def test_typed_and_strided_buffers():
+    numbers = array('i',range(1000))
+    source = bf_buffer_source(numbers,1024,range(4))
+    assert b''.join(bytes(source.chunk(chunk)) for chunk in range(4)) == numbers.tobytes()
+    source.close()
+
+    with pytest.raises(ValueError):
+        bf_buffer_source(memoryview(b'0123456789')[::2],4,range(2))
+    #end with
+#end test_typed_and_strided_buffers
+
+
+def test_stream_rechunked():
+    pieces = [b'a' * 2048, b'b' * 100, b'c' * 2000, b'd' * 1000]
+    source = bf_stream_source(iter(pieces),1024,sum(len(piece) for piece in pieces))
+
+    chunks = []
+    for chunk, view, checksum in source:
+        assert checksum is None
+        chunks.append((chunk,bytes(view),view.obj is pieces[0]))
+        source.release(view)
+    #end for
+
+    assert [chunk for chunk, content, sliced in chunks] == list(range(6))
+    assert b''.join(content for chunk, content, sliced in chunks) == b''.join(pieces)
+    assert [len(content) for chunk, content, sliced in chunks] == [1024] * 5 + [28]
+    # chunks within the first piece are slices of it, the others are assembled
+    assert [sliced for chunk, content, sliced in chunks] == [True,True,False,False,False,False]
+#end test_stream_rechunked
+
+
+def test_stream_size_checked():
+    with pytest.raises(ValueError):
+        list(bf_stream_source([b'x' * 10],4,8))
+    #end with
+    with pytest.raises(ValueError):
+        list(bf_stream_source([b'x' * 10],4,12))
+    #end with
+    assert [(chunk,bytes(view)) for chunk, view, checksum in bf_stream_source([],4,0)] == [(0,b'')]
+#end test_stream_size_checked
+
+
+def test_upload_buffer_and_stream(server,bf):
+    did = server.createDataset('memory')
+    data = os.urandom(5000)
+
+    assert not isinstance(bf.uploadBuffer(did,bytearray(data),'buffer.bin'),bytes)
+    assert not isinstance(bf.uploadBuffer(did,memoryview(data),'view.bin'),bytes)
+    assert not isinstance(bf.uploadStream(did,(data[start:start + 700] for start in range(0,5000,700)),5000,'stream.bin'),bytes)
+    assert not isinstance(bf.uploadBuffer(did,b'','empty.bin'),bytes)
+
+    assert remoteContents(server,did) == {
+        'buffer.bin' : [data],
+        'view.bin'   : [data],
+        'stream.bin' : [data],
+        'empty.bin'  : [b''],
+    }
+    # 5 chunks each, 1 for the empty file
+    assert server.requests['uploadChunk'] == 16
+#end test_upload_buffer_and_stream
+
+
+def test_upload_stream_of_wrong_size(server,bf):
+    did = server.createDataset('wrong')
+
+    with pytest.raises(ValueError):
+        bf.uploadStream(did,[b'x' * 100],200,'short.bin')
+    #end with
+    assert remoteContents(server,did) == {}
+#end test_upload_stream_of_wrong_size
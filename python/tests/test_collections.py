@@ -0,0 +1,128 @@
+"""
+tests of the creation of collection trees
+"""
+
+# import libraries
+import threading
+import time
+import pytest
+from bf_mock_server import bf_mock_handler
+
+
+def remoteCollections(server,did):
+    """
+    return the collections stored by the mock server for a dataset, by path
+
+    :param server: bf_mock_server object
+    :param did: dataset id
+    :return: dictionary path -> collection id
+    """
+    with server.lock:
+        byIntId = {package['content']['intId'] : pid for pid, package in server.packages.items()}
+        parents = {}
+        names = {}
+        for pid, package in server.packages.items():
+            if package['content']['datasetId'] == did and package['content']['packageType'] == 'Collection':
+                names[pid] = package['content']['name']
+                parents[pid] = byIntId.get(package['content'].get('parentId'))
+            #end if
+        #end for
+    #end with
+    paths = {}
+    for pid in names:
+        path = []
+        current = pid
+        while current is not None:
+            path.insert(0,names[current])
+            current = parents[current]
+        #end while
+        paths['/'.join(path)] = pid
+    #end for
+    return paths
+#end remoteCollections
+
+
+def test_create_tree(server,bf):
+    did = server.createDataset('tree')
+
+    created = bf.createCollectionTree(did,{'raw' : {'day1' : None, 'day2' : {'a' : {}}}, 'derived' : {}})
+
+    assert sorted(created) == ['derived','raw','raw/day1','raw/day2','raw/day2/a']
+    assert created == remoteCollections(server,did)
+#end test_create_tree
+
+
+def test_existing_collections_reused(server,bf):
+    did = server.createDataset('reuse')
+    raw = server.createPackage(did,'raw','Collection')
+    day1 = server.createPackage(did,'day1','Collection',raw)
+    creations = server.requests.get('createPackage',0)
+
+    created = bf.createCollectionTree(did,['raw/day1','raw/day2','/derived/'])
+
+    assert created['raw'] == raw
+    assert created['raw/day1'] == day1
+    assert sorted(created) == ['derived','raw','raw/day1','raw/day2']
+    assert server.requests['createPackage'] - creations == 2
+    assert created == remoteCollections(server,did)
+#end test_existing_collections_reused
+
+
+def test_tree_in_collection(server,bf):
+    did = server.createDataset('nested')
+    cid = server.createPackage(did,'root','Collection')
+
+    created = bf.createCollectionTree(did,{'a' : {'b' : None}},cid)
+
+    assert {'root/' + path : pid for path, pid in created.items()} == \
+        {path : pid for path, pid in remoteCollections(server,did).items() if path != 'root'}
+#end test_tree_in_collection
+
+
+def test_siblings_created_in_parallel(server,bf,monkeypatch):
+    did = server.createDataset('parallel')
+    createPackage = bf_mock_handler.createPackage
+    inFlight = [0,0]
+    lock = threading.Lock()
+    def slowCreate(handler):
+        with lock:
+            inFlight[0] += 1
+            inFlight[1] = max(inFlight)
+        #end with
+        time.sleep(0.2)
+        with lock:
+            inFlight[0] -= 1
+        #end with
+        createPackage(handler)
+    #end slowCreate
+    monkeypatch.setattr(bf_mock_handler,'createPackage',slowCreate)
+
+    started = time.monotonic()
+    created = bf.createCollectionTree(did,['top/{}'.format(index) for index in range(bf.syncWorkers)])
+    elapsed = time.monotonic() - started
+
+    assert len(created) == bf.syncWorkers + 1
+    assert inFlight[1] == bf.syncWorkers
+    # one round for the parent and one for all its children
+    assert elapsed < 0.2 * (bf.syncWorkers + 1) / 2
+#end test_siblings_created_in_parallel
+
+
+def test_failure_reported(server,bf,monkeypatch):
+    did = server.createDataset('failure')
+    bf.maxRetries = 0
+    createPackage = bf_mock_handler.createPackage
+    def failingCreate(handler):
+        if b'"bad"' in handler.body:
+            return handler._reply(400,b'invalid name')
+        #end if
+        createPackage(handler)
+    #end failingCreate
+    monkeypatch.setattr(bf_mock_handler,'createPackage',failingCreate)
+
+    with pytest.raises(IOError,match='bad'):
+        bf.createCollectionTree(did,{'good' : None, 'bad' : None})
+    #end with
+    # the siblings of the failed collection are created anyway
+    assert list(remoteCollections(server,did)) == ['good']
+#end test_failure_reported
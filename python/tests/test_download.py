@@ -0,0 +1,192 @@
+"""
+tests of the downloads and remote reads of bf_rest
+"""
+
+# import libraries
+import os
+import time
+from bf_mock_server import bf_mock_server
+from bf_rest import bf_rest
+
+
+def createFile(server,did,name,data):
+    """
+    create a package with one source file on the mock server
+
+    :return: (package id, file id)
+    """
+    pid = server.createPackage(did,name,'Unsupported',content=data)
+    with server.lock:
+        fid = server.packages[pid]['sources'][0]['content']['id']
+    #end with
+    return pid, fid
+#end createFile
+
+
+def test_ranged_download_metrics(server,bf,tmp_path):
+    did = server.createDataset('ranged')
+    data = os.urandom(1048576)
+    pid, fid = createFile(server,did,'big.bin',data)
+    bf.rangeThreshold = 262144
+    bf.rangeSize = 262144
+    local = str(tmp_path / 'big.bin')
+
+    bf.downloadFile(pid,fid,local)
+
+    with open(local,'rb') as fh:
+        assert fh.read() == data
+    #end with
+    operations = bf.metrics.snapshot()['operations']
+    # the first response is only used to find the size: its body is not read
+    assert operations['download_file']['requests'] == 1
+    assert operations['download_file']['bytesDown'] < bf.downloadBlockSize
+    assert operations['download_range']['requests'] == 4
+    assert operations['download_range']['bytesDown'] == len(data)
+    assert operations['download_range']['errors'] == 0
+#end test_ranged_download_metrics
+
+
+def test_streamed_download_metrics(server,bf,tmp_path):
+    did = server.createDataset('streamed')
+    data = os.urandom(300000)
+    pid, fid = createFile(server,did,'file.bin',data)
+
+    bf.downloadFile(pid,fid,str(tmp_path / 'file.bin'))
+
+    operations = bf.metrics.snapshot()['operations']
+    assert operations['download_file']['bytesDown'] == len(data)
+    assert 'download_range' not in operations
+#end test_streamed_download_metrics
+
+
+def test_open_file_reads_ranges(server,bf):
+    did = server.createDataset('remote')
+    data = os.urandom(300000)
+    pid, fid = createFile(server,did,'file.bin',data)
+
+    with bf.openFile(pid,fid,blockSize=65536,readAhead=2) as fh:
+        assert len(bf.scheduler.active('download')) == 1
+        fh.seek(100000)
+        assert fh.read(1000) == data[100000:101000]
+        fh.seek(0)
+        assert fh.read() == data
+    #end with
+
+    assert bf.scheduler.active() == []
+#end test_open_file_reads_ranges
+
+
+def test_download_dataset_conflicts(server,bf,tmp_path):
+    did = server.createDataset('dataset')
+    createFile(server,did,'a.bin',b'1' * 10)
+    createFile(server,did,'b.bin',b'2' * 20)
+    # held by a package of its own and used as partial download of a.bin
+    createFile(server,did,'a.bin.part',b'3' * 30)
+
+    summary = bf.downloadDataset(did,str(tmp_path))
+
+    assert summary['downloaded'] == ['b.bin']
+    assert sorted(summary['failed']) == ['a.bin','a.bin.part']
+    with open(str(tmp_path / 'b.bin'),'rb') as fh:
+        assert fh.read() == b'2' * 20
+    #end with
+
+    summary = bf.downloadDataset(did,str(tmp_path))
+    assert summary['downloaded'] == []
+    assert summary['skipped'] == ['b.bin']
+#end test_download_dataset_conflicts
+
+
+def test_storage_ignoring_ranges(tmp_path):
+    with bf_mock_server(rangeRequests=False) as server:
+        bf = bf_rest('key','secret',apiUrl=server.url)
+        bf.initSession
+        did = server.createDataset('ignored')
+        data = os.urandom(500000)
+        pid, fid = createFile(server,did,'file.bin',data)
+        bf.rangeThreshold = 65536
+        bf.rangeSize = 65536
+
+        # streamed as a whole, since ranges are not advertised
+        local = str(tmp_path / 'file.bin')
+        bf.downloadFile(pid,fid,local)
+        with open(local,'rb') as fh:
+            assert fh.read() == data
+        #end with
+
+        # the whole content received by the first read serves all the others
+        requests = server.requests['getStorage']
+        with bf.openFile(pid,fid,blockSize=65536,readAhead=2) as fh:
+            assert fh.read() == data
+            fh.seek(250000)
+            assert fh.read(10) == data[250000:250010]
+        #end with
+        assert server.requests['getStorage'] - requests == 1
+        bf.close()
+    #end with
+#end test_storage_ignoring_ranges
+
+
+def test_download_dataset_total(server,bf,tmp_path):
+    did = server.createDataset('total')
+    createFile(server,did,'a.bin',b'1' * 10)
+    createFile(server,did,'b.bin',b'2' * 20)
+    totals = []
+
+    # only the files still to download are counted, from the same listing
+    bf.downloadDataset(did,str(tmp_path),onTotal=totals.append)
+    (tmp_path / 'c.bin').write_bytes(b'3' * 30)
+    bf.downloadDataset(did,str(tmp_path),onTotal=totals.append)
+    bf.syncDirectory(did,str(tmp_path),onTotal=totals.append)
+
+    assert totals == [30,0,30]
+    assert server.requests['getPackages'] == 3
+#end test_download_dataset_total
+
+
+def test_download_rate_limit(server,bf):
+    did = server.createDataset('limited')
+    data = os.urandom(1048576)
+    pid, fid = createFile(server,did,'file.bin',data)
+    bf.downloadBlockSize = 131072
+    bf.scheduler.burst = 0.1
+    bf.scheduler.setRate('download',4 * 1048576)
+
+    started = time.monotonic()
+    assert bf.getFileContent(pid,fid) == data
+    elapsed = time.monotonic() - started
+
+    # a quarter of a second at 4 MB/s, after the small burst
+    assert elapsed >= 0.2
+    assert bf.scheduler.active() == []
+#end test_download_rate_limit
+
+
+def test_failed_download_leaves_no_partial_file(server,bf,tmp_path,monkeypatch):
+    did = server.createDataset('partial')
+    createFile(server,did,'a.bin',os.urandom(300000))
+    createFile(server,did,'b.bin',b'2' * 20)
+
+    # the storage connection drops in the middle of a.bin
+    downloadFile = bf.downloadFile
+    def failingDownload(pid,fid,filename,priority=None,source=None):
+        if filename.endswith('a.bin.part'):
+            with open(filename,'wb') as fh:
+                fh.write(b'1' * 1000)
+            #end with
+            raise IOError('connection dropped')
+        #end if
+        return downloadFile(pid,fid,filename,priority,source)
+    #end failingDownload
+    monkeypatch.setattr(bf,'downloadFile',failingDownload)
+
+    summary = bf.downloadDataset(did,str(tmp_path))
+    assert summary['failed'] == {'a.bin' : 'connection dropped'}
+    assert sorted(os.listdir(str(tmp_path))) == ['b.bin']
+
+    # the next run downloads it
+    monkeypatch.undo()
+    summary = bf.downloadDataset(did,str(tmp_path))
+    assert summary['downloaded'] == ['a.bin']
+    assert summary['failed'] == {}
+#end test_failed_download_leaves_no_partial_file
@@ -0,0 +1,105 @@
+"""
+tests of the persistent package index
+"""
+
+# import libraries
+import time
+import pytest
+from bf_index import bf_index
+
+
+@pytest.fixture
+def index(bf,tmp_path):
+    index = bf_index(bf,str(tmp_path / 'index.sqlite'))
+    yield index
+    index.close()
+#end index
+
+
+def createTree(server,did):
+    """
+    create a collection with a file in it and a file at the root of the dataset
+
+    :return: (collection id, id of the file in the collection, id of the file at the root)
+    """
+    cid = server.createPackage(did,'a','Collection')
+    inner = server.createPackage(did,'one.bin','Unsupported',cid,b'1' * 10)
+    outer = server.createPackage(did,'two.bin','Unsupported',None,b'2' * 20)
+    return cid, inner, outer
+#end createTree
+
+
+def updatePackage(server,pid,name):
+    """
+    rename a package on the mock server without touching its dataset, as the api does for some changes
+    """
+    with server.lock:
+        content = server.packages[pid]['content']
+        content['name'] = name
+        content['updatedAt'] = '{:.6f}'.format(time.time() + 1)
+    #end with
+#end updatePackage
+
+
+def test_lookups(server,index):
+    did = server.createDataset('index')
+    cid, inner, outer = createTree(server,did)
+
+    assert index.refresh(did)
+
+    assert index.getPackage(inner)['path'] == 'a/one.bin'
+    assert index.getPackage('N:package:unknown') is None
+    assert [package['content']['id'] for package in index.findPackages(did,'two.bin')] == [outer]
+    assert sorted(package['content']['id'] for package in index.getChildren(did)) == sorted([cid,outer])
+    assert [package['content']['id'] for package in index.getChildren(did,cid)] == [inner]
+    assert index.getPackageByPath(did,'/a/one.bin')['content']['id'] == inner
+    assert index.getPackageByPath(did,'a/two.bin') is None
+    assert [source['size'] for source in index.getSourceFiles(outer)] == [20]
+    assert [pid for pid, source in index.findSourceFiles(did,'one.bin')] == [inner]
+#end test_lookups
+
+
+def test_refresh_after_add_update_delete(server,bf,index):
+    did = server.createDataset('refresh')
+    cid, inner, outer = createTree(server,did)
+    index.refresh(did)
+
+    # added
+    added = server.createPackage(did,'three.bin','Unsupported',cid,b'3' * 30)
+    sources = server.requests.get('getSources',0)
+    assert index.refresh(did)
+    assert index.getPackageByPath(did,'a/three.bin')['content']['id'] == added
+    # only the source files of the new package are retrieved
+    assert server.requests['getSources'] - sources == 1
+
+    # updated without the dataset being updated
+    updatePackage(server,cid,'b')
+    assert index.refresh(did)
+    assert index.getPackageByPath(did,'a/one.bin') is None
+    assert index.getPackageByPath(did,'b/one.bin')['content']['id'] == inner
+
+    # deleted
+    bf.deletePackages([outer])
+    assert index.refresh(did)
+    assert index.getPackage(outer) is None
+    assert index.getSourceFiles(outer) == []
+    assert index.findSourceFiles(did,'two.bin') == []
+#end test_refresh_after_add_update_delete
+
+
+def test_refresh_skip_unchanged(server,index):
+    did = server.createDataset('skip')
+    cid, inner, outer = createTree(server,did)
+    index.refresh(did)
+    listings = server.requests['getPackages']
+
+    # trusted, the update time of the dataset skips the listing
+    updatePackage(server,outer,'renamed.bin')
+    assert not index.refresh(did,skipUnchanged=True)
+    assert server.requests['getPackages'] == listings
+    assert index.findPackages(did,'renamed.bin') == []
+
+    # by default the packages are listed anyway
+    assert index.refresh(did)
+    assert [package['content']['id'] for package in index.findPackages(did,'renamed.bin')] == [outer]
+#end test_refresh_skip_unchanged
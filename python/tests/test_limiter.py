@@ -0,0 +1,106 @@
+"""
+tests of the adaptive concurrency limiter and of its use by bf_rest
+"""
+
+# import libraries
+import os
+from bf_limiter import bf_limiter
+from bf_mock_server import bf_mock_server
+from bf_rest import bf_rest
+
+
+def completeFull(limiter,successes):
+    """
+    report the successes given while the limiter is kept full, as busy workers do:
+    every operation over is replaced by a new one right away
+    """
+    while limiter.inFlight < int(limiter.limit):
+        limiter.acquire()
+    #end while
+    for _ in range(successes):
+        limiter.onSuccess()
+        limiter.release()
+        while limiter.inFlight < int(limiter.limit):
+            limiter.acquire()
+        #end while
+    #end for
+    while limiter.inFlight > 0:
+        limiter.release()
+    #end while
+#end completeFull
+
+
+def test_limit_grows_when_full():
+    limiter = bf_limiter(2,maximum=4)
+
+    # each success raises it by increase / limit, about one for each window of limit successes
+    completeFull(limiter,3)
+    assert int(limiter.limit) == 3
+
+    completeFull(limiter,20)
+    assert limiter.limit == 4
+#end test_limit_grows_when_full
+
+
+def test_limit_does_not_grow_below_capacity():
+    limiter = bf_limiter(4,maximum=16)
+
+    # one operation at a time never fills the limiter
+    for _ in range(100):
+        with limiter:
+            limiter.onSuccess()
+        #end with
+    #end for
+
+    assert limiter.limit == 4
+#end test_limit_does_not_grow_below_capacity
+
+
+def test_limit_backs_off_once_per_cooldown():
+    limiter = bf_limiter(8,minimum=1,cooldown=60)
+
+    limiter.onThrottle()
+    limiter.onThrottle()
+    assert limiter.limit == 4
+
+    limiter.lastDecrease -= 60
+    limiter.onThrottle()
+    assert limiter.limit == 2
+
+    limiter.setLimit(100,maximum=10)
+    assert limiter.limit == 10
+    limiter.setLimit(0)
+    assert limiter.limit == 1
+#end test_limit_backs_off_once_per_cooldown
+
+
+def test_throttled_chunks_back_off(tmp_path):
+    with bf_mock_server(chunkSize=1024,errorRate=1.0,errorStatus=429) as server:
+        bf = bf_rest('key','secret',apiUrl=server.url)
+        bf.initSession
+        did = server.createDataset('throttled')
+        path = tmp_path / 'file.bin'
+        path.write_bytes(os.urandom(4096))
+        bf.maxRetries = 1
+        bf.backoffBase = 0.0
+        bf.uploadLimiter.setLimit(8,maximum=8)
+
+        # every request but the session one is throttled, the preview included
+        result = bf.uploadFile(did,str(path),'file.bin')
+        assert isinstance(result,bytes)
+
+        server.errorRate = 0.0
+        preview = bf._uploadPreview(bf.organization,did,None,[('file.bin',4096)]).json()
+        importId = preview['packages'][0]['importId']
+        multipartId = preview['packages'][0]['files'][0]['multipartUploadId']
+        url = bf.urls['upload_chunk'].replace('<OID>',bf.organization).replace('<IID>',importId)
+        server.errorRate = 1.0
+        response = bf._uploadChunk(url,'file.bin',multipartId,0,b'0' * 1024)
+
+        assert response.status_code == 429
+        assert bf.uploadLimiter.limit == 4
+        assert bf.uploadLimiter.inFlight == 0
+        assert bf.metrics.snapshot()['operations']['upload_chunk']['retries'] == 1
+        bf.close()
+    #end with
+#end test_throttled_chunks_back_off
@@ -0,0 +1,122 @@
+"""
+tests of the registry of the operations in flight
+"""
+
+# import libraries
+import os
+import threading
+import time
+import pytest
+from bf_operations import bf_operations
+
+
+def test_concurrent_operations_get_unique_ids():
+    operations = bf_operations()
+    names = []
+    lock = threading.Lock()
+
+    def run():
+        started = [operations.start('upload') for _ in range(200)]
+        with lock:
+            names.extend(started)
+        #end with
+    #end run
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    #end for
+    for thread in threads:
+        thread.join()
+    #end for
+
+    assert len(set(names)) == len(names) == 1600
+    assert len(operations) == 1600
+    assert operations.summary()['types'] == {'upload' : 1600}
+    with pytest.raises(ValueError):
+        operations.start('upload',names[0])
+    #end with
+
+    for name in names:
+        operations.stop(name)
+    #end for
+    assert len(operations) == 0
+    assert operations.summary()['types'] == {}
+    # stopped twice, or never started
+    assert operations.stop(names[0]) == 0
+#end test_concurrent_operations_get_unique_ids
+
+
+def test_progress_and_summary():
+    operations = bf_operations(rateWindow=10.0)
+    upload = operations.start('upload','file.bin',size=1000)
+    download = operations.start('download')
+
+    operations.progress(upload,250)
+    operations.progress(download,100)
+    operations.setSize(download,400)
+    # ignored once stopped
+    operations.stop(download)
+    operations.progress(download,100)
+
+    state = operations.get(upload)
+    assert state['bytes'] == 250
+    assert state['fraction'] == 0.25
+    assert not state['stuck']
+    assert operations.get(download) is None
+    assert [operation['id'] for operation in operations.snapshot()] == ['file.bin']
+    assert operations.snapshot('download') == []
+
+    summary = operations.summary()
+    assert summary['inFlight'] == 1
+    assert summary['types'] == {'upload' : 1}
+    assert summary['bytes'] == 350
+    assert summary['bytesPerSecond'] == 35.0
+#end test_progress_and_summary
+
+
+def test_stuck_operations():
+    operations = bf_operations(stuckAfter=60.0)
+    idle = operations.start('upload','idle')
+    active = operations.start('upload','active')
+    with operations.lock:
+        operations.operations[idle]['lastProgress'] -= 120
+        operations.operations[active]['lastProgress'] -= 120
+    #end with
+    operations.progress(active,1)
+
+    assert [operation['id'] for operation in operations.stuck()] == ['idle']
+    assert operations.get(idle)['stuck']
+    assert operations.stuck(stuckAfter=600) == []
+#end test_stuck_operations
+
+
+def test_wait_for_operations():
+    operations = bf_operations()
+    name = operations.start()
+
+    assert not operations.wait(0.05)
+    timer = threading.Timer(0.1,operations.stop,[name])
+    timer.start()
+    started = time.monotonic()
+    assert operations.wait(5)
+    assert time.monotonic() - started < 5
+    timer.join()
+#end test_wait_for_operations
+
+
+def test_transfers_tracked(server,bf,tmp_path):
+    did = server.createDataset('operations')
+    data = os.urandom(4096)
+    path = tmp_path / 'file.bin'
+    path.write_bytes(data)
+
+    bf.uploadFile(did,str(path),'file.bin')
+    with server.lock:
+        pid = next(iter(server.packages))
+        fid = server.packages[pid]['sources'][0]['content']['id']
+    #end with
+    bf.downloadFile(pid,fid,str(tmp_path / 'copy.bin'))
+
+    assert bf.waitForCurrentOperations(0)
+    assert bf.operations.summary()['bytes'] == 2 * len(data)
+#end test_transfers_tracked
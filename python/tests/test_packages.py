@@ -0,0 +1,68 @@
+"""
+tests of the package listings of bf_rest
+"""
+
+# import libraries
+import time
+
+
+def createPackages(server,did,count):
+    """
+    create packages with one small source file each
+
+    :return: list of package ids, in creation order
+    """
+    return [
+        server.createPackage(did,'file{:04d}.bin'.format(index),'Unsupported',content=b'x' * index)
+        for index
+        in range(count)
+    ]
+#end createPackages
+
+
+def test_iter_packages_pages(server,bf):
+    did = server.createDataset('pages')
+    pids = createPackages(server,did,25)
+    bf.pageSize = 10
+
+    packages = list(bf.iterPackages(did,files=True))
+
+    assert [package['content']['id'] for package in packages] == pids
+    assert [package['objects']['source'][0]['content']['size'] for package in packages] == list(range(25))
+    assert server.requests['getPackages'] == 3
+    assert bf.getPackages(did) == [{'content' : package['content']} for package in packages]
+#end test_iter_packages_pages
+
+
+def test_iter_packages_prefetches_next_page(server,bf):
+    did = server.createDataset('prefetch')
+    createPackages(server,did,25)
+    bf.pageSize = 10
+
+    packages = bf.iterPackages(did)
+    next(packages)
+    # the second page is requested while the first one is consumed, the third one only once the second is reached
+    deadline = time.monotonic() + 5
+    while server.requests['getPackages'] < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    #end while
+    assert server.requests['getPackages'] == 2
+
+    for _ in range(9):
+        next(packages)
+    #end for
+    time.sleep(0.1)
+    assert server.requests['getPackages'] == 2
+
+    next(packages)
+    packages.close()
+    assert server.requests['getPackages'] == 3
+#end test_iter_packages_prefetches_next_page
+
+
+def test_iter_packages_empty_dataset(server,bf):
+    did = server.createDataset('empty')
+
+    assert list(bf.iterPackages(did)) == []
+    assert server.requests['getPackages'] == 1
+#end test_iter_packages_empty_dataset
@@ -0,0 +1,109 @@
+"""
+tests of the central poller of the imports
+"""
+
+# import libraries
+import os
+import time
+import pytest
+from bf_poller import bf_import_poller
+
+
+def pendingPackage(server,did,name):
+    """
+    create a package that stays in processing for the whole test
+
+    :return: package id
+    """
+    pid = server.createPackage(did,name,'Unsupported',content=b'x')
+    with server.lock:
+        server.packages[pid]['readyAt'] = time.time() + 3600
+        server.packages[pid]['pendingState'] = 'PROCESSING'
+    #end with
+    return pid
+#end pendingPackage
+
+
+def test_upload_tracked_until_uploaded(server,bf,tmp_path):
+    server.processingDelay = 0.3
+    did = server.createDataset('poller')
+    path = tmp_path / 'file.bin'
+    path.write_bytes(os.urandom(2048))
+    result = bf.uploadFile(did,str(path),'file.bin')
+
+    with bf_import_poller(bf,interval=0.05) as poller:
+        futures = poller.trackUpload(did,result,timeout=10)
+        packages = [future.result(10) for future in futures]
+    #end with
+
+    assert [package['content']['state'] for package in packages] == ['UPLOADED']
+    assert [package['content']['name'] for package in packages] == ['file.bin']
+#end test_upload_tracked_until_uploaded
+
+
+def test_many_imports_checked_with_listing(server,bf):
+    did = server.createDataset('listing')
+    pids = [server.createPackage(did,'file{}.bin'.format(index),'Unsupported',content=b'x') for index in range(5)]
+
+    with bf_import_poller(bf,interval=0.05,batchThreshold=3) as poller:
+        futures = [poller.track(did,pid) for pid in pids]
+        assert [future.result(10)['content']['id'] for future in futures] == pids
+    #end with
+
+    assert server.requests.get('getPackage',0) == 0
+    assert server.requests['getPackages'] >= 1
+#end test_many_imports_checked_with_listing
+
+
+def test_failed_upload_rejected(server,bf):
+    did = server.createDataset('rejected')
+    pid = server.createPackage(did,'file.bin','Unsupported',content=b'x')
+
+    with bf_import_poller(bf,interval=0.05) as poller:
+        with pytest.raises(ValueError):
+            poller.trackUpload(did,b'{"message" : "upload failed"}')
+        #end with
+        with pytest.raises(ValueError):
+            poller.trackUpload(did,[{'package' : {'content' : {'id' : pid}}},b'upload failed'])
+        #end with
+        # nothing is tracked when the result is rejected
+        assert poller.pending == {}
+    #end with
+#end test_failed_upload_rejected
+
+
+def test_timeout_at_deadline(server,bf):
+    did = server.createDataset('timeout')
+    pid = pendingPackage(server,did,'file.bin')
+
+    # after the first round without progress, the next one is a minute away
+    with bf_import_poller(bf,interval=0.05,maxInterval=60,backoff=1000) as poller:
+        started = time.monotonic()
+        future = poller.track(did,pid,timeout=0.5)
+        assert isinstance(future.exception(10),TimeoutError)
+        assert time.monotonic() - started < 5
+        assert poller.pending == {}
+    #end with
+
+    assert server.requests['getPackage'] == 1
+#end test_timeout_at_deadline
+
+
+def test_failed_state_and_close(server,bf):
+    did = server.createDataset('failed')
+    failed = server.createPackage(did,'failed.bin','Unsupported',content=b'x')
+    with server.lock:
+        server.packages[failed]['content']['state'] = 'ERROR'
+    #end with
+    pending = pendingPackage(server,did,'pending.bin')
+
+    poller = bf_import_poller(bf,interval=0.05)
+    futures = [poller.track(did,failed),poller.track(did,pending)]
+    assert isinstance(futures[0].exception(10),IOError)
+
+    poller.close()
+    assert futures[1].cancelled()
+    with pytest.raises(RuntimeError):
+        poller.track(did,pending)
+    #end with
+#end test_failed_state_and_close
@@ -0,0 +1,91 @@
+"""
+tests of the session token handling of bf_rest
+"""
+
+# import libraries
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+import bf_cli
+from bf_mock_server import bf_mock_handler
+from bf_rest import bf_rest, bf_auth_error
+
+
+def rejectSessions(monkeypatch):
+    """
+    make the mock server reject every new session, as with wrong credentials
+    """
+    monkeypatch.setattr(
+        bf_mock_handler,
+        'initSession',
+        lambda handler: handler._reply(401,{'message' : 'invalid credentials'}))
+#end rejectSessions
+
+
+def test_expired_token_renewed_once_threaded(server,bf):
+    did = server.createDataset('renewal')
+    with server.lock:
+        server.tokens.clear()
+    #end with
+    sessions = server.requests['initSession']
+
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        datasets = list(executor.map(lambda _: bf.getDataset(did),range(20)))
+    #end with
+
+    assert server.requests['initSession'] - sessions == 1
+    assert all(dataset['content']['id'] == did for dataset in datasets)
+#end test_expired_token_renewed_once_threaded
+
+
+def test_failed_first_session_not_retried(server,monkeypatch):
+    rejectSessions(monkeypatch)
+    bf = bf_rest('key','secret',apiUrl=server.url)
+
+    with pytest.raises(Exception):
+        bf.initSession
+    #end with
+
+    assert not bf.sessionValid
+    assert bf.renewTimer is None
+    bf.close()
+#end test_failed_first_session_not_retried
+
+
+def test_failed_renewal_retried(server,bf,monkeypatch):
+    rejectSessions(monkeypatch)
+
+    with pytest.raises(Exception):
+        bf._renewSession()
+    #end with
+
+    # the current token might still be valid: try again shortly
+    assert bf.renewTimer is not None
+    assert bf.renewTimer.interval == bf.renewRetryDelay
+#end test_failed_renewal_retried
+
+
+@pytest.mark.parametrize('status,body',[
+    (401,b'<html>Unauthorized</html>'),
+    (403,{'message' : 'forbidden'}),
+    (200,{'organization' : 'N:organization:mock'}),
+])
+def test_rejected_credentials(server,monkeypatch,status,body):
+    monkeypatch.setattr(bf_mock_handler,'initSession',lambda handler: handler._reply(status,body))
+    bf = bf_rest('key','secret',apiUrl=server.url)
+
+    with pytest.raises(bf_auth_error):
+        bf.initSession
+    #end with
+    bf.close()
+
+    command = ['list','--api-key','key','--api-secret','secret','--api-url',server.url,'--quiet']
+    assert bf_cli.main(command) == bf_cli.EXIT_AUTH
+#end test_rejected_credentials
+
+
+def test_unavailable_api_not_reported_as_authentication(server,monkeypatch):
+    monkeypatch.setattr(bf_mock_handler,'initSession',lambda handler: handler._reply(404,b'not found'))
+
+    command = ['list','--api-key','key','--api-secret','secret','--api-url',server.url,'--quiet']
+    assert bf_cli.main(command) == bf_cli.EXIT_ERROR
+#end test_unavailable_api_not_reported_as_authentication
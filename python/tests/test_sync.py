@@ -0,0 +1,163 @@
+"""
+tests of the directory sync of bf_rest
+"""
+
+# import libraries
+import os
+import json
+import bf_cli
+from concurrent.futures import ThreadPoolExecutor
+from conftest import remoteContents
+
+
+def reverseListing(server):
+    """
+    list the packages of the mock server in the opposite order
+    """
+    with server.lock:
+        server.packages = dict(reversed(list(server.packages.items())))
+    #end with
+#end reverseListing
+
+
+def writeTree(root,files):
+    """
+    write the files given, by relative path, under root
+    """
+    for path, data in files.items():
+        local = os.path.join(root,*path.split('/'))
+        os.makedirs(os.path.dirname(local),exist_ok=True)
+        with open(local,'wb') as fh:
+            fh.write(data)
+        #end with
+    #end for
+#end writeTree
+
+
+def test_sync_is_idempotent(server,bf,tmp_path):
+    did = server.createDataset('sync')
+    files = {
+        'top.bin'     : os.urandom(100),
+        'a/one.bin'   : os.urandom(2000),
+        'a/b/two.bin' : os.urandom(10),
+    }
+    writeTree(str(tmp_path),files)
+
+    summary = bf.syncDirectory(did,str(tmp_path))
+    assert sorted(summary['uploaded']) == sorted(files)
+    assert summary['failed'] == {}
+    assert sorted(summary['collections']) == ['a','a/b']
+
+    # nothing changes, whatever the order the packages are listed in
+    for reverse in (False,True):
+        if reverse:
+            reverseListing(server)
+        #end if
+        previews = server.requests['uploadPreview']
+        summary = bf.syncDirectory(did,str(tmp_path),checksum=True)
+        assert summary['uploaded'] == []
+        assert summary['deleted'] == []
+        assert summary['collections'] == []
+        assert sorted(summary['skipped']) == sorted(files)
+        assert server.requests['uploadPreview'] == previews
+    #end for
+
+    assert remoteContents(server,did) == {path.rsplit('/',1)[-1] : [data] for path, data in files.items()}
+#end test_sync_is_idempotent
+
+
+def test_sync_replaces_changed_files(server,bf,tmp_path):
+    did = server.createDataset('replace')
+    writeTree(str(tmp_path),{'a/one.bin' : b'1' * 10, 'a/two.bin' : b'2' * 10})
+    bf.syncDirectory(did,str(tmp_path))
+
+    writeTree(str(tmp_path),{'a/one.bin' : b'3' * 20})
+    reverseListing(server)
+    summary = bf.syncDirectory(did,str(tmp_path),replace=True)
+
+    assert summary['uploaded'] == ['a/one.bin']
+    assert len(summary['deleted']) == 1
+    assert summary['duplicates'] == []
+    assert remoteContents(server,did) == {'one.bin' : [b'3' * 20], 'two.bin' : [b'2' * 10]}
+
+    # the new version is kept, in either listing order
+    for reverse in (False,True):
+        if reverse:
+            reverseListing(server)
+        #end if
+        summary = bf.syncDirectory(did,str(tmp_path),replace=True)
+        assert summary['uploaded'] == []
+        assert summary['deleted'] == []
+    #end for
+#end test_sync_replaces_changed_files
+
+
+def test_sync_deletes_nothing_by_default(server,bf,tmp_path):
+    did = server.createDataset('default')
+    writeTree(str(tmp_path),{'one.bin' : b'1' * 10})
+    bf.syncDirectory(did,str(tmp_path))
+    writeTree(str(tmp_path),{'one.bin' : b'2' * 20})
+
+    summary = bf.syncDirectory(did,str(tmp_path))
+
+    assert summary['uploaded'] == ['one.bin']
+    assert summary['deleted'] == []
+    assert 'deletePackages' not in server.requests
+    assert remoteContents(server,did) == {'one.bin' : [b'1' * 10, b'2' * 20]}
+#end test_sync_deletes_nothing_by_default
+
+
+def test_sync_command_replace_flag(server,tmp_path,monkeypatch):
+    did = server.createDataset('command')
+    local = tmp_path / 'local'
+    writeTree(str(local),{'one.bin' : b'1' * 10})
+    monkeypatch.setenv('HOME',str(tmp_path))
+    command = ['sync',did,str(local),'--api-key','key','--api-secret','secret','--api-url',server.url,'--quiet']
+
+    assert bf_cli.main(command) == bf_cli.EXIT_OK
+    writeTree(str(local),{'one.bin' : b'2' * 20})
+    assert bf_cli.main(command) == bf_cli.EXIT_OK
+    assert 'deletePackages' not in server.requests
+
+    writeTree(str(local),{'one.bin' : b'3' * 30})
+    assert bf_cli.main(command + ['--replace']) == bf_cli.EXIT_OK
+    assert server.requests['deletePackages'] == 1
+    assert remoteContents(server,did) == {'one.bin' : [b'3' * 30]}
+#end test_sync_command_replace_flag
+
+
+def test_sync_keeps_previous_versions(server,bf,tmp_path):
+    did = server.createDataset('keep')
+    writeTree(str(tmp_path),{'one.bin' : b'1' * 10})
+    bf.syncDirectory(did,str(tmp_path))
+    writeTree(str(tmp_path),{'one.bin' : b'2' * 20})
+    bf.syncDirectory(did,str(tmp_path),replace=False)
+
+    # the newest package wins and the other one is reported, in either listing order
+    for reverse in (False,True):
+        if reverse:
+            reverseListing(server)
+        #end if
+        summary = bf.syncDirectory(did,str(tmp_path),replace=False)
+        assert summary['uploaded'] == []
+        assert summary['duplicates'] == ['one.bin']
+    #end for
+    assert remoteContents(server,did) == {'one.bin' : [b'1' * 10, b'2' * 20]}
+#end test_sync_keeps_previous_versions
+
+
+def test_concurrent_checksum_cache_updates(bf,tmp_path):
+    bf.checksumCacheFile = str(tmp_path / 'cache' / 'checksums.json')
+    entries = [{'/data/file{}'.format(index) : [index,index,'{:064x}'.format(index)]} for index in range(32)]
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(bf._saveChecksumCache,entries))
+    #end with
+
+    # no update is lost and no temporary file is left behind
+    with open(bf.checksumCacheFile) as fh:
+        cache = json.load(fh)
+    #end with
+    assert len(cache) == 32
+    assert sorted(os.listdir(str(tmp_path / 'cache'))) == ['checksums.json','checksums.json.lock']
+#end test_concurrent_checksum_cache_updates
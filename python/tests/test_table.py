@@ -0,0 +1,117 @@
+"""
+tests of the columnar table of packages
+"""
+
+# import libraries
+from array import array
+from bf_table import bf_package_table
+
+
+def package(pid,name,packageType='Collection',parentId=None,intId=None,files=()):
+    """
+    return a package dictionary as listed by the api
+
+    :param files: list of (file id, name, size)
+    :return: dictionary
+    """
+    content = {'id' : pid, 'name' : name, 'packageType' : packageType, 'state' : 'READY'}
+    if parentId is not None:
+        content['parentId'] = parentId
+    #end if
+    if intId is not None:
+        content['intId'] = intId
+    #end if
+    result = {'content' : content}
+    if files:
+        result['objects'] = {'source' : [
+            {'content' : {'id' : fid, 'name' : fileName, 'size' : size, 'checksum' : {'checksum' : 'c' * 64}}}
+            for fid, fileName, size
+            in files
+        ]}
+    #end if
+    return result
+#end package
+
+
+def test_paths_in_any_order():
+    table = bf_package_table()
+    # children listed before their parents, linked by integer id or by package id
+    table.addPage({'packages' : [
+        package('N:package:file','file.bin','Unsupported',parentId=2,files=[(10,'file.bin',100)]),
+        package('N:collection:b','b',parentId='N:collection:a',intId=2),
+        package('N:collection:a','a',intId=1),
+    ]})
+
+    assert len(table) == 3
+    row = table.row('N:package:file')
+    assert table.path(row) == 'a/b/file.bin'
+    assert table.package(row)['parentId'] == 'N:collection:b'
+    assert table.pathRow('a/b') == table.row(2)
+    assert sorted(table.path(child) for child in table.walk()) == ['a','a/b','a/b/file.bin']
+
+    fileRow = table.fileRow('a/b/file.bin')
+    assert table.filePath(fileRow) == 'a/b/file.bin'
+    assert table.file(fileRow) == {
+        'id'        : 10,
+        'name'      : 'file.bin',
+        'size'      : 100,
+        'checksum'  : 'c' * 64,
+        'packageId' : 'N:package:file',
+    }
+#end test_paths_in_any_order
+
+
+def test_ids_in_shared_pool():
+    table = bf_package_table()
+    table.add(package('N:collection:a','a',files=[]))
+    table.add(package('N:package:x','x','Unsupported','N:collection:a',files=[(7,'x',1)]))
+    # added again, ignored
+    table.add(package('N:package:x','x','Unsupported','N:collection:a'))
+
+    assert isinstance(table.ids,array)
+    assert isinstance(table.fileIds,array)
+    assert [table.strings[index] for index in table.ids] == ['N:collection:a','N:package:x']
+    assert [table.strings[index] for index in table.fileIds] == [7]
+    assert table.package(table.row('N:package:x'))['id'] == 'N:package:x'
+#end test_ids_in_shared_pool
+
+
+def test_orphans_kept_at_root():
+    table = bf_package_table()
+    table.add(package('N:package:x','x.bin','Unsupported','N:collection:missing',files=[(1,'x.bin',1)]))
+
+    row = table.row('N:package:x')
+    assert table.parent(row) is None
+    assert table.path(row) == 'x.bin'
+    assert table.fileRow('x.bin') == 0
+#end test_orphans_kept_at_root
+
+
+def test_parent_cycle():
+    table = bf_package_table()
+    table.add(package('N:collection:a','a',parentId='N:collection:b'))
+    table.add(package('N:collection:b','b',parentId='N:collection:a'))
+    table.add(package('N:package:x','x.bin','Unsupported','N:collection:a',files=[(1,'x.bin',1)]))
+    table.add(package('N:collection:c','c'))
+
+    a = table.row('N:collection:a')
+    # partial paths, instead of failing or looping
+    assert table.path(a) == 'b/a'
+    assert table.filePath(0) == 'b/a/x.bin'
+    assert table.fileRow('b/a/x.bin') == 0
+    assert table.pathRow('b/a') == a
+    assert list(table.walk()) == [table.row('N:collection:c')]
+    assert sorted(table.path(row) for row in table.walk(a)) == ['a/b','b/a/x.bin']
+#end test_parent_cycle
+
+
+def test_package_table_of_dataset(server,bf):
+    did = server.createDataset('table')
+    cid = server.createPackage(did,'a','Collection')
+    pid = server.createPackage(did,'one.bin','Unsupported',cid,b'1' * 10)
+
+    table = bf.getPackageTable(did,files=True)
+
+    assert table.package(table.row(pid))['path'] == 'a/one.bin'
+    assert table.file(table.fileRow('a/one.bin'))['size'] == 10
+#end test_package_table_of_dataset
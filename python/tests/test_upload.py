@@ -0,0 +1,140 @@
+"""
+tests of the chunked uploads of bf_rest
+"""
+
+# import libraries
+import os
+import json
+import pytest
+from bf_mock_server import bf_mock_handler
+from conftest import remoteContents
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+#end try
+
+
+def test_upload_file(server,bf,tmp_path):
+    did = server.createDataset('upload')
+    data = os.urandom(5500)
+    path = tmp_path / 'file.bin'
+    path.write_bytes(data)
+
+    result = bf.uploadFile(did,str(path),'file.bin')
+
+    assert not isinstance(result,bytes)
+    assert server.requests['uploadChunk'] == 6
+    assert remoteContents(server,did) == {'file.bin' : [data]}
+#end test_upload_file
+
+
+def test_resume_after_failed_chunk(server,bf,tmp_path,monkeypatch):
+    did = server.createDataset('resume')
+    data = os.urandom(10 * 1024)
+    path = tmp_path / 'file.bin'
+    path.write_bytes(data)
+
+    # chunk 3 is rejected, without retries since the request is invalid
+    uploadChunk = bf_mock_handler.uploadChunk
+    def failingChunk(handler,oid,iid):
+        if int(handler.query['chunkNumber']) == 3:
+            return handler._reply(400,{'message' : 'rejected chunk'})
+        #end if
+        return uploadChunk(handler,oid,iid)
+    #end failingChunk
+    monkeypatch.setattr(bf_mock_handler,'uploadChunk',failingChunk)
+
+    assert isinstance(bf.uploadFile(did,str(path),'file.bin',resume=True),bytes)
+    pending = bf.pendingUploads()
+    assert len(pending) == 1
+    accepted = pending[0]['chunks']
+    assert 3 not in accepted
+    assert remoteContents(server,did) == {}
+
+    # the upload continues with the chunks missing only
+    monkeypatch.undo()
+    sent = server.requests['uploadChunk']
+    result = bf.uploadFile(did,str(path),'file.bin',resume=True)
+
+    assert not isinstance(result,bytes)
+    assert server.requests['uploadChunk'] - sent == 10 - len(accepted)
+    assert server.requests['uploadPreview'] == 1
+    assert bf.pendingUploads() == []
+    assert remoteContents(server,did) == {'file.bin' : [data]}
+#end test_resume_after_failed_chunk
+
+
+def test_upload_files_closes_transfers(server,bf,tmp_path):
+    did = server.createDataset('files')
+    contents = {}
+    for name in ('a.bin','b.bin','c.bin'):
+        contents[name] = os.urandom(3000)
+        (tmp_path / name).write_bytes(contents[name])
+    #end for
+
+    results = bf.uploadFiles(did,[str(tmp_path / name) for name in sorted(contents)])
+
+    assert not any(isinstance(result,bytes) for result in results)
+    assert server.requests['uploadPreview'] == 1
+    assert bf.scheduler.active() == []
+    assert remoteContents(server,did) == {name : [data] for name, data in contents.items()}
+#end test_upload_files_closes_transfers
+
+
+def test_resume_state_log(server,bf,tmp_path,monkeypatch):
+    did = server.createDataset('log')
+    path = tmp_path / 'file.bin'
+    path.write_bytes(os.urandom(6 * 1024))
+
+    # every chunk but the first one is rejected
+    uploadChunk = bf_mock_handler.uploadChunk
+    def failingChunk(handler,oid,iid):
+        if int(handler.query['chunkNumber']) != 0:
+            return handler._reply(400,{'message' : 'rejected chunk'})
+        #end if
+        return uploadChunk(handler,oid,iid)
+    #end failingChunk
+    monkeypatch.setattr(bf_mock_handler,'uploadChunk',failingChunk)
+
+    assert isinstance(bf.uploadFile(did,str(path),'file.bin',resume=True),bytes)
+
+    # the state is written once, the accepted chunks are appended to its log
+    stateFile = bf._uploadStateFile(did,str(path),'file.bin',None)
+    with open(stateFile) as fh:
+        assert json.load(fh)['chunks'] == []
+    #end with
+    logFile = bf._uploadStateFile(did,str(path),'file.bin',None,'.chunks')
+    with open(logFile,'rb') as fh:
+        assert fh.read() == b'0\n'
+    #end with
+    # a number partially written when the process stopped is ignored
+    with open(logFile,'ab') as fh:
+        fh.write(b'5')
+    #end with
+    assert [state['chunks'] for state in bf.pendingUploads()] == [[0]]
+#end test_resume_state_log
+
+
+@pytest.mark.skipif(fcntl is None,reason='no inter-process locking on this platform')
+def test_resume_locked(server,bf,tmp_path):
+    did = server.createDataset('locked')
+    data = os.urandom(3000)
+    path = tmp_path / 'file.bin'
+    path.write_bytes(data)
+
+    # another upload of the same file holds the lock
+    with bf._lockUploadState(did,str(path),'file.bin',None):
+        with pytest.raises(IOError):
+            bf.uploadFile(did,str(path),'file.bin',resume=True)
+        #end with
+    #end with
+    assert server.requests.get('uploadPreview',0) == 0
+
+    result = bf.uploadFile(did,str(path),'file.bin',resume=True)
+    assert not isinstance(result,bytes)
+    # nothing is left once the upload is over
+    assert os.listdir(bf.resumeDir) == []
+    assert remoteContents(server,did) == {'file.bin' : [data]}
+#end test_resume_locked
@@ -0,0 +1,50 @@
+"""
+tests of the signed urls resolved ahead of the downloads
+"""
+
+# import libraries
+import os
+
+
+def test_resolve_file_urls_cached(server,bf):
+    did = server.createDataset('urls')
+    pids = [server.createPackage(did,'file{}.bin'.format(index),'Unsupported',content=b'x' * index) for index in range(5)]
+    with server.lock:
+        files = [(pid,server.packages[pid]['sources'][0]['content']['id']) for pid in pids]
+    #end with
+
+    urls = bf.resolveFileUrls(files)
+    assert urls == {(pid,fid) : '{}/storage/{}/{}'.format(server.url,pid,fid) for pid, fid in files}
+    assert server.requests['getFile'] == 5
+
+    # cached, until invalidated
+    assert bf.resolveFileUrls(files) == urls
+    assert server.requests['getFile'] == 5
+    bf._invalidateFileUrl(*files[0])
+    assert bf.resolveFileUrls(files) == urls
+    assert server.requests['getFile'] == 6
+#end test_resolve_file_urls_cached
+
+
+def test_download_collection_resolves_urls_in_batches(server,bf,tmp_path,monkeypatch):
+    did = server.createDataset('batches')
+    cid = server.createPackage(did,'a','Collection')
+    for index in range(5):
+        server.createPackage(did,'file{}.bin'.format(index),'Unsupported',cid,os.urandom(100))
+    #end for
+    bf.fileUrlCacheSize = 4
+    batches = []
+    resolve = bf.resolveFileUrls
+    def resolveFileUrls(files):
+        batches.append(len(files))
+        return resolve(files)
+    #end resolveFileUrls
+    monkeypatch.setattr(bf,'resolveFileUrls',resolveFileUrls)
+
+    result = bf.downloadCollection(did,cid,str(tmp_path / 'local'))
+
+    assert len(result['downloaded']) == 5
+    assert batches == [2,2,1]
+    # each url is requested once, by the batch and not again by its download
+    assert server.requests['getFile'] == 5
+#end test_download_collection_resolves_urls_in_batches